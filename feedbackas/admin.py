@@ -19,23 +19,81 @@ class UserAdmin(BaseUserAdmin):
 admin.site.unregister(User)
 admin.site.register(User, UserAdmin)
 
+import datetime
+import json
+from django.contrib.admin.utils import prepare_lookup_value
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, SEARCH_VAR
 from django.db.models import Sum
-from .models import AIUsageLog, GlobalSettings, PageDescription
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.html import format_html
+from .models import AIExtractionCache, AIUsageDaily, AIUsageLog, GlobalSettings, PageDescription
+
+# Changelist filtrai, kuriuos galima atsakyti iš AIUsageDaily (parametras -> suvestinės laukas)
+ROLLUP_FILTERS = {
+    'company__id__exact': 'company_id',
+    'company__isnull': 'company__isnull',
+    'user__id__exact': 'user_id',
+    'user__isnull': 'user__isnull',
+    'request_type__exact': 'request_type',
+}
+ROLLUP_DATE_FILTERS = {'timestamp__gte': 'date__gte', 'timestamp__lt': 'date__lt'}
 
 @admin.register(AIUsageLog)
 class AIUsageLogAdmin(admin.ModelAdmin):
     list_display = ('user', 'company', 'request_type', 'total_cost', 'timestamp')
     list_filter = ('company', 'request_type', 'timestamp', 'user')
     search_fields = ('user__username', 'user__first_name', 'user__last_name', 'company__name')
-    readonly_fields = ('raw_response',)
+    # Atsakymas laikomas suspaustas atskiroje lentelėje (AIResponseArchive)
+    exclude = ('raw_archive',)
+    readonly_fields = ('raw_response_display',)
+
+    @admin.display(description='Raw response')
+    def raw_response_display(self, obj):
+        raw_response = obj.raw_response
+        if raw_response is None:
+            return '-'
+        return format_html('<pre style="white-space: pre-wrap;">{}</pre>', json.dumps(raw_response, ensure_ascii=False, indent=2))
+
+    def _rollup_filters(self, request):
+        """
+        AIUsageDaily filtrai, atitinkantys changelist filtrus, arba None, jei bent vienas
+        filtras (paieška, ne visos dienos laiko riba ir pan.) suvestinėje neatsakomas.
+        """
+        filters = {}
+        for param, value in request.GET.items():
+            if param in (ORDER_VAR, PAGE_VAR) or (param == SEARCH_VAR and not value):
+                continue
+            if param in ROLLUP_FILTERS:
+                filters[ROLLUP_FILTERS[param]] = prepare_lookup_value(param, value)
+            elif param in ROLLUP_DATE_FILTERS:
+                moment = parse_datetime(value)
+                if moment is None:
+                    day = parse_date(value)
+                else:
+                    moment = timezone.localtime(moment) if timezone.is_aware(moment) else moment
+                    day = moment.date() if moment.time() == datetime.time.min else None
+                if day is None:
+                    return None
+                filters[ROLLUP_DATE_FILTERS[param]] = day
+            else:
+                return None
+        return filters
 
     def changelist_view(self, request, extra_context=None):
         response = super().changelist_view(request, extra_context)
         try:
             qs = response.context_data['cl'].queryset
-            total_cost_sum = qs.aggregate(Sum('total_cost'))['total_cost__sum'] or 0.0
-            total_prompts = qs.aggregate(Sum('prompt_tokens'))['prompt_tokens__sum'] or 0
-            total_completions = qs.aggregate(Sum('completion_tokens'))['completion_tokens__sum'] or 0
+            filters = self._rollup_filters(request)
+            if filters is not None:
+                # Dienos suvestinė – be žurnalo eilučių skenavimo
+                qs = AIUsageDaily.objects.filter(**filters)
+            totals = qs.aggregate(
+                total_cost=Sum('total_cost'), prompt_tokens=Sum('prompt_tokens'), completion_tokens=Sum('completion_tokens'),
+            )
+            total_cost_sum = totals['total_cost'] or 0.0
+            total_prompts = totals['prompt_tokens'] or 0
+            total_completions = totals['completion_tokens'] or 0
         except (AttributeError, KeyError):
             total_cost_sum = 0.0
             total_prompts = 0
@@ -53,6 +111,19 @@ class AIUsageLogAdmin(admin.ModelAdmin):
             response.context_data.update(my_context)
         return response
 
+@admin.register(AIUsageDaily)
+class AIUsageDailyAdmin(admin.ModelAdmin):
+    list_display = ('date', 'company', 'user', 'request_type', 'model_name', 'calls', 'total_cost')
+    list_filter = ('date', 'request_type', 'company')
+    date_hierarchy = 'date'
+
+@admin.register(AIExtractionCache)
+class AIExtractionCacheAdmin(admin.ModelAdmin):
+    list_display = ('key', 'prompt_version', 'model_name', 'hits', 'created_at', 'last_hit_at')
+    list_filter = ('prompt_version', 'model_name')
+    search_fields = ('key',)
+    readonly_fields = ('result',)
+
 @admin.register(GlobalSettings)
 class GlobalSettingsAdmin(admin.ModelAdmin):
     list_display = ('personal_form_enabled', 'team_form_enabled', 'language_switcher_enabled')
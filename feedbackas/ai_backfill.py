@@ -0,0 +1,194 @@
+"""
+Lygiagretus, pratęsiamas AI atsiliepimų analizės (stiprybės/tobulintinos sritys)
+perskaičiavimas visai duomenų bazei: manage.py ai_backfill
+
+* Atsiliepimų id skaitomi srautu (iterator()) didėjimo tvarka ir dalijami partijomis;
+  kiekviena partija – vienas sugrupuotas promptas (extract_feedback_features_batch).
+* Partijos vykdomos ribotame gijų telkinyje; vienu metu eilėje ne daugiau kaip 2 × workers.
+* Visos LLM užklausos laukia žetono iš bendro Redis kibiro (feedbackas.rate_limit),
+  kurį nurašo ir gyvas srautas, todėl backfill jam kvotą užleidžia.
+* Progresas (AIBackfillCheckpoint) – didžiausias id, iki kurio visos ankstesnės partijos
+  baigtos, ir nepavykusių atsiliepimų id (failed_ids); nutrūkus darbui kitas paleidimas
+  pirmiausia pakartoja nepavykusius, o tada tęsia nuo kontrolinio taško.
+* Atidarius grandinės pertraukiklį (tiekėjas nepasiekiamas) darbas nutraukiamas, o ne
+  „apdorojamas“ milisekundėmis krentančiomis partijomis iki paskutinio id.
+"""
+import logging
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ThreadPoolExecutor, wait
+from itertools import chain, islice
+
+from django.db import connection
+from django.utils import timezone
+
+from .ai_service import EXTRACTION_BATCH_SIZE, EXTRACTION_PROMPT_VERSION
+from .models import AIBackfillCheckpoint, Feedback
+from .openrouter_client import CircuitOpenError
+from .rate_limit import wait_for_tokens
+from .services import extract_feedback_features_batch
+from .usage_log import flush_usage_logs
+
+logger = logging.getLogger(__name__)
+
+
+def default_checkpoint_name(reextract=False):
+    """Progresas atskiras kiekvienai prompto versijai (naujai versijai – nuo pradžių)."""
+    return f"traits-v{EXTRACTION_PROMPT_VERSION}" + ('-all' if reextract else '')
+
+
+def backfill_queryset(reextract=False):
+    """Atsiliepimai be AI analizės arba (reextract) visi."""
+    queryset = Feedback.objects.all()
+    if not reextract:
+        queryset = queryset.filter(extracted_strengths=[], extracted_improvements=[])
+    return queryset
+
+
+def _batches(ids, size):
+    ids = iter(ids)
+    while batch := list(islice(ids, size)):
+        yield batch
+
+
+def _process_batch(feedback_ids, batch_size):
+    """Vykdoma gijoje: grąžina sėkmingai atnaujintų atsiliepimų id."""
+    try:
+        feedbacks = Feedback.objects.filter(id__in=feedback_ids).select_related(
+            'feedback_request__requester__profile__company_link'
+        ).order_by('id')
+        with wait_for_tokens():
+            return extract_feedback_features_batch(feedbacks, batch_size=batch_size)
+    finally:
+        # Kiekviena gija turi savo DB jungtį – nepaliekame jų atvirų
+        connection.close()
+
+
+class BackfillProgress:
+    """Apdorotų atsiliepimų skaičius, pralaidumas ir likęs laikas."""
+
+    def __init__(self, total, clock=time.monotonic):
+        self.total = total
+        self.processed = 0
+        self.updated = 0
+        self._clock = clock
+        self._started = clock()
+
+    def add(self, processed, updated):
+        self.processed += processed
+        self.updated += updated
+
+    @property
+    def failed(self):
+        return self.processed - self.updated
+
+    @property
+    def throughput(self):
+        """Atsiliepimų per sekundę."""
+        elapsed = self._clock() - self._started
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self):
+        throughput = self.throughput
+        if not throughput:
+            return None
+        return max(self.total - self.processed, 0) / throughput
+
+    def __str__(self):
+        eta = self.eta_seconds
+        eta_text = time.strftime('%H:%M:%S', time.gmtime(eta)) if eta is not None else '—'
+        return (
+            f"{self.processed}/{self.total} apdorota ({self.failed} nepavyko), "
+            f"{self.throughput * 60:.1f} / min, liko ~{eta_text}"
+        )
+
+
+def run_ai_backfill(name=None, reextract=False, workers=4, batch_size=None, restart=False,
+                    report=None, report_every=30.0):
+    """
+    Paleidžia (arba pratęsia) backfill. report(progress) kviečiamas kas report_every
+    sekundžių ir pabaigoje. Grąžina BackfillProgress. Atsidarius grandinės pertraukikliui
+    išsaugo progresą ir iškelia CircuitOpenError (kitas paleidimas tęs nuo ten).
+    """
+    name = name or default_checkpoint_name(reextract)
+    batch_size = batch_size or EXTRACTION_BATCH_SIZE
+    checkpoint, _ = AIBackfillCheckpoint.objects.get_or_create(name=name)
+    if restart:
+        checkpoint.last_id = checkpoint.processed = checkpoint.failed = 0
+        checkpoint.failed_ids = []
+    if restart or checkpoint.finished_at is not None:
+        # Baigtas paleidimas pratęsiamas tik naujais (didesnio id) ir anksčiau nepavykusiais atsiliepimais
+        checkpoint.started_at = timezone.now()
+        checkpoint.finished_at = None
+        checkpoint.save()
+
+    # Pirmiausia – anksčiau nepavykę (jei vis dar reikia analizės), tada nuo kontrolinio taško
+    retry_ids = list(
+        backfill_queryset(reextract).filter(id__in=checkpoint.failed_ids).order_by('id').values_list('id', flat=True)
+    )
+    queryset = backfill_queryset(reextract).filter(id__gt=checkpoint.last_id).exclude(id__in=retry_ids)
+    progress = BackfillProgress(len(retry_ids) + queryset.count())
+    ids = chain(retry_ids, queryset.order_by('id').values_list('id', flat=True).iterator(chunk_size=2000))
+
+    failed_ids = set()
+    in_flight = {}
+    submitted = deque()  # (future, paskutinis partijos id) pateikimo tvarka
+    last_report = time.monotonic()
+    circuit_error = None
+
+    def collect(done):
+        nonlocal last_report, circuit_error
+        for future in done:
+            batch = in_flight.pop(future)
+            try:
+                updated_ids = set(future.result())
+            except (CancelledError, CircuitOpenError) as e:
+                # Neapdorota – bus pakartota kitame paleidime
+                if isinstance(e, CircuitOpenError):
+                    circuit_error = circuit_error or e
+                failed_ids.update(batch)
+                continue
+            except Exception as e:
+                logger.error(f"AI backfill batch {batch[0]}..{batch[-1]} failed: {e}")
+                updated_ids = set()
+            failed = [feedback_id for feedback_id in batch if feedback_id not in updated_ids]
+            failed_ids.update(failed)
+            progress.add(len(batch), len(batch) - len(failed))
+            checkpoint.processed += len(batch)
+            checkpoint.failed += len(failed)
+        # Kontrolinis taškas juda tik per ištisai baigtų partijų seką; nepavykę id saugomi atskirai
+        while submitted and submitted[0][0].done():
+            checkpoint.last_id = max(checkpoint.last_id, submitted.popleft()[1])
+        checkpoint.failed_ids = sorted(failed_ids)
+        checkpoint.save(update_fields=['last_id', 'processed', 'failed', 'failed_ids', 'updated_at'])
+        if report and time.monotonic() - last_report >= report_every:
+            report(progress)
+            last_report = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch in _batches(ids, batch_size):
+            if len(in_flight) >= workers * 2:
+                collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+            if circuit_error is not None:
+                break
+            future = pool.submit(_process_batch, batch, batch_size)
+            in_flight[future] = batch
+            submitted.append((future, batch[-1]))
+        if circuit_error is not None:
+            # Dar nepradėtos partijos atšaukiamos (jų id patenka į failed_ids)
+            for future in in_flight:
+                future.cancel()
+        while in_flight:
+            collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+
+    flush_usage_logs()
+    if circuit_error is not None:
+        if report:
+            report(progress)
+        raise circuit_error
+    checkpoint.finished_at = timezone.now()
+    checkpoint.save(update_fields=['finished_at', 'updated_at'])
+    if report:
+        report(progress)
+    return progress
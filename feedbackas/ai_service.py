@@ -1,15 +1,186 @@
-import requests
 import json
+import logging
+import requests
 from django.conf import settings
 from decimal import Decimal
-from feedbackas.models import AIUsageLog
+from feedbackas.extraction_cache import extraction_cache_key, get_cached_extraction, store_extraction
+from feedbackas.openrouter_client import post_chat_completion, stream_chat_completion
+from feedbackas.prompt_builder import build_prompt, compact_template, estimate_tokens
+from feedbackas.usage_log import record_usage
+
+logger = logging.getLogger(__name__)
+
+# Žymė, kuria prompte pakeičiamas kolegos vardas (privatumui)
+NAME_PLACEHOLDER = "[VARDAS]"
+# Padidinti, kai keičiasi extract_strengths_weaknesses promptas – seni kešo įrašai nebegalios
+EXTRACTION_PROMPT_VERSION = 1
+# Kiek atsiliepimų siunčiama viename sugrupuotame prompte
+EXTRACTION_BATCH_SIZE = getattr(settings, 'AI_EXTRACTION_BATCH_SIZE', 10)
+EXTRACTION_BATCH_TOKENS_PER_ITEM = 256
+COST_QUANT = Decimal('0.0000000001')
+
+# Grįžtamojo ryšio generavimo šablonas – sunormintas vieną kartą (feedbackas.prompt_builder)
+GENERATION_TEMPLATE = compact_template("""
+Veik kaip konkretus, kolegiškas komandos narys, būk empatiškas ir teik konstruktyvią kritiką.
+Eik iš kato prie esmės, nereikia jokių įžangų ir atsisveikinimų.
+Tavo užduotis - sugeneruoti kokybišką, duomenimis pagrįstą grįžtamąjį ryšį kolegai, kurį tekste vadink tik žyme {placeholder}.
+**SVARBU dėl vardo:**
+Visada naudok tik žymę {placeholder} vietoj vardo. Niekada nenaudok tikrojo vardo (jei jį žinai).
+Nekeisk ir nelinksniuok šios žymės – naudok ją tiksliai tokią, kokia ji yra.
+Tekstas turi būti parašytas {language}, be jokių gramatinių klaidų, ir turi būti lengvai skaitomas bei suprantamas.
+
+**SVARBU: Vertinimo sistema (Kontekstas):**
+Mes nenaudojame standartinių balų. Mes naudojame augimo skalę (1-4):
+- **1 = 🌱 Mokosi (Mokosi / Reikia pagalbos):** Tai nėra "blogai", tai reiškia, kad čia reikia skirti dėmesio, mokytis ir tobulėti.
+- **2 = 🏃 Daro (Daro / Atitinka lūkesčius):** Tai solidus pagrindas, kolega susitvarko.
+- **3 = 🚀 Varo (Varo / Viršija lūkesčius):** Kolega rodo iniciatyvą ir tempia komandą.
+- **4 = ⭐️ Pavyzdys kitiems:** Tai superžvaigždės lygis, kiti turi mokytis iš jo.
+
+**JOKIO FORMATAVIMO (NO MARKDOWN):**
+- Griežtai **NENAUDOK** jokių žvaigždučių (`**` ar `*`), paryškinimų, punktų (bullet points) ar antraščių.
+- **NERAŠYK** etikečių kaip "Situacija:", "Elgesys:", "Poveikis:", "Lygis:".
+- Tekstas turi būti paprastas, suskirstytas tik į pastraipas (paragraphs), glaustas, konkretus. Tai turi atrodyti kaip paprastas el. laiškas ar žinutė nuo kolegos.
+- Maksimalus ilgis 160-180 žodžių.
+
+Naudok Situation-Behavior-Impact logiką, bet integruok ją į sakinius natūraliai.
+
+**Duomenys:**
+- **Kompetencijų lygiai (1-4):**
+- Bendras: {rating}
+- Komandinis Darbas: {teamwork}
+- Komunikacija: {communication}
+- Iniciatyvumas: {initiative}
+- Techninės Žinios: {technical_skills}
+- Problemų Sprendimas: {problem_solving}
+
+- **Raktiniai žodžiai:** {keywords}
+- **Komentarai:** {comments}
+- **Papildomas kontekstas:** {existing_feedback}
+
+**Generavimo Instrukcija:**
+Parašyk rišlų atsiliepimą {language}, kuriame kreipkis į {placeholder}:
+
+1. **Stiprybės (Lygiai 3-4 "Varo" ir "Pavyzdys"):**
+Jei yra sričių su įvertinimais 3 arba 4, paminėk jas kaip pavyzdines. Naudok tokias frazes kaip "Šioje srityje esi pavyzdys kitiems", "Čia tu tikrai varai į priekį". Konkrečiai įvardink, kokį teigiamą poveikį (Impact) tai daro.
+
+2. **Stabilumas (Lygis 2 "Daro"):**
+Jei sritis įvertinta 2, paminėk tai kaip stabilią, patikimą veiklą, kuri atitinka lūkesčius.
+
+3. **Augimo zonos (Lygis 1 "Mokosi"):**
+Jei yra sričių su įvertinimu 1 (arba 1.x), tai yra vieta SBI konstruktyvumui.
+NEKRITIKUOK asmenybės. Formuluok tai kaip galimybę mokytis: "Matau galimybę augti...", "Čia dar galime pasitempti...".
+Būtinai paaiškink Situaciją ir Elgesį, kuris lėmė tokį vertinimą, ir pasiūlyk, kaip pasiekti "Daro" lygį.
+
+4. **Komentarų integracija:**
+Natūraliai įpink pateiktus komentarus ir raktinius žodžius į tekstą, kad jie neskambėtų kaip atskiras sąrašas.
+
+Tekstas turi būti motyvuojantis, profesionalus ir aiškus. Nenaudok Markdown formatavimo.
+""")
+GENERATION_RATING_KEYS = ('rating', 'teamwork', 'communication', 'initiative', 'technical_skills', 'problem_solving')
+# Vartotojo įvesties sekcijų žetonų biudžetai
+GENERATION_SECTION_BUDGETS = {
+    'keywords': 80,
+    'comments': 600,
+    'existing_feedback': 400,
+    **getattr(settings, 'AI_PROMPT_SECTION_BUDGETS', {}),
+}
+
+
+def split_by_weights(total, weights):
+    """
+    Padalija sumą (int arba Decimal) proporcingai svoriams.
+    Dalys skaičiuojamos iš kaupiamųjų sumų, todėl jų suma visada lygi total.
+    """
+    weight_sum = sum(weights)
+    shares, allocated, cumulative = [], 0, 0
+    for index, weight in enumerate(weights):
+        cumulative += weight
+        if index == len(weights) - 1:
+            upto = total
+        elif isinstance(total, Decimal):
+            upto = (total * cumulative / weight_sum).quantize(COST_QUANT)
+        else:
+            upto = total * cumulative // weight_sum
+        shares.append(upto - allocated)
+        allocated = upto
+    return shares
+
+
+class PlaceholderReplacer:
+    """
+    Pakeičia žymę tekste, kuris ateina fragmentais: žymės pradžią primenanti
+    fragmento pabaiga sulaikoma, kol paaiškėja, ar tai tikrai žymė.
+    """
+
+    def __init__(self, placeholder, replacement):
+        self.placeholder = placeholder
+        self.replacement = replacement
+        self._buffer = ''
+
+    def feed(self, text):
+        """Grąžina tekstą, kurį jau galima rodyti."""
+        buffer = (self._buffer + text).replace(self.placeholder, self.replacement)
+        keep = 0
+        for length in range(min(len(self.placeholder) - 1, len(buffer)), 0, -1):
+            if buffer.endswith(self.placeholder[:length]):
+                keep = length
+                break
+        self._buffer = buffer[len(buffer) - keep:] if keep else ''
+        return buffer[:len(buffer) - keep]
+
+    def flush(self):
+        """Likęs sulaikytas tekstas srauto pabaigoje."""
+        text, self._buffer = self._buffer, ''
+        return text
+
+
+def _clean_traits(data):
+    """Patikrina vieno elemento struktūrą; grąžina {'strengths', 'improvements'} arba None."""
+    # Abu raktai privalomi – kitaip tuščias objektas būtų užkešuotas kaip „be savybių“
+    if 'strengths' not in data or 'improvements' not in data:
+        return None
+    strengths = data['strengths']
+    improvements = data['improvements']
+    if not isinstance(strengths, list) or not isinstance(improvements, list):
+        return None
+    return {
+        'strengths': [str(item) for item in strengths],
+        'improvements': [str(item) for item in improvements],
+    }
+
+
+def parse_batch_traits(text, expected_ids):
+    """
+    Ištraukia {id: rezultatas} iš sugrupuoto atsakymo. Kiekvienas JSON objektas su "id"
+    nagrinėjamas atskirai, todėl apkarpytas masyvas, Markdown blokai ar apvalkalas
+    ({"items": [...]}) nesugadina kitų elementų. Nežinomi ar blogos struktūros elementai praleidžiami.
+    """
+    decoder = json.JSONDecoder()
+    expected_ids = set(expected_ids)
+    parsed = {}
+    position = text.find('{') if text else -1
+    while position != -1:
+        try:
+            data, end = decoder.raw_decode(text, position)
+        except ValueError:
+            position = text.find('{', position + 1)
+            continue
+        item_id = str(data.get('id')) if isinstance(data, dict) and 'id' in data else None
+        if item_id is None:
+            # Ne elementas (pvz. apvalkalas) – ieškome jo viduje
+            position = text.find('{', position + 1)
+            continue
+        traits = _clean_traits(data)
+        if item_id in expected_ids and item_id not in parsed and traits is not None:
+            parsed[item_id] = traits
+        position = text.find('{', end)
+    return parsed
+
 
 class OpenRouterService:
     @staticmethod
-    def _call_openrouter(prompt, user=None, company=None, request_type='general'):
-        """
-        Siunčia užklausą į OpenRouter API ir grąžina atsakymą bei rinka išlaidas.
-        """
+    def _chat_request(prompt, max_tokens=1024):
+        """OpenRouter užklausos (antraštės, turinys, modelis) vienam promptui."""
         api_key = settings.OPENROUTER_API_KEY
         model = getattr(settings, 'OPENROUTER_MODEL', 'google/gemma-3-27b-it:free')
 
@@ -24,122 +195,167 @@ class OpenRouterService:
                 {'role': 'user', 'content': prompt}
             ],
             'temperature': 0.7,
-            'max_tokens': 1024,
+            'max_tokens': max_tokens,
         }
+        return headers, payload, model
 
-        response = requests.post(
-            'https://openrouter.ai/api/v1/chat/completions',
-            headers=headers,
-            json=payload,
-            timeout=60
-        )
-        response.raise_for_status()
+    @staticmethod
+    def _request(prompt, max_tokens=1024):
+        """
+        Siunčia užklausą į OpenRouter API. Grąžina (atsakymo JSON, CallMetrics, modelis).
+        """
+        headers, payload, model = OpenRouterService._chat_request(prompt, max_tokens)
+        # Bendra keep-alive sesija su pakartojimais ir grandinės pertraukikliu
+        data, metrics = post_chat_completion(headers, payload)
+        return data, metrics, model
 
-        data = response.json()
-        
-        # Sukuriame loginį įrašą
+    @staticmethod
+    def _usage(data):
+        """(prompt žetonai, completion žetonai, kaina) iš OpenRouter atsakymo."""
+        usage = data.get('usage', {})
+        # OpenRouter dažniausiai grąžina 'cost', bet kai kurie modeliai/atsakymai gali turėti 'total_cost'
+        total_cost = usage.get('cost') or usage.get('total_cost', 0.0)
+        return usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0), Decimal(str(total_cost))
+
+    @staticmethod
+    def _call_openrouter(prompt, user=None, company=None, request_type='general'):
+        """
+        Siunčia užklausą į OpenRouter API ir grąžina atsakymą bei rinka išlaidas.
+        """
+        data, metrics, model = OpenRouterService._request(prompt)
+
+        # Loginis įrašas – per buferį (feedbackas.usage_log)
         if user or company:
-            usage = data.get('usage', {})
-            prompt_tokens = usage.get('prompt_tokens', 0)
-            completion_tokens = usage.get('completion_tokens', 0)
-            # OpenRouter dažniausiai grąžina 'cost', bet kai kurie modeliai/atsakymai gali turėti 'total_cost'
-            total_cost = usage.get('cost') or usage.get('total_cost', 0.0)
-            
-            AIUsageLog.objects.create(
+            prompt_tokens, completion_tokens, total_cost = OpenRouterService._usage(data)
+            record_usage(
                 user=user,
                 company=company,
                 request_type=request_type,
                 model_name=model,
                 prompt_tokens=prompt_tokens,
+                estimated_prompt_tokens=estimate_tokens(prompt),
                 completion_tokens=completion_tokens,
-                total_cost=Decimal(str(total_cost)),
+                total_cost=total_cost,
+                latency_ms=metrics.latency_ms,
+                attempts=metrics.attempts,
                 raw_response=data
             )
             
         return data['choices'][0]['message']['content']
 
     @staticmethod
-    def generate(ratings, keywords, comments, existing_feedback, colleague_name, user=None, company=None, language='lt'):
+    def _generation_prompt(ratings, keywords, comments, existing_feedback, colleague_name, language='lt'):
         """
-        Generuoja grįžtamąjį ryšį naudojant OpenRouter API.
-        Prieš siunčiant, tikrasis vardas pakeičiamas žyme privatumui užtikrinti.
+        Grįžtamojo ryšio generavimo promptas (GENERATION_TEMPLATE).
+        Prieš siunčiant, tikrasis vardas pakeičiamas žyme privatumui užtikrinti,
+        o vartotojo įvestis apribojama GENERATION_SECTION_BUDGETS žetonais.
         """
-        placeholder = "[VARDAS]"
+        placeholder = NAME_PLACEHOLDER
         safe_comments = comments.replace(colleague_name, placeholder) if comments else comments
         safe_existing_feedback = existing_feedback.replace(colleague_name, placeholder) if existing_feedback else existing_feedback
-        
-        target_lang_str = "lietuvių kalba" if language == 'lt' else "anglų kalba (English)"
 
-        prompt = f"""
-        Veik kaip konkretus, kolegiškas komandos narys, būk empatiškas ir teik konstruktyvią kritiką.
-        Eik iš kato prie esmės, nereikia jokių įžangų ir atsisveikinimų.
-        Tavo užduotis - sugeneruoti kokybišką, duomenimis pagrįstą grįžtamąjį ryšį kolegai, kurį tekste vadink tik žyme {placeholder}.
-        **SVARBU dėl vardo:**
-        Visada naudok tik žymę {placeholder} vietoj vardo. Niekada nenaudok tikrojo vardo (jei jį žinai). 
-        Nekeisk ir nelinksniuok šios žymės – naudok ją tiksliai tokią, kokia ji yra.
-        Tekstas turi būti parašytas {target_lang_str}, be jokių gramatinių klaidų, ir turi būti lengvai skaitomas bei suprantamas.
-
-        **SVARBU: Vertinimo sistema (Kontekstas):**
-        Mes nenaudojame standartinių balų. Mes naudojame augimo skalę (1-4):
-        - **1 = 🌱 Mokosi (Mokosi / Reikia pagalbos):** Tai nėra "blogai", tai reiškia, kad čia reikia skirti dėmesio, mokytis ir tobulėti.
-        - **2 = 🏃 Daro (Daro / Atitinka lūkesčius):** Tai solidus pagrindas, kolega susitvarko.
-        - **3 = 🚀 Varo (Varo / Viršija lūkesčius):** Kolega rodo iniciatyvą ir tempia komandą.
-        - **4 = ⭐️ Pavyzdys kitiems (Pavyzdys kitiems):** Tai superžvaigždės lygis, kiti turi mokytis iš jo.
-        
-        **JOKIO FORMATAVIMO (NO MARKDOWN):**    
-        - Griežtai **NENAUDOK** jokių žvaigždučių (`**` ar `*`), paryškinimų, punktų (bullet points) ar antraščių.    
-        - **NERAŠYK** etikečių kaip "Situacija:", "Elgesys:", "Poveikis:", "Lygis:".    
-        - Tekstas turi būti paprastas, suskirstytas tik į pastraipas (paragraphs), glaustas, konkretus. Tai turi atrodyti kaip paprastas el. laiškas ar žinutė nuo kolegos.
-        - Maksimalus ilgis 160-180 žodžių.
+        return build_prompt(
+            GENERATION_TEMPLATE,
+            GENERATION_SECTION_BUDGETS,
+            placeholder=placeholder,
+            language="lietuvių kalba" if language == 'lt' else "anglų kalba (English)",
+            keywords=keywords,
+            comments=safe_comments,
+            existing_feedback=safe_existing_feedback,
+            **{key: ratings.get(key) for key in GENERATION_RATING_KEYS},
+        )
 
-        Naudok Situation-Behavior-Impact logiką, bet integruok ją į sakinius natūraliai.
-        
-        **Duomenys:**
-        - **Kompetencijų lygiai (1-4):**
-        - Bendras: {ratings.get('rating')}
-        - Komandinis Darbas: {ratings.get('teamwork')}
-        - Komunikacija: {ratings.get('communication')}
-        - Iniciatyvumas: {ratings.get('initiative')}
-        - Techninės Žinios: {ratings.get('technical_skills')}
-        - Problemų Sprendimas: {ratings.get('problem_solving')}
-        
-        - **Raktiniai žodžiai:** {keywords}
-        - **Komentarai:** {safe_comments}
-        - **Papildomas kontekstas:** {safe_existing_feedback}
-        
-        **Generavimo Instrukcija:**
-        Parašyk rišlų atsiliepimą {target_lang_str}, kuriame kreipkis į {placeholder}:
-        
-        1. **Stiprybės (Lygiai 3-4 "Varo" ir "Pavyzdys"):**
-        Jei yra sričių su įvertinimais 3 arba 4, paminėk jas kaip pavyzdines. Naudok tokias frazes kaip "Šioje srityje esi pavyzdys kitiems", "Čia tu tikrai varai į priekį". Konkrečiai įvardink, kokį teigiamą poveikį (Impact) tai daro.
-        
-        2. **Stabilumas (Lygis 2 "Daro"):**
-        Jei sritis įvertinta 2, paminėk tai kaip stabilią, patikimą veiklą, kuri atitinka lūkesčius.
-        
-        3. **Augimo zonos (Lygis 1 "Mokosi"):**
-        Jei yra sričių su įvertinimu 1 (arba 1.x), tai yra vieta SBI konstruktyvumui.
-        NEKRITIKUOK asmenybės. Formuluok tai kaip galimybę mokytis: "Matau galimybę augti...", "Čia dar galime pasitempti...".
-        Būtinai paaiškink Situaciją ir Elgesį, kuris lėmė tokį vertinimą, ir pasiūlyk, kaip pasiekti "Daro" lygį.
-        
-        4. **Komentarų integracija:**
-        Natūraliai įpink pateiktus komentarus ir raktinius žodžius į tekstą, kad jie neskambėtų kaip atskiras sąrašas.
-        
-        Tekstas turi būti motyvuojantis, profesionalus ir aiškus. Nenaudok Markdown formatavimo.
+    @staticmethod
+    def generate(ratings, keywords, comments, existing_feedback, colleague_name, user=None, company=None, language='lt'):
         """
-
+        Generuoja grįžtamąjį ryšį naudojant OpenRouter API.
+        Prieš siunčiant, tikrasis vardas pakeičiamas žyme privatumui užtikrinti.
+        """
+        prompt = OpenRouterService._generation_prompt(
+            ratings, keywords, comments, existing_feedback, colleague_name, language
+        )
         response_text = OpenRouterService._call_openrouter(
             prompt, user=user, company=company, request_type='feedback_generation'
         )
-        return response_text.replace(placeholder, colleague_name) if response_text else response_text
+        return response_text.replace(NAME_PLACEHOLDER, colleague_name) if response_text else response_text
+
+    @staticmethod
+    def generate_stream(ratings, keywords, comments, existing_feedback, colleague_name, user=None, company=None, language='lt'):
+        """
+        Kaip generate, bet srautu: generatorius grąžina teksto fragmentus, kai tik jie
+        atkeliauja iš OpenRouter; žymė [VARDAS] pakeičiama vardu fragmentų sandūrose taip pat.
+        AIUsageLog įvykis užregistruojamas srautui pasibaigus – taip pat ir nutrūkus
+        (klientas atsijungė ar tiekėjo klaida): tada įrašoma tai, kas spėjo atkeliauti.
+        """
+        prompt = OpenRouterService._generation_prompt(
+            ratings, keywords, comments, existing_feedback, colleague_name, language
+        )
+        headers, payload, model = OpenRouterService._chat_request(prompt)
+        stream = stream_chat_completion(headers, payload)
+        chunks = iter(stream)
+        replacer = PlaceholderReplacer(NAME_PLACEHOLDER, colleague_name)
+        try:
+            for chunk in chunks:
+                text = replacer.feed(chunk)
+                if text:
+                    yield text
+            tail = replacer.flush()
+            if tail:
+                yield tail
+        finally:
+            # Uždaro HTTP atsakymą ir užpildo stream.metrics dar prieš registruojant
+            chunks.close()
+            OpenRouterService._record_stream_usage(stream, prompt, model, user, company)
+
+    @staticmethod
+    def _record_stream_usage(stream, prompt, model, user, company):
+        if stream.usage is None:
+            logger.warning(
+                f"OpenRouter stream {'finished' if stream.completed else 'interrupted'} "
+                f"without usage data (response {stream.response_id})"
+            )
+        if not (user or company):
+            return
+        data = {
+            'id': stream.response_id,
+            'model': stream.model,
+            'usage': stream.usage or {},
+            'choices': [{'message': {'role': 'assistant', 'content': stream.text}}],
+            'streamed': True,
+            'completed': stream.completed,
+            'first_chunk_ms': stream.first_chunk_ms,
+        }
+        prompt_tokens, completion_tokens, total_cost = OpenRouterService._usage(data)
+        record_usage(
+            user=user,
+            company=company,
+            request_type='feedback_generation',
+            model_name=model,
+            prompt_tokens=prompt_tokens,
+            estimated_prompt_tokens=estimate_tokens(prompt),
+            completion_tokens=completion_tokens,
+            total_cost=total_cost,
+            latency_ms=stream.metrics.latency_ms if stream.metrics else None,
+            attempts=stream.attempts,
+            raw_response=data
+        )
 
     @staticmethod
-    def extract_strengths_weaknesses(feedback_text, comments_text, user=None, company=None):
+    def extract_strengths_weaknesses(feedback_text, comments_text, user=None, company=None, raise_errors=False):
         """
         Iš tekstinio atsiliepimo išveda stiprybes ir tobulintinas sritis JSON formatu.
+        Tos pačios įvesties rezultatas imamas iš kešo (feedbackas.extraction_cache).
+        Klaidos atveju grąžinami tušti sąrašai, o su raise_errors=True – iškeliama išimtis.
         """
         if not feedback_text and not comments_text:
             return {"strengths": [], "improvements": []}
 
+        model = getattr(settings, 'OPENROUTER_MODEL', 'google/gemma-3-27b-it:free')
+        cache_key = extraction_cache_key(feedback_text, comments_text, EXTRACTION_PROMPT_VERSION, model)
+        cached = get_cached_extraction(cache_key)
+        if cached is not None:
+            return cached
+
         prompt = f"""
         Išanalizuok žemiau pateiktą darbuotojo atsiliepimą ir išskirk dvi kategorijas:
         1. Stiprybės (gerosios savybės, ką darbuotojas daro gerai)
@@ -166,16 +382,155 @@ class OpenRouterService:
                 prompt, user=user, company=company, request_type='feedback_analysis'
             )
         except Exception as e:
-            print(f"Failed to extract traits: {e}")
+            if raise_errors:
+                raise
+            logger.warning(f"Failed to extract traits: {e}")
             return {"strengths": [], "improvements": []}
 
         try:
             cleaned_text = response_text.replace('```json', '').replace('```', '').strip()
             data = json.loads(cleaned_text)
-            return {
+            result = {
                 "strengths": data.get("strengths", []),
                 "improvements": data.get("improvements", [])
             }
         except Exception as e:
-            print(f"Failed to parse extracted traits: {e}")
+            if raise_errors:
+                raise
+            logger.warning(f"Failed to parse extracted traits: {e}")
             return {"strengths": [], "improvements": []}
+
+        # Kešuojami tik sėkmingi atsakymai – klaidos atveju kitas bandymas vėl kreipsis į LLM
+        store_extraction(cache_key, result, EXTRACTION_PROMPT_VERSION, model)
+        return result
+
+    @staticmethod
+    def extract_strengths_weaknesses_batch(items, batch_size=None):
+        """
+        Masiniams darbams: išveda stiprybes ir tobulintinas sritis daugeliui atsiliepimų,
+        supakuodama po batch_size atsiliepimų į vieną promptą su id ir JSON masyvu atsakyme.
+        items – [(id, feedback_text, comments_text, user, company)].
+        Grąžina {id: {"strengths": [...], "improvements": [...]}}.
+
+        Kešuoti ir pasikartojantys tekstai LLM nesiunčiami; elementai, kurių atsakymo nepavyko
+        išnagrinėti, kartojami po vieną (extract_strengths_weaknesses), o jei ir tai
+        nepavyksta – į rezultatą nepatenka (kad nebūtų perrašyti tuščiais). Tiekėjo ir tinklo
+        klaidos (requests išimtys) po vieną nekartojamos, o iškeliamos. Užklausos kaina ir
+        žetonai AIUsageLog padalijami elementams proporcingai jų teksto ilgiui.
+        """
+        batch_size = batch_size or EXTRACTION_BATCH_SIZE
+        model = getattr(settings, 'OPENROUTER_MODEL', 'google/gemma-3-27b-it:free')
+        results = {}
+        groups = {}  # kešo raktas -> [elementai] (vienodi tekstai siunčiami vieną kartą)
+        for item in items:
+            item_id, feedback_text, comments_text = item[:3]
+            if not feedback_text and not comments_text:
+                results[item_id] = {"strengths": [], "improvements": []}
+                continue
+            cache_key = extraction_cache_key(feedback_text, comments_text, EXTRACTION_PROMPT_VERSION, model)
+            if cache_key not in groups:
+                cached = get_cached_extraction(cache_key)
+                if cached is not None:
+                    results[item_id] = cached
+                    continue
+                groups[cache_key] = []
+            groups[cache_key].append(item)
+
+        pending = list(groups.items())
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            parsed = OpenRouterService._extract_batch([group[0] for _, group in chunk], model)
+            for index, (cache_key, group) in enumerate(chunk):
+                traits = parsed.get(str(index + 1))
+                if traits is None:
+                    _, feedback_text, comments_text, user, company = group[0]
+                    try:
+                        traits = OpenRouterService.extract_strengths_weaknesses(
+                            feedback_text, comments_text, user=user, company=company, raise_errors=True
+                        )
+                    except requests.exceptions.RequestException:
+                        raise
+                    except Exception as e:
+                        logger.warning(f"Trait extraction failed for items {[item[0] for item in group]}: {e}")
+                        continue
+                else:
+                    store_extraction(cache_key, traits, EXTRACTION_PROMPT_VERSION, model)
+                for item in group:
+                    results[item[0]] = traits
+        return results
+
+    @staticmethod
+    def _extract_batch(chunk, model):
+        """
+        Viena sugrupuota užklausa. Elementai prompte numeruojami 1..K.
+        Grąžina {"1": rezultatas, ...} tik sėkmingai išnagrinėtiems elementams.
+        """
+        entries = "\n".join(
+            f"""[id: {index}]
+        Atsiliepimas:
+        {feedback_text}
+        Papildomas komentaras:
+        {comments_text}
+        """
+            for index, (_, feedback_text, comments_text, _, _) in enumerate(chunk, start=1)
+        )
+        prompt = f"""
+        Išanalizuok žemiau pateiktus darbuotojų atsiliepimus. Kiekvienam atsiliepimui atskirai išskirk dvi kategorijas:
+        1. Stiprybės (gerosios savybės, ką darbuotojas daro gerai)
+        2. Tobulintinos sritys (kas buvo paminėta kaip silpnybė arba kur galima tobulėti)
+
+        Atsakymą pateik GRIEŽTAI TIK JSON masyvu be jokio papildomo teksto, Markdown blokų ar paaiškinimų:
+        po vieną objektą kiekvienam atsiliepimui su tuo pačiu "id". Atsiliepimų tarpusavyje nemaišyk.
+        Kiekvienas punktas turi būti suformuluotas trumpai (1-2 sakiniai).
+
+        Pavyzdys:
+        [
+            {{"id": "1", "strengths": ["Puikiai sprendžia technines problemas."], "improvements": ["Galėtų dažniau imtis iniciatyvos."]}},
+            {{"id": "2", "strengths": [], "improvements": ["Vertėtų tobulinti viešo kalbėjimo įgūdžius."]}}
+        ]
+
+        Atsiliepimai:
+        {entries}
+        """
+
+        # Tiekėjo/tinklo klaidos (429, 5xx, grandinė atidaryta) keliamos aukštyn: kartoti po vieną
+        # tada reikštų K kartų daugiau užklausų tiekėjui, kuris jau nesusitvarko
+        data, metrics, model = OpenRouterService._request(
+            prompt, max_tokens=EXTRACTION_BATCH_TOKENS_PER_ITEM * (len(chunk) + 1)
+        )
+        try:
+            response_text = data['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError) as e:
+            logger.warning(f"Batched trait extraction returned no content for {len(chunk)} items, falling back: {e}")
+            return {}
+
+        # Kaina ir žetonai padalijami elementams pagal jų teksto ilgį
+        prompt_tokens, completion_tokens, total_cost = OpenRouterService._usage(data)
+        weights = [len(feedback_text or '') + len(comments_text or '') + 1 for _, feedback_text, comments_text, _, _ in chunk]
+        raw_response = data
+        for (_, _, _, user, company), estimated_share, prompt_share, completion_share, cost_share in zip(
+            chunk,
+            split_by_weights(estimate_tokens(prompt), weights),
+            split_by_weights(prompt_tokens, weights),
+            split_by_weights(completion_tokens, weights),
+            split_by_weights(total_cost, weights),
+        ):
+            if not (user or company):
+                continue
+            record_usage(
+                user=user,
+                company=company,
+                request_type='feedback_analysis',
+                model_name=model,
+                prompt_tokens=prompt_share,
+                estimated_prompt_tokens=estimated_share,
+                completion_tokens=completion_share,
+                total_cost=cost_share,
+                latency_ms=metrics.latency_ms,
+                attempts=metrics.attempts,
+                raw_response=raw_response,
+            )
+            # Visas atsakymas saugomas tik pirmame grupės įraše
+            raw_response = None
+
+        return parse_batch_traits(response_text, [str(index) for index in range(1, len(chunk) + 1)])
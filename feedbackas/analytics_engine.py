@@ -0,0 +1,161 @@
+"""
+NumPy pagrįstas kompetencijų analitikos variklis.
+
+Įmonės (ar kito pasirinkto rinkinio) užbaigti atsiliepimai vienąkart užkraunami
+viena values_list užklausa į NumPy masyvus, o vidurkiai, standartiniai nuokrypiai,
+medianos, percentiliai ir tendencijos visoms komandoms skaičiuojami vektoriškai.
+"""
+import numpy as np
+from django.utils import timezone
+
+from .models import COMPETENCY_FIELDS, Feedback
+
+# Matricos stulpeliai: bendras įvertinimas + penkios kompetencijos
+METRIC_KEYS = ('rating',) + tuple(key for key, _ in COMPETENCY_FIELDS)
+METRIC_FIELDS = ('rating',) + tuple(field for _, field in COMPETENCY_FIELDS)
+
+# Reikšmė, naudojama vartotojams be padalinio
+NO_DEPARTMENT = -1
+
+
+class CompetencyMatrix:
+    """
+    Užbaigtų atsiliepimų matrica: viena eilutė – vienas atsiliepimas.
+
+    user_ids        – vertinamo vartotojo (prašytojo) ID
+    department_ids  – jo padalinio ID (NO_DEPARTMENT, jei nepriskirtas)
+    dates           – prašymo sukūrimo data (vietos laiku), datetime64[D]
+    ratings         – float masyvas [eilutės × METRIC_KEYS]
+    """
+
+    def __init__(self, user_ids, department_ids, dates, ratings):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.department_ids = np.asarray(department_ids, dtype=np.int64)
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.ratings = np.asarray(ratings, dtype=np.float64).reshape(-1, len(METRIC_KEYS))
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @classmethod
+    def from_queryset(cls, feedbacks):
+        """Užkrauna matricą iš Feedback queryset viena užklausa."""
+        rows = feedbacks.values_list(
+            'feedback_request__requester_id',
+            'feedback_request__requester__profile__department_id',
+            'feedback_request__created_at',
+            *METRIC_FIELDS,
+        )
+        user_ids, department_ids, dates, ratings = [], [], [], []
+        for user_id, department_id, created_at, *values in rows.iterator():
+            user_ids.append(user_id)
+            department_ids.append(NO_DEPARTMENT if department_id is None else department_id)
+            dates.append(timezone.localdate(created_at))
+            ratings.append(values)
+        return cls(user_ids, department_ids, dates, ratings)
+
+    @classmethod
+    def for_company(cls, company):
+        """Visų įmonės darbuotojų gautų užbaigtų atsiliepimų matrica."""
+        return cls.from_queryset(Feedback.objects.filter(
+            feedback_request__requester__profile__company_link=company,
+            feedback_request__status='completed',
+        ))
+
+    def _group_keys(self, by):
+        if by == 'department':
+            return self.department_ids
+        if by == 'user':
+            return self.user_ids
+        if by is None:
+            return np.zeros(len(self), dtype=np.int64)
+        raise ValueError(f"Nežinomas grupavimas: {by}")
+
+    @staticmethod
+    def _group_percentile(sorted_values, starts, counts, q):
+        """Tiesinės interpoliacijos percentilis kiekvienai grupei (kaip np.percentile)."""
+        position = starts + q * (counts - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, starts + counts - 1)
+        fraction = (position - lower)[:, None]
+        return sorted_values[lower] * (1 - fraction) + sorted_values[upper] * fraction
+
+    def group_stats(self, by='department', percentiles=(25, 50, 75)):
+        """
+        Grąžina {grupės_raktas: {'count': n, 'mean': {...}, 'std': {...},
+        'median': {...}, 'p25': {...}, 'p75': {...}}} visoms grupėms vienu perėjimu.
+        by: 'department', 'user' arba None (visas rinkinys po raktu 0).
+        """
+        if not len(self):
+            return {}
+
+        keys = self._group_keys(by)
+        order = np.argsort(keys, kind='stable')
+        group_keys, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+
+        grouped = self.ratings[order]
+        sums = np.add.reduceat(grouped, starts, axis=0)
+        squares = np.add.reduceat(grouped ** 2, starts, axis=0)
+        means = sums / counts[:, None]
+        variances = np.maximum(squares / counts[:, None] - means ** 2, 0)
+        stds = np.sqrt(variances)
+
+        # Rūšiuojame reikšmes grupių viduje (kiekvienam stulpeliui atskirai) percentiliams
+        sorted_values = np.empty_like(grouped)
+        sorted_keys = keys[order]
+        for column in range(grouped.shape[1]):
+            column_order = np.lexsort((grouped[:, column], sorted_keys))
+            sorted_values[:, column] = grouped[column_order, column]
+
+        quantiles = {
+            q: self._group_percentile(sorted_values, starts, counts, q / 100)
+            for q in percentiles
+        }
+
+        def as_dict(row):
+            return {metric: round(float(value), 2) for metric, value in zip(METRIC_KEYS, row)}
+
+        stats = {}
+        for i, key in enumerate(group_keys.tolist()):
+            entry = {
+                'count': int(counts[i]),
+                'mean': as_dict(means[i]),
+                'std': as_dict(stds[i]),
+            }
+            for q, values in quantiles.items():
+                entry['median' if q == 50 else f'p{q}'] = as_dict(values[i])
+            stats[key] = entry
+        return stats
+
+    def overall(self):
+        """Statistika visam rinkiniui (arba None, jei duomenų nėra)."""
+        return self.group_stats(by=None).get(0)
+
+    def trend(self, by=None, freq='month'):
+        """
+        Vidurkiai pagal laikotarpį: {grupės_raktas: [{'period': 'YYYY-MM', 'count': n,
+        'rating': vidurkis, 'teamwork': ...}, ...]} chronologine tvarka.
+        freq: 'month' arba 'day'.
+        """
+        if not len(self):
+            return {}
+
+        unit = {'month': 'M', 'day': 'D'}[freq]
+        periods = self.dates.astype(f'datetime64[{unit}]').astype(np.int64)
+        keys = self._group_keys(by)
+
+        pairs, inverse = np.unique(np.stack([keys, periods], axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse, minlength=len(pairs))
+        means = np.stack([
+            np.bincount(inverse, weights=self.ratings[:, column], minlength=len(pairs)) / counts
+            for column in range(self.ratings.shape[1])
+        ], axis=1)
+
+        labels = np.datetime_as_string(pairs[:, 1].astype(f'datetime64[{unit}]'))
+        trend = {}
+        for (key, _), label, count, row in zip(pairs.tolist(), labels, counts.tolist(), means):
+            point = {'period': str(label), 'count': count}
+            point.update({metric: round(float(value), 2) for metric, value in zip(METRIC_KEYS, row)})
+            trend.setdefault(key, []).append(point)
+        return trend
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class FeedbackasConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'feedbackas'
+
+    def ready(self):
+        import feedbackas.signals
@@ -0,0 +1,224 @@
+"""
+Įvertinimų kubas (RatingCube): įmonė × padalinys × kompetencija/savybė × mėnuo.
+
+Kubas pildomas iš užbaigtų atsiliepimų ir klausimynų savybių įvertinimų.
+Inkrementinis atnaujinimas (kas valandą) perskaičiuoja tik tas (įmonė, mėnuo) dalis,
+kuriose nuo paskutinio atnaujinimo atsirado naujų atsiliepimų. Atsiliepimo created_at
+nustatomas prieš transakcijos patvirtinimą, todėl žiūrima ir CUBE_REFRESH_OVERLAP atgal
+nuo ankstesnio paleidimo pradžios – vėliau patvirtinti atsiliepimai nepraleidžiami. Ištrinti atsiliepimai ir
+darbuotojų perkėlimai tarp padalinių ar įmonių naujų atsiliepimų nesukuria, todėl juos
+sutvarko naktinis pilnas perskaičiavimas (refresh_rating_cube_task(full=True)). Rankiniu būdu:
+manage.py refresh_rating_cube --full
+"""
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DateField, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import COMPETENCY_FIELDS, Feedback, RatingCube, TraitRating
+from .rollups import bucket_month
+from .services import period_start_for_month
+
+# Kompetencijų dimensijos reikšmės: bendras įvertinimas + penkios kompetencijos
+CUBE_COMPETENCIES = (('rating', 'rating'),) + COMPETENCY_FIELDS
+
+# Kiek sekundžių atgal nuo ankstesnio atnaujinimo pradžios dar ieškoma atsiliepimų
+CUBE_REFRESH_OVERLAP = getattr(settings, 'RATING_CUBE_REFRESH_OVERLAP', 15 * 60)
+
+
+def _competency_rows(feedbacks):
+    """Kompetencijų eilutės: viena grupuota užklausa visiems matams."""
+    aggregates = {}
+    for key, field in CUBE_COMPETENCIES:
+        aggregates[f'{key}__sum'] = Sum(field)
+        aggregates[f'{key}__count'] = Count(field)
+        aggregates[f'{key}__sq_sum'] = Sum(F(field) * F(field))
+
+    rows = (
+        feedbacks.annotate(month=TruncMonth('feedback_request__created_at', output_field=DateField()))
+        .values(
+            'feedback_request__requester__profile__company_link_id',
+            'feedback_request__requester__profile__department_id',
+            'month',
+        )
+        .annotate(**aggregates)
+        .order_by()
+    )
+    for row in rows:
+        for key, _ in CUBE_COMPETENCIES:
+            yield RatingCube(
+                company_id=row['feedback_request__requester__profile__company_link_id'],
+                department_id=row['feedback_request__requester__profile__department_id'],
+                competency=key,
+                month=row['month'],
+                rating_sum=row[f'{key}__sum'] or 0,
+                rating_count=row[f'{key}__count'],
+                rating_sq_sum=row[f'{key}__sq_sum'] or 0,
+            )
+
+
+def _trait_rows(trait_ratings):
+    """Klausimynų savybių eilutės."""
+    rows = (
+        trait_ratings.annotate(month=TruncMonth('feedback__feedback_request__created_at', output_field=DateField()))
+        .values(
+            'feedback__feedback_request__requester__profile__company_link_id',
+            'feedback__feedback_request__requester__profile__department_id',
+            'trait_id',
+            'month',
+        )
+        .annotate(
+            rating_sum=Sum('rating'),
+            rating_count=Count('id'),
+            rating_sq_sum=Sum(F('rating') * F('rating')),
+        )
+        .order_by()
+    )
+    for row in rows:
+        yield RatingCube(
+            company_id=row['feedback__feedback_request__requester__profile__company_link_id'],
+            department_id=row['feedback__feedback_request__requester__profile__department_id'],
+            trait_id=row['trait_id'],
+            month=row['month'],
+            rating_sum=row['rating_sum'] or 0,
+            rating_count=row['rating_count'],
+            rating_sq_sum=row['rating_sq_sum'] or 0,
+        )
+
+
+def _rebuild_slices(company_ids=None, since_month=None, refreshed_at=None):
+    """
+    Perskaičiuoja kubo dalį (įmonės ir mėnesiai nuo since_month) ir grąžina eilučių skaičių.
+    refreshed_at – atnaujinimo paleidimo pradžia (kito inkrementinio paleidimo atskaita).
+    """
+    refreshed_at = refreshed_at or timezone.now()
+    feedbacks = Feedback.objects.filter(
+        feedback_request__status='completed',
+        feedback_request__requester__profile__company_link__isnull=False,
+    )
+    trait_ratings = TraitRating.objects.filter(
+        feedback__feedback_request__status='completed',
+        feedback__feedback_request__requester__profile__company_link__isnull=False,
+    )
+    cube = RatingCube.objects.all()
+    if company_ids is not None:
+        feedbacks = feedbacks.filter(feedback_request__requester__profile__company_link_id__in=company_ids)
+        trait_ratings = trait_ratings.filter(
+            feedback__feedback_request__requester__profile__company_link_id__in=company_ids
+        )
+        cube = cube.filter(company_id__in=company_ids)
+    if since_month is not None:
+        since = period_start_for_month(since_month)
+        feedbacks = feedbacks.filter(feedback_request__created_at__gte=since)
+        trait_ratings = trait_ratings.filter(feedback__feedback_request__created_at__gte=since)
+        cube = cube.filter(month__gte=since_month)
+
+    rows = list(_competency_rows(feedbacks)) + list(_trait_rows(trait_ratings))
+    for row in rows:
+        row.refreshed_at = refreshed_at
+
+    with transaction.atomic():
+        cube.delete()
+        RatingCube.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def refresh_rating_cube(full=False):
+    """
+    Atnaujina kubą. Inkrementiškai perskaičiuojamos tik įmonės, kuriose nuo paskutinio
+    atnaujinimo atsirado naujų atsiliepimų, nuo anksčiausio paliesto mėnesio.
+    Grąžina perskaičiuotų eilučių skaičių.
+    """
+    started = timezone.now()
+    watermark = None if full else RatingCube.objects.aggregate(last=Max('refreshed_at'))['last']
+    if watermark is None:
+        return _rebuild_slices(refreshed_at=started)
+
+    changed = (
+        Feedback.objects.filter(
+            created_at__gte=watermark - timedelta(seconds=CUBE_REFRESH_OVERLAP),
+            feedback_request__requester__profile__company_link__isnull=False,
+        )
+        .values('feedback_request__requester__profile__company_link_id')
+        .annotate(earliest=Min('feedback_request__created_at'))
+        .values_list('feedback_request__requester__profile__company_link_id', 'earliest')
+        .order_by()
+    )
+    months_by_company = {company_id: bucket_month(earliest) for company_id, earliest in changed}
+
+    refreshed = 0
+    for company_id, since_month in months_by_company.items():
+        refreshed += _rebuild_slices(company_ids=[company_id], since_month=since_month, refreshed_at=started)
+    return refreshed
+
+
+def _measures(row):
+    count = row['rating_count'] or 0
+    if not count:
+        return {'count': 0, 'mean': None, 'std': None}
+    mean = row['rating_sum'] / count
+    variance = max(row['rating_sq_sum'] / count - mean ** 2, 0)
+    return {'count': count, 'mean': round(mean, 2), 'std': round(math.sqrt(variance), 2)}
+
+
+def slice_cube(company, group_by=('department', 'month'), departments=None, competencies=None,
+               traits=None, since_month=None, until_month=None):
+    """
+    Kubo pjūvis: filtruoja pagal dimensijas ir sugrupuoja pagal group_by
+    (bet kurie iš 'department', 'competency', 'trait', 'month').
+    Grąžina sąrašą {dimensijos..., 'count', 'mean', 'std'}.
+    """
+    cube = RatingCube.objects.filter(company=company)
+    if departments is not None:
+        cube = cube.filter(department__in=departments)
+    if competencies is not None or traits is not None:
+        dimension = Q()
+        if competencies is not None:
+            dimension |= Q(competency__in=competencies)
+        if traits is not None:
+            dimension |= Q(trait__in=traits)
+        cube = cube.filter(dimension)
+    if since_month is not None:
+        cube = cube.filter(month__gte=since_month)
+    if until_month is not None:
+        cube = cube.filter(month__lte=until_month)
+
+    rows = (
+        cube.values(*group_by)
+        .annotate(rating_sum=Sum('rating_sum'), rating_count=Sum('rating_count'), rating_sq_sum=Sum('rating_sq_sum'))
+        .order_by(*group_by)
+    )
+    return [
+        {**{key: row[key] for key in group_by}, **_measures(row)}
+        for row in rows
+    ]
+
+
+def department_heatmap(company, since_month=None):
+    """
+    Padalinių šilumos žemėlapis: eilutės – padaliniai, stulpeliai – kompetencijos.
+    Grąžina {'columns': [kompetencijų raktai], 'rows': [{'department_id', 'cells': [...]}]}.
+    """
+    columns = [key for key, _ in CUBE_COMPETENCIES]
+    cells = {
+        (row['department'], row['competency']): row
+        for row in slice_cube(
+            company, group_by=('department', 'competency'),
+            competencies=columns, since_month=since_month,
+        )
+    }
+    department_ids = sorted({department_id for department_id, _ in cells}, key=lambda d: (d is None, d))
+    return {
+        'columns': columns,
+        'rows': [
+            {
+                'department_id': department_id,
+                'cells': [cells.get((department_id, key), {'count': 0, 'mean': None, 'std': None}) for key in columns],
+            }
+            for department_id in department_ids
+        ],
+    }
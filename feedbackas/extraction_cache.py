@@ -0,0 +1,105 @@
+"""
+Turiniu adresuojamas extract_strengths_weaknesses rezultatų kešas.
+
+Raktas – SHA-256 nuo normalizuoto (atsiliepimo teksto, komentaro, prompto versijos,
+modelio). Rezultatai laikomi Redis (Django cache, su TTL; Redis išmetimo politika –
+allkeys-lru) ir kartu įrašomi į AIExtractionCache lentelę, todėl pataikymai išlieka
+ir po Redis perkrovimo (arba kol Redis nepasiekiamas). Pakeitus promptą, reikia padidinti EXTRACTION_PROMPT_VERSION
+(feedbackas.ai_service) – seni įrašai tiesiog nebebus naudojami.
+"""
+import hashlib
+import json
+import logging
+import random
+import unicodedata
+
+import redis
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+
+from .redis_client import shared_cache
+
+logger = logging.getLogger(__name__)
+
+# Kiek laiko (s) rezultatas laikomas Redis; DB kopija nebesibaigia
+EXTRACTION_CACHE_TTL = getattr(settings, 'AI_EXTRACTION_CACHE_TTL', 60 * 60 * 24 * 30)
+# Redis pataikymai į AIExtractionCache.hits rašomi atrinktinai: kas N-tas (vidutiniškai), po +N
+EXTRACTION_HIT_SAMPLE_RATE = getattr(settings, 'AI_EXTRACTION_HIT_SAMPLE_RATE', 20)
+
+
+def normalize_text(text):
+    """Unicode NFC, be pradžios/pabaigos tarpų, tarpų sekos sutraukiamos į vieną."""
+    if not text:
+        return ''
+    return ' '.join(unicodedata.normalize('NFC', str(text)).split())
+
+
+def extraction_cache_key(feedback_text, comments_text, prompt_version, model_name):
+    payload = json.dumps(
+        [normalize_text(feedback_text), normalize_text(comments_text), prompt_version, model_name],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _redis_key(key):
+    return f'ai_extraction:{key}'
+
+
+def _cache_get(key):
+    try:
+        return shared_cache().get(_redis_key(key))
+    except redis.RedisError as e:
+        logger.warning(f"AI extraction cache unavailable: {e}")
+        return None
+
+
+def _cache_set(key, result):
+    try:
+        shared_cache().set(_redis_key(key), result, EXTRACTION_CACHE_TTL)
+    except redis.RedisError as e:
+        logger.warning(f"AI extraction cache unavailable: {e}")
+
+
+def _count_hits(key, hits):
+    from .models import AIExtractionCache
+
+    AIExtractionCache.objects.filter(key=key).update(hits=F('hits') + hits, last_hit_at=timezone.now())
+
+
+def get_cached_extraction(key):
+    """
+    Rezultatas iš Redis arba DB (DB pataikymas grąžinamas ir į Redis); None – jei nėra.
+    Redis pataikymas DB paliečia tik atrinktinai (EXTRACTION_HIT_SAMPLE_RATE), todėl hits – įvertis.
+    """
+    from .models import AIExtractionCache
+
+    result = _cache_get(key)
+    if result is not None:
+        if random.randrange(EXTRACTION_HIT_SAMPLE_RATE) == 0:
+            _count_hits(key, EXTRACTION_HIT_SAMPLE_RATE)
+        return result
+
+    result = AIExtractionCache.objects.filter(key=key).values_list('result', flat=True).first()
+    if result is None:
+        return None
+    _count_hits(key, 1)
+    _cache_set(key, result)
+    return result
+
+
+def store_extraction(key, result, prompt_version, model_name):
+    """Įrašo rezultatą į Redis ir DB (write-through). Redis ar DB klaida nenutraukia užklausos."""
+    from .models import AIExtractionCache
+
+    _cache_set(key, result)
+    try:
+        AIExtractionCache.objects.update_or_create(
+            key=key,
+            defaults={'result': result, 'prompt_version': prompt_version, 'model_name': model_name},
+        )
+    except DatabaseError as e:
+        logger.warning(f"Failed to persist AI extraction cache entry {key[:12]}: {e}")
@@ -103,6 +103,20 @@ class DepartmentForm(forms.ModelForm):
             self.fields['parent'].queryset = Department.objects.filter(company=company_link)
             self.fields['manager'].queryset = User.objects.filter(profile__company_link=company_link)
 
+        # Padalinio negalima perkelti po jo paties ar jo sub-padaliniu
+        if self.instance.pk:
+            self.fields['parent'].queryset = self.fields['parent'].queryset.exclude(
+                ancestor_links__ancestor=self.instance
+            )
+
+    def clean_parent(self):
+        from users.hierarchy import is_under
+
+        parent = self.cleaned_data.get('parent')
+        if parent and self.instance.pk and is_under(parent, [self.instance.pk]):
+            raise forms.ValidationError(_('Padalinio negalima perkelti po jo paties sub-padaliniu.'))
+        return parent
+
 class PageDescriptionForm(forms.ModelForm):
     class Meta:
         model = __import__('feedbackas.models').models.PageDescription
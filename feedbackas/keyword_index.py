@@ -0,0 +1,96 @@
+"""
+Raktinių žodžių indeksas.
+
+Feedback.keywords saugomas kaip kableliais atskirta eilutė, todėl statistikai
+žodžiai išskaidomi į Keyword / FeedbackKeyword lenteles. Dažniausi žodžiai
+tada gaunami viena GROUP BY užklausa, neužkraunant pačių atsiliepimų.
+"""
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Feedback, FeedbackKeyword, Keyword
+
+
+def parse_keywords(keywords_str):
+    """
+    Išskaido kableliais atskirtą eilutę į {normalizuotas: rodomas} žodyną.
+    Pasikartojantys žodžiai (nepaisant raidžių dydžio) paliekami vieną kartą.
+    """
+    parsed = {}
+    for raw in (keywords_str or '').split(','):
+        name = ' '.join(raw.split())[:255]
+        if name:
+            parsed.setdefault(name.casefold(), name)
+    return parsed
+
+
+def _get_keyword_ids(parsed):
+    """Grąžina {normalizuotas: Keyword.id}, sukurdamas trūkstamus žodžius."""
+    if not parsed:
+        return {}
+    Keyword.objects.bulk_create(
+        [Keyword(name=name, normalized=normalized) for normalized, name in parsed.items()],
+        ignore_conflicts=True,
+    )
+    return dict(
+        Keyword.objects.filter(normalized__in=parsed).values_list('normalized', 'id')
+    )
+
+
+def index_feedback_keywords(feedback):
+    """Sinchronizuoja vieno atsiliepimo raktinių žodžių ryšius su feedback.keywords."""
+    keyword_ids = set(_get_keyword_ids(parse_keywords(feedback.keywords)).values())
+    with transaction.atomic():
+        FeedbackKeyword.objects.filter(feedback=feedback).exclude(keyword_id__in=keyword_ids).delete()
+        FeedbackKeyword.objects.bulk_create(
+            [FeedbackKeyword(feedback=feedback, keyword_id=keyword_id) for keyword_id in keyword_ids],
+            ignore_conflicts=True,
+        )
+
+
+def rebuild_keyword_index(feedback_ids=None, batch_size=1000):
+    """
+    Perskaičiuoja raktinių žodžių ryšius iš Feedback.keywords.
+    Jei nurodyti feedback_ids – tik šiems atsiliepimams. Grąžina sukurtų ryšių skaičių.
+    """
+    feedbacks = Feedback.objects.all()
+    links = FeedbackKeyword.objects.all()
+    if feedback_ids is not None:
+        feedbacks = feedbacks.filter(id__in=feedback_ids)
+        links = links.filter(feedback_id__in=feedback_ids)
+
+    rows = [
+        (feedback_id, parse_keywords(keywords_str))
+        for feedback_id, keywords_str in feedbacks.values_list('id', 'keywords').iterator()
+    ]
+    all_keywords = {}
+    for _, parsed in rows:
+        for normalized, name in parsed.items():
+            all_keywords.setdefault(normalized, name)
+
+    with transaction.atomic():
+        links.delete()
+        keyword_ids = _get_keyword_ids(all_keywords)
+        new_links = [
+            FeedbackKeyword(feedback_id=feedback_id, keyword_id=keyword_ids[normalized])
+            for feedback_id, parsed in rows
+            for normalized in parsed
+        ]
+        FeedbackKeyword.objects.bulk_create(new_links, batch_size=batch_size)
+    return len(new_links)
+
+
+def top_keywords(feedbacks, limit=None):
+    """
+    Grąžina dažniausiai pasikartojančius raktinius žodžius pateiktuose atsiliepimuose
+    (Feedback queryset), surikiuotus pagal dažnį.
+    """
+    keywords = (
+        Keyword.objects.filter(feedback_links__feedback__in=feedbacks.values('id'))
+        .annotate(uses=Count('feedback_links'))
+        .order_by('-uses', 'name')
+        .values_list('name', flat=True)
+    )
+    if limit is not None:
+        keywords = keywords[:limit]
+    return list(keywords)
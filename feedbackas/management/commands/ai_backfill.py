@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from feedbackas.ai_backfill import default_checkpoint_name, run_ai_backfill
+from feedbackas.openrouter_client import CircuitOpenError
+from feedbackas.rate_limit import get_openrouter_bucket
+
+
+class Command(BaseCommand):
+    help = (
+        'Lygiagrečiai perskaičiuoja atsiliepimų AI analizę (stiprybės/tobulintinos sritys) '
+        'su bendra Redis užklausų riba ir progreso išsaugojimu (nutrūkus – tęsiama).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', dest='reextract',
+                            help='Perskaičiuoti visus atsiliepimus (pvz. naujai prompto versijai), ne tik neanalizuotus.')
+        parser.add_argument('--workers', type=int, default=4, help='Gijų skaičius.')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Atsiliepimų skaičius viename prompte (pagal nutylėjimą – AI_EXTRACTION_BATCH_SIZE).')
+        parser.add_argument('--name', default=None, help='Kontrolinio taško pavadinimas (pagal nutylėjimą – pagal prompto versiją).')
+        parser.add_argument('--restart', action='store_true', help='Pradėti iš naujo, ignoruojant išsaugotą progresą.')
+        parser.add_argument('--report-every', type=float, default=30.0, help='Kas kiek sekundžių rodyti progresą.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers turi būti bent 1.')
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('--batch-size turi būti bent 1.')
+        if get_openrouter_bucket() is None:
+            self.stdout.write(self.style.WARNING(
+                'OPENROUTER_RATE_PER_MINUTE nenustatytas – užklausos nebus ribojamos.'
+            ))
+
+        name = options['name'] or default_checkpoint_name(options['reextract'])
+        self.stdout.write(f'Kontrolinis taškas: {name}')
+        try:
+            progress = run_ai_backfill(
+                name=name,
+                reextract=options['reextract'],
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                restart=options['restart'],
+                report=lambda progress: self.stdout.write(str(progress)),
+                report_every=options['report_every'],
+            )
+        except CircuitOpenError as e:
+            raise CommandError(f'Nutraukta – OpenRouter nepasiekiamas ({e}). Paleiskite vėliau, bus tęsiama.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Baigta: atnaujinta {progress.updated}, nepavyko {progress.failed}.'
+        ))
@@ -0,0 +1,32 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from feedbackas.platform_metrics import first_activity_date, snapshot_platform_metrics
+
+
+class Command(BaseCommand):
+    help = 'Užpildo dienos platformos rodiklių nuotraukas (PlatformDailyMetrics) nurodytam laikotarpiui.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Pradžios data YYYY-MM-DD (pagal nutylėjimą – pirma registracija).')
+        parser.add_argument('--until', help='Pabaigos data YYYY-MM-DD (pagal nutylėjimą – šiandien).')
+        parser.add_argument('--chunk-days', type=int, default=31, help='Kiek dienų perskaičiuoti vienu kartu.')
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.date.fromisoformat(options['since']) if options['since'] else first_activity_date()
+            end = datetime.date.fromisoformat(options['until']) if options['until'] else timezone.localdate()
+        except ValueError as e:
+            raise CommandError(f'Neteisinga data: {e}')
+        if start > end:
+            raise CommandError('Pradžios data vėlesnė už pabaigos datą.')
+
+        created = 0
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + datetime.timedelta(days=options['chunk_days'] - 1), end)
+            created += snapshot_platform_metrics(chunk_start, chunk_end)
+            chunk_start = chunk_end + datetime.timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f'Sukurta nuotraukų eilučių: {created} ({start}–{end})'))
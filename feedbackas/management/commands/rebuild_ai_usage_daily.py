@@ -0,0 +1,19 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from feedbackas.rollups import rebuild_ai_usage_daily
+
+
+class Command(BaseCommand):
+    help = 'Perskaičiuoja AI naudojimo dienos suvestines (AIUsageDaily) iš AIUsageLog.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since', type=datetime.date.fromisoformat,
+            help='Perskaičiuoti tik dienas nuo nurodytos datos (YYYY-MM-DD).',
+        )
+
+    def handle(self, *args, **options):
+        aggregates = rebuild_ai_usage_daily(since=options['since'])
+        self.stdout.write(self.style.SUCCESS(f'Perskaičiuota dienos suvestinių: {aggregates}'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from feedbackas.keyword_index import rebuild_keyword_index
+
+
+class Command(BaseCommand):
+    help = 'Perskaičiuoja raktinių žodžių indeksą (Keyword / FeedbackKeyword) iš Feedback.keywords.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--feedback', type=int, action='append', dest='feedback_ids',
+            help='Perskaičiuoti tik nurodyto atsiliepimo ID (galima kartoti).',
+        )
+
+    def handle(self, *args, **options):
+        links = rebuild_keyword_index(feedback_ids=options['feedback_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Sukurta raktinių žodžių ryšių: {links}'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from feedbackas.rollups import rebuild_user_rating_buckets, rebuild_user_rating_summaries
+
+
+class Command(BaseCommand):
+    help = 'Perskaičiuoja vartotojų atsiliepimų suvestines (UserRatingSummary) ir mėnesių krepšelius iš visų užbaigtų atsiliepimų.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='Perskaičiuoti tik nurodyto vartotojo ID (galima kartoti).',
+        )
+
+    def handle(self, *args, **options):
+        summaries = rebuild_user_rating_summaries(user_ids=options['user_ids'])
+        buckets = rebuild_user_rating_buckets(user_ids=options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Perskaičiuota suvestinių: {summaries}, mėnesių krepšelių: {buckets}'
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from feedbackas.rollups import rebuild_trait_daily_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Perskaičiuoja klausimynų savybių dienos suvestines (TraitDailyAggregate) iš visų TraitRating.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--questionnaire', type=int, action='append', dest='questionnaire_ids',
+            help='Perskaičiuoti tik nurodyto klausimyno ID (galima kartoti).',
+        )
+
+    def handle(self, *args, **options):
+        aggregates = rebuild_trait_daily_aggregates(questionnaire_ids=options['questionnaire_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Perskaičiuota dienos suvestinių: {aggregates}'))
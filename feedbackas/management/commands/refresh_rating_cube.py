@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from feedbackas.cube import refresh_rating_cube
+
+
+class Command(BaseCommand):
+    help = 'Atnaujina įvertinimų kubą (RatingCube): pagal nutylėjimą inkrementiškai, su --full – visą.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Perskaičiuoti visą kubą iš naujo.')
+
+    def handle(self, *args, **options):
+        rows = refresh_rating_cube(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Perskaičiuota kubo eilučių: {rows}'))
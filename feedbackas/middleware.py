@@ -120,3 +120,18 @@ class RestrictHttpMethodMiddleware:
             return HttpResponseNotAllowed(self.ALLOWED_METHODS)
             
         return self.get_response(request)
+
+class CoalesceEmployeeCountsMiddleware:
+    """
+    Per užklausą pažymėtų įmonių aktyvių darbuotojų skaičius perskaičiuojamas
+    vieną kartą užklausos pabaigoje (pvz. importuojant daug darbuotojų),
+    o ne po kiekvieno profilio išsaugojimo.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from users.employee_counts import coalesce_employee_counts
+
+        with coalesce_employee_counts():
+            return self.get_response(request)
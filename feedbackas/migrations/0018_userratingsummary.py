@@ -0,0 +1,59 @@
+# Generated by Django 4.2.2 on 2026-10-18 12:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def build_summaries(apps, schema_editor):
+    """Užpildo suvestines iš jau esamų užbaigtų atsiliepimų."""
+    from django.db.models import Count, Sum
+
+    Feedback = apps.get_model('feedbackas', 'Feedback')
+    UserRatingSummary = apps.get_model('feedbackas', 'UserRatingSummary')
+
+    rows = (
+        Feedback.objects.filter(feedback_request__status='completed')
+        .values('feedback_request__requester_id')
+        .annotate(
+            feedback_count=Count('id'),
+            rating_sum=Sum('rating'),
+            teamwork_sum=Sum('teamwork_rating'),
+            communication_sum=Sum('communication_rating'),
+            initiative_sum=Sum('initiative_rating'),
+            technical_skills_sum=Sum('technical_skills_rating'),
+            problem_solving_sum=Sum('problem_solving_rating'),
+        )
+        .order_by()
+    )
+    UserRatingSummary.objects.bulk_create(
+        [UserRatingSummary(user_id=row.pop('feedback_request__requester_id'), **row) for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('feedbackas', '0017_globalsettings_language_switcher_enabled'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserRatingSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('feedback_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.BigIntegerField(default=0)),
+                ('teamwork_sum', models.BigIntegerField(default=0)),
+                ('communication_sum', models.BigIntegerField(default=0)),
+                ('initiative_sum', models.BigIntegerField(default=0)),
+                ('technical_skills_sum', models.BigIntegerField(default=0)),
+                ('problem_solving_sum', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
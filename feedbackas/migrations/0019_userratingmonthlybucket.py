@@ -0,0 +1,64 @@
+# Generated by Django 4.2.2 on 2026-10-18 12:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_buckets(apps, schema_editor):
+    """Užpildo mėnesių krepšelius iš jau esamų užbaigtų atsiliepimų."""
+    from django.db.models import Count, DateField, Sum
+    from django.db.models.functions import TruncMonth
+
+    Feedback = apps.get_model('feedbackas', 'Feedback')
+    UserRatingMonthlyBucket = apps.get_model('feedbackas', 'UserRatingMonthlyBucket')
+
+    rows = (
+        Feedback.objects.filter(feedback_request__status='completed')
+        .annotate(month=TruncMonth('feedback_request__created_at', output_field=DateField()))
+        .values('feedback_request__requester_id', 'month')
+        .annotate(
+            feedback_count=Count('id'),
+            rating_sum=Sum('rating'),
+            teamwork_sum=Sum('teamwork_rating'),
+            communication_sum=Sum('communication_rating'),
+            initiative_sum=Sum('initiative_rating'),
+            technical_skills_sum=Sum('technical_skills_rating'),
+            problem_solving_sum=Sum('problem_solving_rating'),
+        )
+        .order_by()
+    )
+    UserRatingMonthlyBucket.objects.bulk_create(
+        [UserRatingMonthlyBucket(user_id=row.pop('feedback_request__requester_id'), **row) for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('feedbackas', '0018_userratingsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserRatingMonthlyBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('feedback_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.BigIntegerField(default=0)),
+                ('teamwork_sum', models.BigIntegerField(default=0)),
+                ('communication_sum', models.BigIntegerField(default=0)),
+                ('initiative_sum', models.BigIntegerField(default=0)),
+                ('technical_skills_sum', models.BigIntegerField(default=0)),
+                ('problem_solving_sum', models.BigIntegerField(default=0)),
+                ('month', models.DateField(help_text='Mėnesio pirma diena')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_buckets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'month')},
+            },
+        ),
+        migrations.RunPython(build_buckets, migrations.RunPython.noop),
+    ]
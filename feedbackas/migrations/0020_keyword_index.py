@@ -0,0 +1,77 @@
+# Generated by Django 4.2.2 on 2026-10-18 12:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def parse_keywords(keywords_str):
+    """
+    feedbackas.keyword_index.parse_keywords kopija, užfiksuota migracijos metu –
+    migracija neturi priklausyti nuo vėliau keičiamo programos kodo.
+    """
+    parsed = {}
+    for raw in (keywords_str or '').split(','):
+        name = ' '.join(raw.split())[:255]
+        if name:
+            parsed.setdefault(name.casefold(), name)
+    return parsed
+
+
+def build_keyword_index(apps, schema_editor):
+    """Išskaido jau esamų atsiliepimų raktinius žodžius į indeksą."""
+    Feedback = apps.get_model('feedbackas', 'Feedback')
+    Keyword = apps.get_model('feedbackas', 'Keyword')
+    FeedbackKeyword = apps.get_model('feedbackas', 'FeedbackKeyword')
+
+    rows = [
+        (feedback_id, parse_keywords(keywords_str))
+        for feedback_id, keywords_str in Feedback.objects.values_list('id', 'keywords').iterator()
+    ]
+    all_keywords = {}
+    for _, parsed in rows:
+        for normalized, name in parsed.items():
+            all_keywords.setdefault(normalized, name)
+
+    Keyword.objects.bulk_create(
+        [Keyword(name=name, normalized=normalized) for normalized, name in all_keywords.items()],
+        batch_size=1000,
+    )
+    keyword_ids = dict(Keyword.objects.values_list('normalized', 'id'))
+    FeedbackKeyword.objects.bulk_create(
+        [
+            FeedbackKeyword(feedback_id=feedback_id, keyword_id=keyword_ids[normalized])
+            for feedback_id, parsed in rows
+            for normalized in parsed
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedbackas', '0019_userratingmonthlybucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Keyword',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('normalized', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FeedbackKeyword',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('feedback', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keyword_links', to='feedbackas.feedback')),
+                ('keyword', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feedback_links', to='feedbackas.keyword')),
+            ],
+            options={
+                'unique_together': {('feedback', 'keyword')},
+            },
+        ),
+        migrations.RunPython(build_keyword_index, migrations.RunPython.noop),
+    ]
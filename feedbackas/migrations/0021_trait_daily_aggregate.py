@@ -0,0 +1,86 @@
+# Generated by Django 4.2.2 on 2026-10-18 12:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_requests_to_questionnaires(apps, schema_editor):
+    """
+    Senesnės klausimynų užklausos buvo siejamos tik pagal project_name == title.
+    Priskiriame FK ten, kur autoriaus klausimyno pavadinimas vienareikšmis.
+    """
+    from collections import Counter
+
+    Questionnaire = apps.get_model('feedbackas', 'Questionnaire')
+    FeedbackRequest = apps.get_model('feedbackas', 'FeedbackRequest')
+
+    questionnaires = list(Questionnaire.objects.values_list('id', 'created_by_id', 'title'))
+    title_counts = Counter((created_by_id, title) for _, created_by_id, title in questionnaires)
+    for questionnaire_id, created_by_id, title in questionnaires:
+        if title_counts[(created_by_id, title)] == 1:
+            FeedbackRequest.objects.filter(
+                questionnaire__isnull=True, requester_id=created_by_id, project_name=title
+            ).update(questionnaire_id=questionnaire_id)
+
+
+def build_trait_aggregates(apps, schema_editor):
+    """Užpildo klausimynų savybių dienos suvestines iš jau esamų įvertinimų."""
+    from django.db.models import Count, Sum
+    from django.db.models.functions import TruncDate
+
+    TraitRating = apps.get_model('feedbackas', 'TraitRating')
+    TraitDailyAggregate = apps.get_model('feedbackas', 'TraitDailyAggregate')
+
+    rows = (
+        TraitRating.objects.filter(feedback__feedback_request__questionnaire__isnull=False)
+        .annotate(date=TruncDate('feedback__feedback_request__created_at'))
+        .values('feedback__feedback_request__questionnaire_id', 'trait_id', 'date')
+        .annotate(rating_sum=Sum('rating'), rating_count=Count('id'))
+        .order_by()
+    )
+    TraitDailyAggregate.objects.bulk_create(
+        [
+            TraitDailyAggregate(questionnaire_id=row.pop('feedback__feedback_request__questionnaire_id'), **row)
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedbackas', '0020_keyword_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TraitDailyAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('rating_sum', models.BigIntegerField(default=0)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='feedbackrequest',
+            index=models.Index(fields=['questionnaire', 'status'], name='feedbackas__questio_4930e3_idx'),
+        ),
+        migrations.AddField(
+            model_name='traitdailyaggregate',
+            name='questionnaire',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trait_daily_aggregates', to='feedbackas.questionnaire'),
+        ),
+        migrations.AddField(
+            model_name='traitdailyaggregate',
+            name='trait',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_aggregates', to='feedbackas.trait'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='traitdailyaggregate',
+            unique_together={('questionnaire', 'trait', 'date')},
+        ),
+        migrations.RunPython(link_requests_to_questionnaires, migrations.RunPython.noop),
+        migrations.RunPython(build_trait_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.2 on 2026-10-18 12:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def create_refresh_schedule(apps, schema_editor):
+    """Kas valandą inkrementiškai atnaujina įvertinimų kubą."""
+    Schedule = apps.get_model('django_q', 'Schedule')
+    Schedule.objects.update_or_create(
+        func='feedbackas.services.refresh_rating_cube_task',
+        defaults={'name': 'Įvertinimų kubo atnaujinimas', 'schedule_type': 'H', 'repeats': -1},
+    )
+
+
+def delete_refresh_schedule(apps, schema_editor):
+    Schedule = apps.get_model('django_q', 'Schedule')
+    Schedule.objects.filter(func='feedbackas.services.refresh_rating_cube_task').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_department_closure'),
+        ('feedbackas', '0021_trait_daily_aggregate'),
+        ('django_q', '0014_schedule_cluster'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingCube',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('competency', models.CharField(blank=True, default='', max_length=32)),
+                ('month', models.DateField(help_text='Mėnesio pirma diena')),
+                ('rating_sum', models.BigIntegerField(default=0)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('rating_sq_sum', models.BigIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_cube', to='users.company')),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rating_cube', to='users.department')),
+                ('trait', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rating_cube', to='feedbackas.trait')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'month'], name='feedbackas__company_f45c18_idx'), models.Index(fields=['refreshed_at'], name='feedbackas__refresh_9c3b27_idx')],
+            },
+        ),
+        migrations.RunPython(create_refresh_schedule, delete_refresh_schedule),
+    ]
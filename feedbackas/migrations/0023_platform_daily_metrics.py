@@ -0,0 +1,56 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_snapshot_schedule(apps, schema_editor):
+    """Kas naktį (01:00) perskaičiuoja vakar ir šiandienos platformos rodiklius."""
+    import datetime
+    from django.utils import timezone
+
+    Schedule = apps.get_model('django_q', 'Schedule')
+    tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+    Schedule.objects.update_or_create(
+        func='feedbackas.services.snapshot_platform_metrics_task',
+        defaults={
+            'name': 'Platformos dienos rodikliai',
+            'schedule_type': 'D',
+            'repeats': -1,
+            'next_run': timezone.make_aware(datetime.datetime.combine(tomorrow, datetime.time(1, 0))),
+        },
+    )
+
+
+def delete_snapshot_schedule(apps, schema_editor):
+    Schedule = apps.get_model('django_q', 'Schedule')
+    Schedule.objects.filter(func='feedbackas.services.snapshot_platform_metrics_task').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_department_closure'),
+        ('feedbackas', '0022_rating_cube'),
+        ('django_q', '0014_schedule_cluster'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformDailyMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('registrations', models.PositiveIntegerField(default=0)),
+                ('active_users', models.PositiveIntegerField(default=0, help_text='Paskutinis žinomas aktyvių darbuotojų skaičius dienos pabaigoje')),
+                ('completed_feedback', models.PositiveIntegerField(default=0)),
+                ('ai_cost', models.DecimalField(decimal_places=10, default=0, max_digits=15)),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_metrics', to='users.company')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'date'], name='feedbackas__company_12ce7d_idx')],
+                'unique_together': {('date', 'company')},
+            },
+        ),
+        migrations.RunPython(create_snapshot_schedule, delete_snapshot_schedule),
+    ]
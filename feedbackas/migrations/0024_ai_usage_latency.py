@@ -0,0 +1,23 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedbackas', '0023_platform_daily_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Kiek kartų užklausa buvo siųsta'),
+        ),
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='latency_ms',
+            field=models.PositiveIntegerField(blank=True, help_text='Užklausos trukmė su visais bandymais (ms)', null=True),
+        ),
+    ]
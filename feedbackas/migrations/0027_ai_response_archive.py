@@ -0,0 +1,73 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:28
+
+import json
+import zlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def archive_raw_responses(apps, schema_editor):
+    """Esami raw_response suspaudžiami į AIResponseArchive (stulpelis pašalinamas 0028)."""
+    AIUsageLog = apps.get_model('feedbackas', 'AIUsageLog')
+    AIResponseArchive = apps.get_model('feedbackas', 'AIResponseArchive')
+
+    rows = AIUsageLog.objects.exclude(raw_response=None).values_list('id', 'raw_response').order_by('id')
+    batch = []
+
+    def flush():
+        archives = AIResponseArchive.objects.bulk_create([archive for _, archive in batch])
+        for (log_id, _), archive in zip(batch, archives):
+            AIUsageLog.objects.filter(pk=log_id).update(raw_archive_id=archive.pk)
+        batch.clear()
+
+    for log_id, raw_response in rows.iterator(chunk_size=500):
+        encoded = json.dumps(raw_response, ensure_ascii=False).encode('utf-8')
+        batch.append((log_id, AIResponseArchive(data=zlib.compress(encoded), original_size=len(encoded))))
+        if len(batch) >= 500:
+            flush()
+    if batch:
+        flush()
+
+
+def restore_raw_responses(apps, schema_editor):
+    AIUsageLog = apps.get_model('feedbackas', 'AIUsageLog')
+    for log in AIUsageLog.objects.exclude(raw_archive=None).select_related('raw_archive').iterator(chunk_size=500):
+        log.raw_response = json.loads(zlib.decompress(bytes(log.raw_archive.data)))
+        log.save(update_fields=['raw_response'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedbackas', '0026_ai_backfill_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIResponseArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField()),
+                ('original_size', models.PositiveIntegerField(help_text='Nesuspausto JSON dydis baitais')),
+                ('truncated', models.BooleanField(default=False, help_text='Atsakymo tekstas apkarpytas pagal politiką')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='aiusagelog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='aiusagelog',
+            index=models.Index(fields=['timestamp'], name='feedbackas__timesta_34c560_idx'),
+        ),
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='raw_archive',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='usage_logs', to='feedbackas.airesponsearchive'),
+        ),
+        migrations.RunPython(archive_raw_responses, restore_raw_responses),
+    ]
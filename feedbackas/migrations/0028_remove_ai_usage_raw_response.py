@@ -0,0 +1,17 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:28
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedbackas', '0027_ai_response_archive'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='aiusagelog',
+            name='raw_response',
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_daily_usage(apps, schema_editor):
+    """Užpildo AI naudojimo dienos suvestines iš jau esamų AIUsageLog įrašų."""
+    from django.db.models import Count, Sum
+    from django.db.models.functions import TruncDate
+
+    AIUsageLog = apps.get_model('feedbackas', 'AIUsageLog')
+    AIUsageDaily = apps.get_model('feedbackas', 'AIUsageDaily')
+
+    rows = (
+        AIUsageLog.objects.annotate(date=TruncDate('timestamp'))
+        .values('date', 'company_id', 'user_id', 'request_type', 'model_name')
+        .annotate(
+            calls=Count('id'),
+            prompt_tokens=Sum('prompt_tokens'),
+            completion_tokens=Sum('completion_tokens'),
+            total_cost=Sum('total_cost'),
+        )
+        .order_by()
+    )
+    AIUsageDaily.objects.bulk_create([AIUsageDaily(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_company_active_employee_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('feedbackas', '0028_remove_ai_usage_raw_response'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIUsageDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('request_type', models.CharField(max_length=100)),
+                ('model_name', models.CharField(max_length=100)),
+                ('calls', models.PositiveIntegerField(default=0)),
+                ('prompt_tokens', models.BigIntegerField(default=0)),
+                ('completion_tokens', models.BigIntegerField(default=0)),
+                ('total_cost', models.DecimalField(decimal_places=10, default=0, max_digits=20)),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ai_usage_daily', to='users.company')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ai_usage_daily', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='feedbackas__date_8148aa_idx'), models.Index(fields=['company', 'date'], name='feedbackas__company_e8a74e_idx')],
+                'unique_together': {('date', 'company', 'user', 'request_type', 'model_name')},
+            },
+        ),
+        migrations.RunPython(build_daily_usage, migrations.RunPython.noop),
+    ]
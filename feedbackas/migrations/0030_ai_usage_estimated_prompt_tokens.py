@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedbackas', '0029_ai_usage_daily'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='estimated_prompt_tokens',
+            field=models.PositiveIntegerField(blank=True, help_text='Prompto žetonų įvertis prieš siunčiant (feedbackas.prompt_builder)', null=True),
+        ),
+    ]
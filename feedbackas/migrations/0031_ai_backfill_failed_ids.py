@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedbackas', '0030_ai_usage_estimated_prompt_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aibackfillcheckpoint',
+            name='failed_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
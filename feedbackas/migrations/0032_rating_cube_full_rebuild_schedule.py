@@ -0,0 +1,42 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:40
+
+from django.db import migrations
+
+
+def create_full_rebuild_schedule(apps, schema_editor):
+    """
+    Kas naktį (02:00) visas įvertinimų kubas perskaičiuojamas iš naujo: inkrementinis
+    atnaujinimas nemato ištrintų atsiliepimų ir darbuotojų perkėlimų tarp padalinių/įmonių.
+    """
+    import datetime
+    from django.utils import timezone
+
+    Schedule = apps.get_model('django_q', 'Schedule')
+    tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+    Schedule.objects.update_or_create(
+        func='feedbackas.services.refresh_rating_cube_task',
+        kwargs='full=True',
+        defaults={
+            'name': 'Įvertinimų kubo pilnas perskaičiavimas',
+            'schedule_type': 'D',
+            'repeats': -1,
+            'next_run': timezone.make_aware(datetime.datetime.combine(tomorrow, datetime.time(2, 0))),
+        },
+    )
+
+
+def delete_full_rebuild_schedule(apps, schema_editor):
+    Schedule = apps.get_model('django_q', 'Schedule')
+    Schedule.objects.filter(func='feedbackas.services.refresh_rating_cube_task', kwargs='full=True').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedbackas', '0031_ai_backfill_failed_ids'),
+        ('django_q', '0014_schedule_cluster'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_full_rebuild_schedule, delete_full_rebuild_schedule),
+    ]
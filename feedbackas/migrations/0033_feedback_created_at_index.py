@@ -0,0 +1,17 @@
+# Generated by Django 4.2.2 on 2026-10-18 14:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedbackas', '0032_rating_cube_full_rebuild_schedule'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['created_at'], name='feedbackas__created_46c107_idx'),
+        ),
+    ]
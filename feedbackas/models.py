@@ -1,3 +1,6 @@
+import json
+import zlib
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -13,6 +16,9 @@ class FeedbackRequest(models.Model):
     is_self_initiated = models.BooleanField(default=False, help_text='True jei atsiliepimas inicijuotas paties vertintojo, o ne paprašytas')
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [models.Index(fields=['questionnaire', 'status'])]
+
     def __str__(self):
         return f"Feedback request from {self.requester} to {self.requested_to} for {self.project_name}"
 
@@ -35,9 +41,106 @@ class Feedback(models.Model):
     extracted_strengths = models.JSONField(default=list, blank=True)
     extracted_improvements = models.JSONField(default=list, blank=True)
 
+    class Meta:
+        # Inkrementinis įvertinimų kubo atnaujinimas (feedbackas.cube) filtruoja pagal created_at
+        indexes = [models.Index(fields=['created_at'])]
+
     def __str__(self):
         return f"Feedback for {self.feedback_request}"
 
+# Kompetencijų raktai ir atitinkami Feedback laukai (naudojami suvestinėse ir analitikoje)
+COMPETENCY_FIELDS = (
+    ('teamwork', 'teamwork_rating'),
+    ('communication', 'communication_rating'),
+    ('initiative', 'initiative_rating'),
+    ('technical_skills', 'technical_skills_rating'),
+    ('problem_solving', 'problem_solving_rating'),
+)
+
+# Sumų laukai, bendri visoms įvertinimų suvestinėms
+RATING_TOTAL_FIELDS = ('feedback_count', 'rating_sum') + tuple(f'{key}_sum' for key, _ in COMPETENCY_FIELDS)
+
+class RatingTotals(models.Model):
+    """Bendri atsiliepimų skaičiaus ir balų sumų laukai suvestinėms."""
+    feedback_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.BigIntegerField(default=0)
+    teamwork_sum = models.BigIntegerField(default=0)
+    communication_sum = models.BigIntegerField(default=0)
+    initiative_sum = models.BigIntegerField(default=0)
+    technical_skills_sum = models.BigIntegerField(default=0)
+    problem_solving_sum = models.BigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def avg_rating(self):
+        if not self.feedback_count:
+            return 0
+        return self.rating_sum / self.feedback_count
+
+    def competency_averages(self):
+        """Grąžina {'teamwork': vidurkis, ...} toks pat formatas kaip Avg() agregacijos."""
+        if not self.feedback_count:
+            return {key: None for key, _ in COMPETENCY_FIELDS}
+        return {
+            key: getattr(self, f'{key}_sum') / self.feedback_count
+            for key, _ in COMPETENCY_FIELDS
+        }
+
+class UserRatingSummary(RatingTotals):
+    """
+    Vartotojo gautų (užbaigtų) atsiliepimų suvestinė.
+    Atnaujinama inkrementiškai, kai prašymas tampa 'completed',
+    todėl statistikai nereikia perskaičiuoti visos istorijos.
+    Perskaičiuoti iš naujo: manage.py rebuild_rating_summaries
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='rating_summary')
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.user} – {self.feedback_count} atsiliepimų"
+
+class UserRatingMonthlyBucket(RatingTotals):
+    """
+    Vartotojo gautų atsiliepimų sumos vienam kalendoriniam mėnesiui
+    (pagal prašymo sukūrimo datą). Laikotarpio filtrai rezultatų puslapyje
+    (mėnuo / ketvirtis / metai) sudeda ne daugiau kaip 12 tokių eilučių.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='rating_buckets')
+    month = models.DateField(help_text="Mėnesio pirma diena")
+
+    class Meta:
+        unique_together = ('user', 'month')
+
+    def __str__(self):
+        return f"{self.user} {self.month:%Y-%m} – {self.feedback_count} atsiliepimų"
+
+class Keyword(models.Model):
+    """
+    Normalizuotas raktinis žodis iš Feedback.keywords.
+    Tas pats žodis skirtingomis raidėmis (pvz. „Lyderystė“ ir „lyderystė“) saugomas vieną kartą.
+    """
+    name = models.CharField(max_length=255)
+    normalized = models.CharField(max_length=255, unique=True)
+
+    def __str__(self):
+        return self.name
+
+class FeedbackKeyword(models.Model):
+    """
+    Atsiliepimo ir raktinio žodžio ryšys. Pildomas išsaugant atsiliepimą,
+    perskaičiuoti iš naujo: manage.py rebuild_keyword_index
+    """
+    feedback = models.ForeignKey(Feedback, on_delete=models.CASCADE, related_name='keyword_links')
+    keyword = models.ForeignKey(Keyword, on_delete=models.CASCADE, related_name='feedback_links')
+
+    class Meta:
+        unique_together = ('feedback', 'keyword')
+
+    def __str__(self):
+        return f"{self.keyword} (Feedback #{self.feedback_id})"
+
 class Trait(models.Model):
     name = models.CharField(max_length=100, unique=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='created_traits')
@@ -67,20 +170,176 @@ class TraitRating(models.Model):
     def __str__(self):
         return f"{self.trait.name}: {self.rating} (Feedback #{self.feedback.id})"
 
+class TraitDailyAggregate(models.Model):
+    """
+    Klausimyno savybės įvertinimų suma ir kiekis vienai dienai (pagal prašymo sukūrimo datą).
+    Atnaujinama išsaugant TraitRating (fill_feedback), todėl klausimyno statistikai
+    užtenka kelių eilučių. Perskaičiuoti: manage.py rebuild_trait_aggregates
+    """
+    questionnaire = models.ForeignKey(Questionnaire, on_delete=models.CASCADE, related_name='trait_daily_aggregates')
+    trait = models.ForeignKey(Trait, on_delete=models.CASCADE, related_name='daily_aggregates')
+    date = models.DateField()
+    rating_sum = models.BigIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('questionnaire', 'trait', 'date')
+
+    def __str__(self):
+        return f"{self.questionnaire} / {self.trait} {self.date}: {self.rating_sum}/{self.rating_count}"
+
+class RatingCube(models.Model):
+    """
+    Iš anksto agreguotas įvertinimų kubas: įmonė × padalinys × kompetencija/savybė × mėnuo.
+    Matai – suma, kiekis ir kvadratų suma (vidurkiui ir standartiniam nuokrypiui).
+    Kompetencijos eilutėje užpildytas `competency` (pvz. 'rating', 'teamwork'),
+    klausimyno savybės eilutėje – `trait`. Atnaujinamas django-q užduotimi (feedbackas.cube).
+    """
+    company = models.ForeignKey('users.Company', on_delete=models.CASCADE, related_name='rating_cube')
+    department = models.ForeignKey('users.Department', on_delete=models.CASCADE, null=True, blank=True, related_name='rating_cube')
+    competency = models.CharField(max_length=32, blank=True, default='')
+    trait = models.ForeignKey(Trait, on_delete=models.CASCADE, null=True, blank=True, related_name='rating_cube')
+    month = models.DateField(help_text="Mėnesio pirma diena")
+    rating_sum = models.BigIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sq_sum = models.BigIntegerField(default=0)
+    refreshed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'month']),
+            models.Index(fields=['refreshed_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.company_id}/{self.department_id}/{self.competency or self.trait_id} {self.month:%Y-%m}"
+
+class PlatformDailyMetrics(models.Model):
+    """
+    Dienos platformos rodiklių momentinė nuotrauka vienai įmonei (company=None – vartotojai be įmonės).
+    Pildoma kas naktį django-q užduotimi (feedbackas.platform_metrics), todėl superadmin
+    statistika skaito tik pasirinktą datų intervalą. Užpildyti istoriją: manage.py backfill_platform_metrics
+    """
+    date = models.DateField()
+    company = models.ForeignKey('users.Company', on_delete=models.CASCADE, null=True, blank=True, related_name='daily_metrics')
+    registrations = models.PositiveIntegerField(default=0)
+    active_users = models.PositiveIntegerField(default=0, help_text="Paskutinis žinomas aktyvių darbuotojų skaičius dienos pabaigoje")
+    completed_feedback = models.PositiveIntegerField(default=0)
+    ai_cost = models.DecimalField(max_digits=15, decimal_places=10, default=0)
+
+    class Meta:
+        unique_together = ('date', 'company')
+        indexes = [models.Index(fields=['company', 'date'])]
+
+    def __str__(self):
+        return f"{self.company_id or '-'} {self.date}"
+
+class AIResponseArchive(models.Model):
+    """
+    Suspaustas (zlib) OpenRouter atsakymo JSON, iškeltas iš AIUsageLog, kad žurnalo
+    lentelė liktų siaura. Saugojimo politika (atranka, apkarpymas) – feedbackas.usage_log.
+    """
+    data = models.BinaryField()
+    original_size = models.PositiveIntegerField(help_text="Nesuspausto JSON dydis baitais")
+    truncated = models.BooleanField(default=False, help_text="Atsakymo tekstas apkarpytas pagal politiką")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def load(self):
+        """Išskleistas atsakymo JSON."""
+        return json.loads(zlib.decompress(bytes(self.data)))
+
+    def __str__(self):
+        return f"#{self.pk} ({len(self.data)}/{self.original_size} B)"
+
 class AIUsageLog(models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='ai_usage_logs')
     company = models.ForeignKey('users.Company', on_delete=models.SET_NULL, null=True, blank=True, related_name='ai_usage_logs')
     request_type = models.CharField(max_length=100, help_text="Pvž., 'feedback_generation', 'feedback_analysis'")
     model_name = models.CharField(max_length=100)
     prompt_tokens = models.IntegerField(default=0)
+    estimated_prompt_tokens = models.PositiveIntegerField(null=True, blank=True, help_text="Prompto žetonų įvertis prieš siunčiant (feedbackas.prompt_builder)")
     completion_tokens = models.IntegerField(default=0)
     total_cost = models.DecimalField(max_digits=15, decimal_places=10, default=0.0)
-    raw_response = models.JSONField(blank=True, null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    latency_ms = models.PositiveIntegerField(null=True, blank=True, help_text="Užklausos trukmė su visais bandymais (ms)")
+    attempts = models.PositiveSmallIntegerField(default=1, help_text="Kiek kartų užklausa buvo siųsta")
+    raw_archive = models.ForeignKey(AIResponseArchive, on_delete=models.SET_NULL, null=True, blank=True, related_name='usage_logs')
+    # Įvykio laikas (ne įrašymo – žurnalas rašomas buferiu, feedbackas.usage_log)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['timestamp'])]
+
+    @property
+    def raw_response(self):
+        """Archyvuotas OpenRouter atsakymas arba None (jei nebuvo išsaugotas)."""
+        return self.raw_archive.load() if self.raw_archive_id else None
 
     def __str__(self):
         return f"{self.request_type} by {self.user} ({self.total_cost}$)"
 
+class AIUsageDaily(models.Model):
+    """
+    AIUsageLog dienos suvestinė: įmonė × vartotojas × užklausos tipas × modelis.
+    Atnaujinama tuo pačiu metu, kai įrašomas žurnalas (feedbackas.usage_log), todėl
+    kaštų ir užklausų ataskaitoms žurnalo eilučių skenuoti nereikia.
+    Perskaičiuoti: manage.py rebuild_ai_usage_daily
+    """
+    date = models.DateField()
+    # Kaip ir žurnale – ištrynus įmonę ar vartotoją kaštai lieka (be priskyrimo)
+    company = models.ForeignKey('users.Company', on_delete=models.SET_NULL, null=True, blank=True, related_name='ai_usage_daily')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='ai_usage_daily')
+    request_type = models.CharField(max_length=100)
+    model_name = models.CharField(max_length=100)
+    calls = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.BigIntegerField(default=0)
+    completion_tokens = models.BigIntegerField(default=0)
+    total_cost = models.DecimalField(max_digits=20, decimal_places=10, default=0)
+
+    class Meta:
+        unique_together = ('date', 'company', 'user', 'request_type', 'model_name')
+        indexes = [
+            models.Index(fields=['date']),
+            models.Index(fields=['company', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.company_id or '-'}/{self.user_id or '-'} {self.request_type}: {self.calls}"
+
+class AIExtractionCache(models.Model):
+    """
+    Ilgalaikė extract_strengths_weaknesses rezultatų kopija (feedbackas.extraction_cache).
+    Raktas – normalizuoto teksto, prompto versijos ir modelio SHA-256, todėl tas pats
+    įvestis LLM nesiunčiama antrą kartą net ir išvalius Redis.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    prompt_version = models.PositiveSmallIntegerField()
+    model_name = models.CharField(max_length=100)
+    result = models.JSONField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.key[:12]} v{self.prompt_version} ({self.hits} hits)"
+
+class AIBackfillCheckpoint(models.Model):
+    """
+    manage.py ai_backfill progresas: visi atsiliepimai iki last_id (imtinai) jau apdoroti,
+    išskyrus failed_ids, kurie kitame paleidime kartojami pirmiausia; nutrūkęs paleidimas
+    tęsiamas nuo last_id (feedbackas.ai_backfill).
+    """
+    name = models.CharField(max_length=100, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    failed_ids = models.JSONField(default=list, blank=True)
+    processed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name}: iki #{self.last_id} ({self.processed} apdorota)"
+
 class GlobalSettings(models.Model):
     personal_form_enabled = models.BooleanField(default=True, help_text="Įjungti 'Individuali forma' funkcionalumą visai platformai.")
     team_form_enabled = models.BooleanField(default=True, help_text="Įjungti 'Komandinė forma' funkcionalumą visai platformai.")
@@ -0,0 +1,368 @@
+"""
+HTTP klientas OpenRouter API.
+
+* Vienas procesui bendras requests.Session su jungčių telkiniu (keep-alive),
+  todėl TCP/TLS rankos paspaudimas nekartojamas kiekvienai užklausai.
+* Atskiri prisijungimo ir skaitymo laiko limitai.
+* 429 ir 5xx bei ryšio klaidos kartojamos su eksponentiniu atsitraukimu ir
+  atsitiktiniu išsklaidymu (jitter); Retry-After antraštė gerbiama.
+* Grandinės pertraukiklis (circuit breaker): po kelių iš eilės nepavykusių
+  užklausų kurį laiką iškart grąžinama CircuitOpenError, kol tiekėjas atsigaus.
+* Kiekvienos užklausos trukmė ir bandymų skaičius grąžinami (CallMetrics) ir
+  kaupiami procese (latency_stats()).
+* Srautinis režimas (stream_chat_completion) – turinio fragmentai grąžinami, kai tik atkeliauja.
+
+Nustatymai (settings, visi neprivalomi): OPENROUTER_CONNECT_TIMEOUT,
+OPENROUTER_READ_TIMEOUT, OPENROUTER_TOTAL_TIMEOUT, OPENROUTER_MAX_RETRIES,
+OPENROUTER_BACKOFF_BASE, OPENROUTER_BACKOFF_MAX, OPENROUTER_CIRCUIT_FAILURES,
+OPENROUTER_CIRCUIT_RESET, OPENROUTER_POOL_SIZE. Bendra užklausų riba –
+OPENROUTER_RATE_PER_MINUTE (feedbackas.rate_limit).
+"""
+import email.utils
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .rate_limit import throttle_openrouter_call
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_URL = 'https://openrouter.ai/api/v1/chat/completions'
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+LATENCY_WINDOW = 500
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Tiekėjas laikomas nepasiekiamu – užklausa nesiunčiama."""
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class CircuitBreaker:
+    """
+    Paprastas gijoms saugus grandinės pertraukiklis.
+    closed → (failure_threshold nesėkmių iš eilės) → open → (reset_timeout) → half-open:
+    praleidžiama viena bandomoji užklausa; sėkmė uždaro grandinę, nesėkmė vėl atidaro.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        """Iškelia CircuitOpenError, jei užklausos siųsti negalima."""
+        with self._lock:
+            state = self._state()
+            if state == 'open' or (state == 'half-open' and self._probe_in_flight):
+                raise CircuitOpenError('OpenRouter laikinai nepasiekiamas (grandinės pertraukiklis atidarytas).')
+            if state == 'half-open':
+                self._probe_in_flight = True
+
+    def release_probe(self):
+        """Atlaisvina bandomosios užklausos vietą, kai jos baigtis nežinoma (netikėta išimtis)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+                logger.warning(f"OpenRouter circuit opened after {self._failures} consecutive failures")
+
+
+@dataclass
+class CallMetrics:
+    """Vienos užklausos metrikos."""
+    latency_ms: int
+    attempts: int
+    status_code: int = None
+
+
+_session = None
+_session_lock = threading.Lock()
+_breaker = None
+_latencies = deque(maxlen=LATENCY_WINDOW)
+_counters = {'calls': 0, 'failures': 0, 'retries': 0, 'short_circuited': 0}
+_metrics_lock = threading.Lock()
+
+
+def get_session():
+    """Procesui bendra sesija su jungčių telkiniu (kuriama tingiai, vieną kartą)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = _setting('OPENROUTER_POOL_SIZE', 10)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def get_breaker():
+    global _breaker
+    if _breaker is None:
+        with _session_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    failure_threshold=_setting('OPENROUTER_CIRCUIT_FAILURES', 5),
+                    reset_timeout=_setting('OPENROUTER_CIRCUIT_RESET', 30.0),
+                )
+    return _breaker
+
+
+def retry_after_seconds(response):
+    """Retry-After reikšmė sekundėmis (skaičius arba HTTP data), None – jei nėra."""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+def backoff_delay(attempt, response=None):
+    """Laukimas prieš kitą bandymą: Retry-After arba eksponentinis su pilnu jitter."""
+    cap = _setting('OPENROUTER_BACKOFF_MAX', 20.0)
+    retry_after = retry_after_seconds(response)
+    if retry_after is not None:
+        return min(retry_after, cap)
+    base = _setting('OPENROUTER_BACKOFF_BASE', 0.5)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _record(latency_ms, attempts, failed, short_circuited=False):
+    with _metrics_lock:
+        _counters['calls'] += 1
+        _counters['retries'] += max(attempts - 1, 0)
+        if failed:
+            _counters['failures'] += 1
+        if short_circuited:
+            _counters['short_circuited'] += 1
+        else:
+            _latencies.append(latency_ms)
+
+
+def latency_stats():
+    """Proceso metrikos: užklausų, klaidų, pakartojimų skaičiai ir paskutinių užklausų p50/p95 (ms)."""
+    with _metrics_lock:
+        latencies = sorted(_latencies)
+        stats = dict(_counters)
+    if latencies:
+        stats['p50_ms'] = latencies[len(latencies) // 2]
+        stats['p95_ms'] = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+    else:
+        stats['p50_ms'] = stats['p95_ms'] = None
+    stats['circuit'] = get_breaker().state
+    return stats
+
+
+def _send(headers, payload, sleep, stream=False):
+    """
+    Siunčia užklausą per bendrą sesiją su pakartojimais ir grandinės pertraukikliu.
+    Grąžina (sėkmingas atsakymas, pradžios laikas, bandymų skaičius); klaidos – requests išimtys.
+    """
+    breaker = get_breaker()
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        _record(0, 0, failed=True, short_circuited=True)
+        raise
+    started = time.monotonic()
+
+    connect_timeout = _setting('OPENROUTER_CONNECT_TIMEOUT', 5.0)
+    read_timeout = _setting('OPENROUTER_READ_TIMEOUT', 60.0)
+    max_retries = _setting('OPENROUTER_MAX_RETRIES', 3)
+    # Bendras terminas visiems bandymams, kad neviršytume django-q užduoties limito
+    deadline = started + _setting('OPENROUTER_TOTAL_TIMEOUT', 100.0)
+    session = get_session()
+    attempt = 0
+    try:
+        while True:
+            response = None
+            error = None
+            # Bendras Redis žetonų kibiras – kiekvienam bandymui, ir pakartojimui po 429;
+            # laukimas į užklausos trukmę ir bendrą terminą neįskaičiuojamas
+            throttled = time.monotonic()
+            throttle_openrouter_call()
+            waited = time.monotonic() - throttled
+            started += waited
+            deadline += waited
+            remaining = max(deadline - time.monotonic(), 1.0)
+            try:
+                response = session.post(
+                    OPENROUTER_URL, headers=headers, json=payload, stream=stream,
+                    timeout=(connect_timeout, min(read_timeout, remaining)),
+                )
+            except requests.exceptions.RequestException as e:
+                # Ir ChunkedEncodingError, TooManyRedirects ir pan. – grandinė turi sužinoti baigtį
+                error = e
+
+            if error is not None:
+                retryable = isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+            else:
+                retryable = response.status_code in RETRY_STATUSES
+            if not retryable or attempt >= max_retries:
+                break
+            delay = backoff_delay(attempt, response)
+            if time.monotonic() + delay >= deadline:
+                break
+            logger.info(
+                f"OpenRouter attempt {attempt + 1} failed "
+                f"({error or response.status_code}), retrying in {delay:.2f}s"
+            )
+            if response is not None:
+                response.close()
+            sleep(delay)
+            attempt += 1
+    except BaseException:
+        # Netikėta išimtis (ne requests) – bandomoji vieta neturi likti užimta
+        breaker.release_probe()
+        raise
+
+    attempts = attempt + 1
+    # Tiekėjo gedimas (ryšio/protokolo klaida, 429/5xx po visų bandymų) atidaro grandinę; kitos 4xx – ne
+    if error is not None or response.status_code in RETRY_STATUSES:
+        breaker.record_failure()
+        _record(int((time.monotonic() - started) * 1000), attempts, failed=True)
+        if error is not None:
+            raise error
+        response.raise_for_status()
+
+    breaker.record_success()
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError:
+        _record(int((time.monotonic() - started) * 1000), attempts, failed=True)
+        raise
+    return response, started, attempts
+
+
+def post_chat_completion(headers, payload, sleep=time.sleep):
+    """
+    Siunčia užklausą į OpenRouter per bendrą sesiją su pakartojimais.
+    Grąžina (atsakymo JSON, CallMetrics). Klaidos – requests išimtys
+    (HTTPError, Timeout, ConnectionError arba CircuitOpenError).
+    """
+    response, started, attempts = _send(headers, payload, sleep)
+    latency_ms = int((time.monotonic() - started) * 1000)
+    _record(latency_ms, attempts, failed=False)
+    logger.info(f"OpenRouter call: {latency_ms} ms, {attempts} attempt(s)")
+    return response.json(), CallMetrics(latency_ms=latency_ms, attempts=attempts, status_code=response.status_code)
+
+
+class StreamError(requests.exceptions.RequestException):
+    """Tiekėjas nutraukė srautą klaida (SSE įvykis su "error")."""
+
+
+class ChatStream:
+    """
+    Srautinis (stream: true) OpenRouter atsakymas. Iteruojant grąžinami turinio
+    fragmentai, kai tik jie atkeliauja. Srautui pasibaigus užpildomi text, usage,
+    model ir metrics (usage – tik jei tiekėjas jį atsiuntė paskutiniame įvykyje).
+    """
+
+    def __init__(self, response, started, attempts):
+        self._response = response
+        self._started = started
+        self.attempts = attempts
+        self.first_chunk_ms = None
+        self.completed = False
+        self.usage = None
+        self.model = None
+        self.response_id = None
+        self.metrics = None
+        self._parts = []
+
+    @property
+    def text(self):
+        return ''.join(self._parts)
+
+    def __iter__(self):
+        failed = True
+        # SSE antraštėje koduotė dažnai nenurodyta – kitaip requests naudotų ISO-8859-1
+        self._response.encoding = 'utf-8'
+        try:
+            for line in self._response.iter_lines(chunk_size=None, decode_unicode=True):
+                # Tušti ir komentarų (": OPENROUTER PROCESSING") įvykiai praleidžiami
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                if chunk.get('error'):
+                    raise StreamError(f"OpenRouter stream error: {chunk['error']}")
+                self.model = chunk.get('model') or self.model
+                self.response_id = chunk.get('id') or self.response_id
+                if chunk.get('usage'):
+                    self.usage = chunk['usage']
+                for choice in chunk.get('choices') or ():
+                    content = (choice.get('delta') or {}).get('content')
+                    if content:
+                        if self.first_chunk_ms is None:
+                            self.first_chunk_ms = int((time.monotonic() - self._started) * 1000)
+                        self._parts.append(content)
+                        yield content
+            self.completed = True
+            failed = False
+        finally:
+            self._response.close()
+            latency_ms = int((time.monotonic() - self._started) * 1000)
+            self.metrics = CallMetrics(
+                latency_ms=latency_ms, attempts=self.attempts, status_code=self._response.status_code,
+            )
+            _record(latency_ms, self.attempts, failed=failed)
+
+
+def stream_chat_completion(headers, payload, sleep=time.sleep):
+    """
+    Kaip post_chat_completion, bet su stream: true; pakartojama tik iki atsakymo pradžios.
+    Grąžina ChatStream.
+    """
+    payload = {**payload, 'stream': True, 'usage': {'include': True}}
+    response, started, attempts = _send(headers, payload, sleep, stream=True)
+    return ChatStream(response, started, attempts)
@@ -0,0 +1,149 @@
+"""
+Dienos platformos rodiklių nuotraukos (PlatformDailyMetrics).
+
+Kiekvienai dienai ir įmonei saugomos registracijos, aktyvių darbuotojų skaičius,
+atliktų apklausų skaičius ir AI kaina. Nuotraukos perskaičiuojamos kas naktį
+(feedbackas.services.snapshot_platform_metrics_task), o superadmin statistika
+skaito tik pasirinktą datų intervalą. Istorijos užpildymas:
+manage.py backfill_platform_metrics
+"""
+import datetime
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from users.models import Company, EmployeeCountLog
+from .models import AIUsageDaily, Feedback, PlatformDailyMetrics
+
+METRIC_FIELDS = ('registrations', 'active_users', 'completed_feedback', 'ai_cost')
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def _daily_counts(queryset, date_field, company_field, aggregate, start, end):
+    """{(data, įmonės id): reikšmė} intervalui [start, end] – viena grupuota užklausa."""
+    rows = (
+        queryset.filter(**{
+            f'{date_field}__gte': _day_start(start),
+            f'{date_field}__lt': _day_start(end + datetime.timedelta(days=1)),
+        })
+        .annotate(day=TruncDate(date_field))
+        .values('day', company_field)
+        .annotate(total=aggregate)
+        .values_list('day', company_field, 'total')
+        .order_by()
+    )
+    return {(day, company_id): total or 0 for day, company_id, total in rows}
+
+
+def _daily_ai_cost(start, end):
+    """{(data, įmonės id): AI kaina} iš AIUsageDaily – žurnalo eilutės neskenuojamos."""
+    rows = (
+        AIUsageDaily.objects.filter(date__gte=start, date__lte=end)
+        .values('date', 'company_id')
+        .annotate(total=Sum('total_cost'))
+        .values_list('date', 'company_id', 'total')
+        .order_by()
+    )
+    return {(day, company_id): total or 0 for day, company_id, total in rows}
+
+
+def _active_users(start, end):
+    """
+    Aktyvių darbuotojų skaičius kiekvienos dienos pabaigoje: paskutinis EmployeeCountLog
+    įrašas tą dieną arba, jei jo nėra, perkeltas iš ankstesnės dienos.
+    """
+    carried = dict(
+        Company.objects.annotate(
+            last_count=Subquery(
+                EmployeeCountLog.objects.filter(company=OuterRef('pk'), recorded_at__lt=_day_start(start))
+                .order_by('-recorded_at').values('active_count')[:1]
+            )
+        ).filter(last_count__isnull=False).values_list('id', 'last_count')
+    )
+    logged = defaultdict(dict)
+    for company_id, recorded_at, active_count in (
+        EmployeeCountLog.objects.filter(
+            recorded_at__gte=_day_start(start),
+            recorded_at__lt=_day_start(end + datetime.timedelta(days=1)),
+        ).order_by('recorded_at').values_list('company_id', 'recorded_at', 'active_count')
+    ):
+        logged[timezone.localdate(recorded_at)][company_id] = active_count
+
+    result = {}
+    day = start
+    while day <= end:
+        carried.update(logged.get(day, {}))
+        for company_id, active_count in carried.items():
+            result[(day, company_id)] = active_count
+        day += datetime.timedelta(days=1)
+    return result
+
+
+def snapshot_platform_metrics(start, end):
+    """
+    Perskaičiuoja nuotraukas dienoms [start, end] (imtinai) ir grąžina sukurtų eilučių skaičių.
+    Kartojant tą patį intervalą rezultatas nesikeičia.
+    """
+    metrics = {
+        'registrations': _daily_counts(
+            User.objects.all(), 'date_joined', 'profile__company_link', Count('id'), start, end,
+        ),
+        'completed_feedback': _daily_counts(
+            Feedback.objects.all(), 'created_at', 'feedback_request__requested_to__profile__company_link',
+            Count('id'), start, end,
+        ),
+        'ai_cost': _daily_ai_cost(start, end),
+        'active_users': _active_users(start, end),
+    }
+
+    rows = defaultdict(dict)
+    for field, values in metrics.items():
+        for key, value in values.items():
+            if value:
+                rows[key][field] = value
+
+    snapshots = [
+        PlatformDailyMetrics(date=day, company_id=company_id, **values)
+        for (day, company_id), values in sorted(rows.items(), key=lambda item: (item[0][0], item[0][1] or 0))
+    ]
+    with transaction.atomic():
+        PlatformDailyMetrics.objects.filter(date__gte=start, date__lte=end).delete()
+        PlatformDailyMetrics.objects.bulk_create(snapshots, batch_size=1000)
+    return len(snapshots)
+
+
+def first_activity_date():
+    """Anksčiausia data, nuo kurios verta pildyti nuotraukas (pirmo vartotojo registracija)."""
+    first = User.objects.order_by('date_joined').values_list('date_joined', flat=True).first()
+    return timezone.localdate(first) if first else timezone.localdate()
+
+
+def platform_metrics_series(start, end, company_id=None):
+    """
+    Dienos eilutės intervalui [start, end] iš nuotraukų lentelės – viena grupuota užklausa.
+    Grąžina sąrašą {'date', 'registrations', 'active_users', 'completed_feedback', 'ai_cost'}.
+    """
+    snapshots = PlatformDailyMetrics.objects.filter(date__gte=start, date__lte=end)
+    if company_id:
+        snapshots = snapshots.filter(company_id=company_id)
+    rows = (
+        snapshots.values('date')
+        .annotate(**{field: Sum(field) for field in METRIC_FIELDS})
+        .order_by('date')
+    )
+    return [{'date': row['date'], **{field: row[field] or 0 for field in METRIC_FIELDS}} for row in rows]
+
+
+def registrations_before(day, company_id=None):
+    """Registracijų skaičius iki nurodytos dienos – kaupiamosios kreivės pradžios taškas."""
+    snapshots = PlatformDailyMetrics.objects.filter(date__lt=day)
+    if company_id:
+        snapshots = snapshots.filter(company_id=company_id)
+    return snapshots.aggregate(total=Sum('registrations'))['total'] or 0
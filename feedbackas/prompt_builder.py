@@ -0,0 +1,106 @@
+"""
+Promptų šablonai ir žetonų biudžetai.
+
+Šablonai sunorminami vieną kartą (modulio įkėlimo metu): be įtraukų, be tarpų
+eilučių galuose ir be pasikartojančių tuščių eilučių. Vartotojo įvestis
+(komentarai, papildomas kontekstas, raktiniai žodžiai) apribojama sekcijos žetonų
+biudžetu: pirmiausia pašalinami pasikartojantys sakiniai, o jei to neužtenka,
+tekstas sutrumpinamas ties sakinio (kraštutiniu atveju – žodžio) riba.
+
+Žetonai skaičiuojami apytiksliai (estimate_tokens), be tokenizerio priklausomybės.
+Įvertis saugomas AIUsageLog.estimated_prompt_tokens šalia tikrojo prompt_tokens,
+todėl AI_PROMPT_CHARS_PER_TOKEN galima patikslinti pagal realius duomenis.
+"""
+import math
+import re
+
+from django.conf import settings
+
+# Vidutinis žodžio simbolių skaičius vienam žetonui (lietuviškas tekstas skaidomas smulkiau nei angliškas)
+CHARS_PER_TOKEN = getattr(settings, 'AI_PROMPT_CHARS_PER_TOKEN', 3.0)
+TRUNCATION_MARK = '[…]'
+
+_PIECES = re.compile(r'\w+|[^\w\s]')
+_SENTENCES = re.compile(r'(?<=[.!?…])\s+|\n+')
+
+
+def estimate_tokens(text):
+    """
+    Apytikslis žetonų skaičius: žodis – ceil(ilgis / CHARS_PER_TOKEN),
+    kiekvienas skyrybos ženklas ar simbolis (įskaitant emoji) – vienas žetonas.
+    """
+    if not text:
+        return 0
+    return sum(
+        math.ceil(len(piece) / CHARS_PER_TOKEN) if piece[0].isalnum() or piece[0] == '_' else 1
+        for piece in _PIECES.findall(text)
+    )
+
+
+def compact_template(template):
+    """Sunormina šablono tarpus: eilutės be įtraukų, ne daugiau vienos tuščios eilutės iš eilės."""
+    lines = [re.sub(r'[ \t]+', ' ', line).strip() for line in template.strip().splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines))
+
+
+def normalize_input(text):
+    """Vartotojo tekstas be perteklinių tarpų ir tuščių eilučių."""
+    if not text:
+        return text
+    return compact_template(text)
+
+
+def _cut_words(text, budget):
+    """Tiek pirmųjų žodžių, kiek telpa į biudžetą."""
+    kept, used = [], 0
+    for word in text.split():
+        cost = estimate_tokens(word)
+        if used + cost > budget:
+            break
+        kept.append(word)
+        used += cost
+    return ' '.join(kept)
+
+
+def fit_to_budget(text, budget):
+    """
+    Sutrumpina tekstą iki `budget` žetonų (pagal estimate_tokens).
+    Telpantis tekstas grąžinamas tik sunormintais tarpais; kitaip išmetami
+    pasikartojantys sakiniai, o likę imami iš eilės, kol telpa, ir pažymimi TRUNCATION_MARK.
+    """
+    text = normalize_input(text)
+    if not text or estimate_tokens(text) <= budget:
+        return text
+
+    sentences, seen = [], set()
+    for sentence in _SENTENCES.split(text):
+        key = ' '.join(sentence.lower().split())
+        if key and key not in seen:
+            seen.add(key)
+            sentences.append(sentence.strip())
+    deduplicated = ' '.join(sentences)
+    if estimate_tokens(deduplicated) <= budget:
+        return deduplicated
+
+    budget -= estimate_tokens(TRUNCATION_MARK)
+    kept, used = [], 0
+    for sentence in sentences:
+        cost = estimate_tokens(sentence)
+        if used + cost > budget:
+            if not kept:
+                kept.append(_cut_words(sentence, budget))
+            break
+        kept.append(sentence)
+        used += cost
+    return ' '.join(filter(None, kept + [TRUNCATION_MARK]))
+
+
+def build_prompt(template, budgets, **values):
+    """
+    Užpildo sunormintą šabloną (str.format laukais). Reikšmės, kurioms `budgets`
+    nurodo žetonų biudžetą, paverčiamos tekstu (str) ir sutrumpinamos fit_to_budget.
+    """
+    for name, budget in budgets.items():
+        if values.get(name):
+            values[name] = fit_to_budget(str(values[name]), budget)
+    return template.format(**values)
@@ -0,0 +1,112 @@
+"""
+Bendras (Redis) žetonų kibiras OpenRouter užklausoms.
+
+Kibiras laikomas Redis, todėl jį dalijasi visi procesai ir serveriai. Papildymas ir
+paėmimas vykdomi vienu Lua skriptu (atomiškai, laikas – Redis TIME). Gyvos užklausos
+žetonus tik nurašo (kibiras gali nukristi žemiau nulio), o foniniai darbai bloke
+wait_for_tokens() laukia, kol žetonų atsiras – taip ai_backfill užleidžia kvotą gyvam
+srautui. Riba: OPENROUTER_RATE_PER_MINUTE (0 – neribojama).
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import redis
+from django.conf import settings
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local force = tonumber(ARGV[4])
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - updated, 0) * rate)
+local wait = 0
+if tokens >= requested or force == 1 then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) * 2 + 60)
+return tostring(wait)
+"""
+
+_local = threading.local()
+
+
+class TokenBucket:
+    """Žetonų kibiras Redis: rate_per_minute papildymo greitis, capacity – didžiausias pliūpsnis."""
+
+    def __init__(self, name, rate_per_minute, capacity=None, client=None):
+        self.key = f'token_bucket:{name}'
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1.0, self.rate * 10)
+        self._client = client
+        self._script = None
+
+    def _eval(self, tokens, force):
+        if self._script is None:
+            self._script = (self._client or get_redis()).register_script(_TOKEN_BUCKET_LUA)
+        return float(self._script(keys=[self.key], args=[self.rate, self.capacity, tokens, int(force)]))
+
+    def try_acquire(self, tokens=1):
+        """Paima žetonus, jei jų užtenka. Grąžina 0 arba kiek sekundžių dar palaukti."""
+        return self._eval(tokens, False)
+
+    def acquire(self, tokens=1, timeout=None, sleep=time.sleep):
+        """Laukia, kol pavyks paimti žetonus. Viršijus timeout – TimeoutError."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise TimeoutError(f'{self.key}: žetonų nepavyko gauti per {timeout} s')
+            sleep(wait)
+
+    def debit(self, tokens=1):
+        """Nurašo žetonus nelaukiant (kibiras gali tapti neigiamas)."""
+        self._eval(tokens, True)
+
+
+def get_openrouter_bucket():
+    """Bendras OpenRouter kibiras arba None, jei riba nenustatyta."""
+    rate = getattr(settings, 'OPENROUTER_RATE_PER_MINUTE', 0)
+    if not rate:
+        return None
+    return TokenBucket('openrouter', rate)
+
+
+@contextmanager
+def wait_for_tokens():
+    """Bloke siunčiamos OpenRouter užklausos laukia žetonų (foniniai darbai), o ne tik juos nurašo."""
+    previous = getattr(_local, 'blocking', False)
+    _local.blocking = True
+    try:
+        yield
+    finally:
+        _local.blocking = previous
+
+
+def throttle_openrouter_call():
+    """Kviečiama prieš kiekvieną OpenRouter užklausą. Redis klaida užklausos nestabdo."""
+    bucket = get_openrouter_bucket()
+    if bucket is None:
+        return
+    try:
+        if getattr(_local, 'blocking', False):
+            bucket.acquire()
+        else:
+            bucket.debit()
+    except redis.RedisError as e:
+        logger.warning(f"OpenRouter rate limiter unavailable: {e}")
@@ -0,0 +1,31 @@
+"""
+Redis prieiga: bendras procesų kešas (CACHES['shared']) ir tiesioginis klientas operacijoms,
+kurių Django kešas neturi (Lua skriptai, pub/sub). Klientas naudoja tą patį Redis kaip ir
+bendras kešas, jei nenurodytas REDIS_URL.
+"""
+import threading
+
+import redis
+from django.conf import settings
+from django.core.cache import caches
+
+SHARED_CACHE_ALIAS = 'shared'
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_redis():
+    """Procesui bendras Redis klientas (jungčių telkinys, saugus gijoms)."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                url = getattr(settings, 'REDIS_URL', None) or settings.CACHES[SHARED_CACHE_ALIAS]['LOCATION']
+                _client = redis.Redis.from_url(url)
+    return _client
+
+
+def shared_cache():
+    """Visiems procesams bendras kešas. Klaidos – redis.RedisError (kviečiantysis grįžta prie DB)."""
+    return caches[SHARED_CACHE_ALIAS]
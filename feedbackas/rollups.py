@@ -0,0 +1,289 @@
+"""
+Iš anksto suskaičiuotos (materializuotos) atsiliepimų ir AI naudojimo suvestinės.
+
+Suvestinės atnaujinamos inkrementiškai tuo metu, kai atsiliepimas užbaigiamas
+(AI naudojimo – kai įrašomas AIUsageLog), o pilnas perskaičiavimas atliekamas management komandomis.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from users.models import Profile
+from .models import (
+    COMPETENCY_FIELDS, AIUsageDaily, AIUsageLog, Feedback, TraitDailyAggregate, TraitRating,
+    UserRatingMonthlyBucket, UserRatingSummary,
+)
+
+
+def bucket_month(dt):
+    """Grąžina mėnesio krepšelio raktą (pirmą mėnesio dieną vietos laiku)."""
+    return timezone.localdate(dt).replace(day=1)
+
+
+def _summary_deltas(feedback, sign=1):
+    """Grąžina F() išraiškas, pridedančias (arba atimančias) vieno atsiliepimo balus."""
+    deltas = {
+        'feedback_count': F('feedback_count') + sign,
+        'rating_sum': F('rating_sum') + sign * feedback.rating,
+    }
+    for key, field in COMPETENCY_FIELDS:
+        deltas[f'{key}_sum'] = F(f'{key}_sum') + sign * getattr(feedback, field)
+    return deltas
+
+
+def _competency_sums():
+    return {f'{key}_sum': Sum(field) for key, field in COMPETENCY_FIELDS}
+
+
+def _invalidate_company_indexes(user_id):
+    """Išvalo prašytojo įmonės balų indeksą, kad percentiliai atsinaujintų iškart."""
+    from .services import invalidate_company_score_index
+
+    company_id = Profile.objects.filter(user_id=user_id).values_list('company_link_id', flat=True).first()
+    if company_id:
+        transaction.on_commit(lambda: invalidate_company_score_index(company_id))
+
+
+def record_completed_feedback(feedback):
+    """
+    Prideda užbaigtą atsiliepimą prie prašytojo suvestinės ir mėnesio krepšelio.
+    Kviečiama tik kartą, kai FeedbackRequest statusas tampa 'completed'.
+    """
+    feedback_request = feedback.feedback_request
+    user_id = feedback_request.requester_id
+    month = bucket_month(feedback_request.created_at)
+    with transaction.atomic():
+        UserRatingSummary.objects.get_or_create(user_id=user_id)
+        UserRatingSummary.objects.filter(user_id=user_id).update(
+            updated_at=timezone.now(), **_summary_deltas(feedback)
+        )
+        UserRatingMonthlyBucket.objects.get_or_create(user_id=user_id, month=month)
+        UserRatingMonthlyBucket.objects.filter(user_id=user_id, month=month).update(
+            **_summary_deltas(feedback)
+        )
+        _invalidate_company_indexes(user_id)
+
+
+def discard_completed_feedback(feedback):
+    """Atima ištrinamą užbaigtą atsiliepimą iš prašytojo suvestinės ir mėnesio krepšelio."""
+    feedback_request = feedback.feedback_request
+    user_id = feedback_request.requester_id
+    UserRatingSummary.objects.filter(user_id=user_id, feedback_count__gt=0).update(
+        updated_at=timezone.now(), **_summary_deltas(feedback, sign=-1)
+    )
+    UserRatingMonthlyBucket.objects.filter(
+        user_id=user_id, month=bucket_month(feedback_request.created_at), feedback_count__gt=0
+    ).update(**_summary_deltas(feedback, sign=-1))
+    _invalidate_company_indexes(user_id)
+
+
+def rebuild_user_rating_summaries(user_ids=None):
+    """
+    Perskaičiuoja suvestines iš visų užbaigtų atsiliepimų.
+    Jei nurodyti user_ids – perskaičiuojami tik šie vartotojai.
+    Grąžina sukurtų suvestinių skaičių.
+    """
+    feedbacks = Feedback.objects.filter(feedback_request__status='completed')
+    summaries = UserRatingSummary.objects.all()
+    if user_ids is not None:
+        feedbacks = feedbacks.filter(feedback_request__requester_id__in=user_ids)
+        summaries = summaries.filter(user_id__in=user_ids)
+
+    rows = (
+        feedbacks.values('feedback_request__requester_id')
+        .annotate(feedback_count=Count('id'), rating_sum=Sum('rating'), **_competency_sums())
+        .order_by()
+    )
+
+    now = timezone.now()
+    new_summaries = [
+        UserRatingSummary(
+            user_id=row.pop('feedback_request__requester_id'),
+            updated_at=now,
+            **row,
+        )
+        for row in rows
+    ]
+
+    with transaction.atomic():
+        summaries.delete()
+        UserRatingSummary.objects.bulk_create(new_summaries, batch_size=1000)
+    return len(new_summaries)
+
+
+def rebuild_user_rating_buckets(user_ids=None):
+    """
+    Perskaičiuoja mėnesių krepšelius iš visų užbaigtų atsiliepimų.
+    Grąžina sukurtų krepšelių skaičių.
+    """
+    feedbacks = Feedback.objects.filter(feedback_request__status='completed')
+    buckets = UserRatingMonthlyBucket.objects.all()
+    if user_ids is not None:
+        feedbacks = feedbacks.filter(feedback_request__requester_id__in=user_ids)
+        buckets = buckets.filter(user_id__in=user_ids)
+
+    rows = (
+        feedbacks.annotate(month=TruncMonth('feedback_request__created_at', output_field=DateField()))
+        .values('feedback_request__requester_id', 'month')
+        .annotate(feedback_count=Count('id'), rating_sum=Sum('rating'), **_competency_sums())
+        .order_by()
+    )
+    new_buckets = [
+        UserRatingMonthlyBucket(user_id=row.pop('feedback_request__requester_id'), **row)
+        for row in rows
+    ]
+
+    with transaction.atomic():
+        buckets.delete()
+        UserRatingMonthlyBucket.objects.bulk_create(new_buckets, batch_size=1000)
+    return len(new_buckets)
+
+
+def record_trait_rating(feedback_request, trait_id, rating_delta, count_delta=1):
+    """
+    Prideda savybės įvertinimą (arba jo pokytį) prie klausimyno dienos suvestinės.
+    Naujam įvertinimui count_delta=1, pakeistam – 0, ištrintam – -1.
+    """
+    if not feedback_request.questionnaire_id:
+        return
+    day = timezone.localdate(feedback_request.created_at)
+    lookup = {'questionnaire_id': feedback_request.questionnaire_id, 'trait_id': trait_id, 'date': day}
+    with transaction.atomic():
+        TraitDailyAggregate.objects.get_or_create(**lookup)
+        TraitDailyAggregate.objects.filter(**lookup).update(
+            rating_sum=F('rating_sum') + rating_delta,
+            rating_count=F('rating_count') + count_delta,
+        )
+
+
+def discard_trait_rating(trait_rating):
+    """
+    Atima ištrinamą savybės įvertinimą iš klausimyno dienos suvestinės.
+    Tik UPDATE: ištrynimas niekada nesukuria naujos suvestinės eilutės.
+    """
+    questionnaire_id, created_at = Feedback.objects.filter(pk=trait_rating.feedback_id).values_list(
+        'feedback_request__questionnaire_id', 'feedback_request__created_at'
+    ).first() or (None, None)
+    if not questionnaire_id:
+        return
+    TraitDailyAggregate.objects.filter(
+        questionnaire_id=questionnaire_id, trait_id=trait_rating.trait_id,
+        date=timezone.localdate(created_at), rating_count__gt=0,
+    ).update(rating_sum=F('rating_sum') - trait_rating.rating, rating_count=F('rating_count') - 1)
+
+
+def rebuild_trait_daily_aggregates(questionnaire_ids=None):
+    """
+    Perskaičiuoja klausimynų savybių dienos suvestines iš visų TraitRating.
+    Grąžina sukurtų eilučių skaičių.
+    """
+    ratings = TraitRating.objects.filter(feedback__feedback_request__questionnaire__isnull=False)
+    aggregates = TraitDailyAggregate.objects.all()
+    if questionnaire_ids is not None:
+        ratings = ratings.filter(feedback__feedback_request__questionnaire_id__in=questionnaire_ids)
+        aggregates = aggregates.filter(questionnaire_id__in=questionnaire_ids)
+
+    rows = (
+        ratings.annotate(date=TruncDate('feedback__feedback_request__created_at'))
+        .values('feedback__feedback_request__questionnaire_id', 'trait_id', 'date')
+        .annotate(rating_sum=Sum('rating'), rating_count=Count('id'))
+        .order_by()
+    )
+    new_aggregates = [
+        TraitDailyAggregate(questionnaire_id=row.pop('feedback__feedback_request__questionnaire_id'), **row)
+        for row in rows
+    ]
+
+    with transaction.atomic():
+        aggregates.delete()
+        TraitDailyAggregate.objects.bulk_create(new_aggregates, batch_size=1000)
+    return len(new_aggregates)
+
+
+AI_USAGE_DIMENSIONS = ('company_id', 'user_id', 'request_type', 'model_name')
+
+
+def _find_ai_usage_daily(lookup):
+    # NULL įmonė/vartotojas unikalumo neužtikrina – visada imama ta pati (seniausia) eilutė
+    return AIUsageDaily.objects.filter(**lookup).order_by('pk').values_list('pk', flat=True).first()
+
+
+def _ai_usage_daily_pk(lookup):
+    """
+    Grąžina suvestinės eilutės pk, jei reikia – ją sukuria. Jei lygiagretus flush
+    eilutę sukūrė tarp paieškos ir INSERT, unikalumo klaida sugaunama savepoint'e
+    ir imama jau įrašyta eilutė, todėl išorinė transakcija nenutraukiama.
+    """
+    pk = _find_ai_usage_daily(lookup)
+    if pk is not None:
+        return pk
+    try:
+        with transaction.atomic():
+            return AIUsageDaily.objects.create(**lookup).pk
+    except IntegrityError:
+        pk = _find_ai_usage_daily(lookup)
+        if pk is None:
+            raise
+        return pk
+
+
+def record_ai_usage(logs):
+    """
+    Prideda AIUsageLog įrašus prie dienos suvestinių: viena eilutė kiekvienam
+    (diena, įmonė, vartotojas, tipas, modelis) deriniui, nepriklausomai nuo logų skaičiaus.
+    Kviečiama toje pačioje transakcijoje, kurioje įrašomi patys logai.
+    """
+    totals = {}
+    for log in logs:
+        key = (timezone.localdate(log.timestamp),) + tuple(getattr(log, name) for name in AI_USAGE_DIMENSIONS)
+        calls, prompt_tokens, completion_tokens, total_cost = totals.get(key, (0, 0, 0, Decimal(0)))
+        totals[key] = (
+            calls + 1,
+            prompt_tokens + (log.prompt_tokens or 0),
+            completion_tokens + (log.completion_tokens or 0),
+            total_cost + Decimal(str(log.total_cost or 0)),
+        )
+
+    with transaction.atomic():
+        for key, (calls, prompt_tokens, completion_tokens, total_cost) in totals.items():
+            lookup = dict(zip(('date',) + AI_USAGE_DIMENSIONS, key))
+            pk = _ai_usage_daily_pk(lookup)
+            AIUsageDaily.objects.filter(pk=pk).update(
+                calls=F('calls') + calls,
+                prompt_tokens=F('prompt_tokens') + prompt_tokens,
+                completion_tokens=F('completion_tokens') + completion_tokens,
+                total_cost=F('total_cost') + total_cost,
+            )
+    return len(totals)
+
+
+def rebuild_ai_usage_daily(since=None):
+    """
+    Perskaičiuoja AI naudojimo dienos suvestines iš AIUsageLog.
+    Jei nurodyta since (data) – perskaičiuojamos tik dienos nuo jos (imtinai).
+    Grąžina sukurtų eilučių skaičių.
+    """
+    logs = AIUsageLog.objects.all()
+    aggregates = AIUsageDaily.objects.all()
+    if since is not None:
+        logs = logs.filter(timestamp__date__gte=since)
+        aggregates = aggregates.filter(date__gte=since)
+
+    rows = (
+        logs.annotate(date=TruncDate('timestamp'))
+        .values('date', *AI_USAGE_DIMENSIONS)
+        .annotate(
+            calls=Count('id'), prompt_tokens=Sum('prompt_tokens'),
+            completion_tokens=Sum('completion_tokens'), total_cost=Sum('total_cost'),
+        )
+        .order_by()
+    )
+    new_aggregates = [AIUsageDaily(**row) for row in rows]
+
+    with transaction.atomic():
+        aggregates.delete()
+        AIUsageDaily.objects.bulk_create(new_aggregates, batch_size=1000)
+    return len(new_aggregates)
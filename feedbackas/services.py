@@ -1,8 +1,214 @@
 from django.utils.translation import gettext as _
 from django.conf import settings
-from django.db.models import Avg
-from .models import Feedback, FeedbackRequest
+import logging
+
+import redis
+from django.db.models import Sum
+from .models import RATING_TOTAL_FIELDS, Feedback, FeedbackRequest, UserRatingMonthlyBucket, UserRatingSummary
+from .analytics_engine import CompetencyMatrix
+from .keyword_index import top_keywords
+from .redis_client import shared_cache
 from django.contrib.auth.models import User
+from bisect import bisect_right
+from fractions import Fraction
+
+# Įmonės balų indekso (percentiliams) kešavimo trukmė sekundėmis
+SCORE_INDEX_TTL = 300
+SCORE_INDEX_PERIODS = ('all', 'month', 'quarter', 'year')
+
+logger = logging.getLogger(__name__)
+
+
+def competency_list(competency_averages):
+    """
+    Paverčia kompetencijų vidurkių žodyną ({'teamwork': 3.2, ...})
+    į šablonams skirtą sąrašą.
+    """
+    return [
+        {'name': _('Komandinis Darbas'), 'score': round(competency_averages.get('teamwork') or 0, 2)},
+        {'name': _('Komunikacija'), 'score': round(competency_averages.get('communication') or 0, 2)},
+        {'name': _('Iniciatyvumas'), 'score': round(competency_averages.get('initiative') or 0, 2)},
+        {'name': _('Techninės Žinios'), 'score': round(competency_averages.get('technical_skills') or 0, 2)},
+        {'name': _('Problemų Sprendimas'), 'score': round(competency_averages.get('problem_solving') or 0, 2)},
+    ]
+
+
+def get_rating_summary(user):
+    """Grąžina vartotojo suvestinę arba tuščią (neišsaugotą), jei atsiliepimų dar nėra."""
+    return UserRatingSummary.objects.filter(user=user).first() or UserRatingSummary(user=user)
+
+
+# Kiek kalendorinių mėnesių (įskaitant einamąjį) apima kiekvienas laikotarpis
+PERIOD_MONTHS = {'month': 1, 'quarter': 3, 'year': 12}
+
+
+def period_start_month(period, today=None):
+    """
+    Grąžina pirmą laikotarpio mėnesio dieną ('month', 'quarter', 'year')
+    arba None visam laikotarpiui.
+    """
+    from django.utils import timezone
+
+    months = PERIOD_MONTHS.get(period)
+    if months is None:
+        return None
+    today = today or timezone.localdate()
+    month_index = today.year * 12 + today.month - months
+    return today.replace(year=month_index // 12, month=month_index % 12 + 1, day=1)
+
+
+def period_start(period, now=None):
+    """Laikotarpio pradžia kaip datetime (vietos laiko mėnesio pradžia) arba None."""
+    from django.utils import timezone
+
+    start_month = period_start_month(period, timezone.localdate(now) if now else None)
+    if start_month is None:
+        return None
+    return period_start_for_month(start_month)
+
+
+def last_month_starts(count, today=None):
+    """Paskutinių `count` kalendorinių mėnesių pirmos dienos (seniausias pirmas, einamasis paskutinis)."""
+    from django.utils import timezone
+
+    today = today or timezone.localdate()
+    current = today.year * 12 + today.month - 1
+    return [
+        today.replace(year=index // 12, month=index % 12 + 1, day=1)
+        for index in range(current - count + 1, current + 1)
+    ]
+
+
+def monthly_totals(queryset, date_field, aggregate, since=None):
+    """
+    Viena TruncMonth grupuota užklausa: {mėnesio pirma diena: agreguota reikšmė}.
+    since – data (mėnesio pradžia), nuo kurios imami įrašai.
+    """
+    from django.db.models import DateField
+    from django.db.models.functions import TruncMonth
+
+    if since is not None:
+        queryset = queryset.filter(**{f'{date_field}__gte': period_start_for_month(since)})
+    rows = (
+        queryset.annotate(month=TruncMonth(date_field, output_field=DateField()))
+        .values('month')
+        .annotate(total=aggregate)
+        .values_list('month', 'total')
+        .order_by()
+    )
+    return {month: total or 0 for month, total in rows}
+
+
+def running_totals(totals, months):
+    """Kaupiamosios sumos kiekvieno mėnesio pabaigai (įskaitant visus ankstesnius mėnesius)."""
+    ordered = sorted(totals.items())
+    result, running, position = [], 0, 0
+    for month in months:
+        while position < len(ordered) and ordered[position][0] <= month:
+            running += ordered[position][1]
+            position += 1
+        result.append(running)
+    return result
+
+
+def period_start_for_month(month):
+    """Mėnesio pirmos dienos pradžia kaip laiko zonos turintis datetime (vietos laiku)."""
+    from django.utils import timezone
+    import datetime
+
+    return timezone.make_aware(datetime.datetime.combine(month, datetime.time.min))
+
+
+def sum_rating_buckets(buckets):
+    """Sudeda mėnesių krepšelius į vieną (neišsaugotą) suvestinę su vidurkių metodais."""
+    totals = buckets.aggregate(**{name: Sum(name) for name in RATING_TOTAL_FIELDS})
+    return UserRatingSummary(**{name: value or 0 for name, value in totals.items()})
+
+
+def _score_index_key(company_id, period):
+    return f'company_score_index:{company_id}:{period}'
+
+
+def company_score_index(company_id, period='all'):
+    """
+    Didėjančia tvarka surūšiuotas įmonės vartotojų vidutinių įvertinimų sąrašas.
+    Skaičiuojamas viena sugrupuota užklausa ir trumpam kešuojamas.
+    Vidurkiai saugomi kaip Fraction, todėl vienodi balai lyginami tiksliai.
+    Redis nepasiekus indeksas tiesiog skaičiuojamas iš DB.
+    """
+    key = _score_index_key(company_id, period)
+    try:
+        index = shared_cache().get(key)
+    except redis.RedisError as e:
+        logger.warning(f"Score index cache unavailable: {e}")
+        index = None
+    if index is not None:
+        return index
+
+    start_month = period_start_month(period)
+    if start_month is None:
+        rows = UserRatingSummary.objects.filter(
+            user__profile__company_link_id=company_id,
+            feedback_count__gt=0,
+        ).values_list('rating_sum', 'feedback_count')
+    else:
+        rows = (
+            UserRatingMonthlyBucket.objects.filter(
+                user__profile__company_link_id=company_id,
+                month__gte=start_month,
+            )
+            .values('user_id')
+            .annotate(total_rating=Sum('rating_sum'), total_count=Sum('feedback_count'))
+            .values_list('total_rating', 'total_count')
+            .order_by()
+        )
+
+    index = sorted(Fraction(rating_sum, count) for rating_sum, count in rows if rating_sum and count)
+    try:
+        shared_cache().set(key, index, SCORE_INDEX_TTL)
+    except redis.RedisError as e:
+        logger.warning(f"Score index cache unavailable: {e}")
+    return index
+
+
+def invalidate_company_score_index(company_id):
+    """Išvalo įmonės balų indeksą visiems laikotarpiams (pvz. užbaigus atsiliepimą)."""
+    try:
+        shared_cache().delete_many([_score_index_key(company_id, period) for period in SCORE_INDEX_PERIODS])
+    except redis.RedisError as e:
+        # Pasenęs indeksas išnyks po SCORE_INDEX_TTL
+        logger.warning(f"Score index invalidation failed for company {company_id}: {e}")
+
+
+def company_percentile(index, score):
+    """
+    Grąžina 'Top %' reikšmę: rangas = 1 + vartotojų su griežtai didesniu vidurkiu skaičius,
+    todėl vienodą vidurkį turintys vartotojai gauna tą patį rangą.
+    """
+    if not index or score <= 0:
+        return '--'
+    rank = len(index) - bisect_right(index, score) + 1
+    percentile_calc = int((rank / len(index)) * 100)
+    return percentile_calc if percentile_calc > 0 else 1
+
+
+def latest_extracted_items(feedbacks, field, limit=5):
+    """
+    Pirmi `limit` AI išskirti punktai (stiprybės ar tobulintinos sritys) iš naujausių
+    atsiliepimų. Kiekviena netuščio sąrašo eilutė duoda bent vieną punktą, todėl
+    skaitoma ne daugiau `limit` eilučių, nepriklausomai nuo istorijos dydžio.
+    """
+    rows = (
+        feedbacks.exclude(**{field: []})
+        .order_by('-created_at', '-id')
+        .values_list(field, flat=True)[:limit]
+    )
+    items = []
+    for values in rows:
+        if isinstance(values, list):
+            items.extend(values)
+    return items[:limit]
+
 
 class FeedbackAnalytics:
     @staticmethod
@@ -10,99 +216,48 @@ class FeedbackAnalytics:
         """
         Apskaičiuoja vartotojo atsiliepimų statistiką ir kompetencijų vidurkius.
         """
-        from django.utils import timezone
-        import datetime
-        
         filters = {
             'feedback_request__requester': user,
             'feedback_request__status': 'completed'
         }
-        
-        now = timezone.now()
-        if period == 'month':
-            filters['feedback_request__created_at__gte'] = now - datetime.timedelta(days=30)
-        elif period == 'quarter':
-            filters['feedback_request__created_at__gte'] = now - datetime.timedelta(days=90)
-        elif period == 'year':
-            filters['feedback_request__created_at__gte'] = now - datetime.timedelta(days=365)
+        total_requests_filters = {'requester': user}
+
+        start_month = period_start_month(period)
+        start = period_start(period)
+        if start is not None:
+            filters['feedback_request__created_at__gte'] = start
+            total_requests_filters['created_at__gte'] = start
             
         completed_feedback = Feedback.objects.filter(**filters)
-        completed_feedback_count = completed_feedback.count()
+
+        # Visam laikotarpiui skaitome vieną suvestinės eilutę, kitiems – iki 12 mėnesių krepšelių,
+        # todėl kaina nepriklauso nuo vartotojo istorijos dydžio
+        if start_month is None:
+            summary = get_rating_summary(user)
+        else:
+            summary = sum_rating_buckets(
+                UserRatingMonthlyBucket.objects.filter(user=user, month__gte=start_month)
+            )
+        completed_feedback_count = summary.feedback_count
+        rating_sum = summary.rating_sum
+        competency_averages = summary.competency_averages()
         
         # Participation Rate
-        total_requests_filters = {'requester': user}
-        if period == 'month':
-            total_requests_filters['created_at__gte'] = now - datetime.timedelta(days=30)
-        elif period == 'quarter':
-            total_requests_filters['created_at__gte'] = now - datetime.timedelta(days=90)
-        elif period == 'year':
-            total_requests_filters['created_at__gte'] = now - datetime.timedelta(days=365)
-        
         total_requests = FeedbackRequest.objects.filter(**total_requests_filters).count()
         participation_rate = 0
         if total_requests > 0:
             participation_rate = int((completed_feedback_count / total_requests) * 100)
             
-        overall_avg_rating = completed_feedback.aggregate(Avg('rating'))['rating__avg'] or 0
+        user_score = Fraction(rating_sum, completed_feedback_count) if completed_feedback_count else Fraction(0)
+        overall_avg_rating = float(user_score)
         
         # Top % In Company
         top_percentile = '--'
-        if hasattr(user, 'profile') and user.profile.company_link:
-            company = user.profile.company_link
-            company_users = User.objects.filter(profile__company_link=company)
-            
-            user_scores = []
-            for u in company_users:
-                u_filters = {
-                    'feedback_request__requester': u,
-                    'feedback_request__status': 'completed'
-                }
-                if period == 'month':
-                    u_filters['feedback_request__created_at__gte'] = now - datetime.timedelta(days=30)
-                elif period == 'quarter':
-                    u_filters['feedback_request__created_at__gte'] = now - datetime.timedelta(days=90)
-                elif period == 'year':
-                    u_filters['feedback_request__created_at__gte'] = now - datetime.timedelta(days=365)
-                    
-                u_avg = Feedback.objects.filter(**u_filters).aggregate(Avg('rating'))['rating__avg'] or 0
-                if u_avg > 0:
-                    user_scores.append(u_avg)
-                    
-            if user_scores and overall_avg_rating > 0:
-                user_scores.sort(reverse=True)
-                if overall_avg_rating in user_scores:
-                    rank = user_scores.index(overall_avg_rating) + 1
-                    percentile_calc = int((rank / len(user_scores)) * 100)
-                    top_percentile = percentile_calc if percentile_calc > 0 else 1
-        
-        all_keywords = []
-        all_strengths = []
-        all_improvements = []
+        if hasattr(user, 'profile') and user.profile.company_link_id:
+            index = company_score_index(user.profile.company_link_id, period if start_month else 'all')
+            top_percentile = company_percentile(index, user_score)
         
-        for feedback in completed_feedback:
-            keywords = [kw.strip() for kw in feedback.keywords.split(',') if kw.strip()]
-            all_keywords.extend(keywords)
-            
-            # Sumuojame AI išskirtas savybes
-            if isinstance(feedback.extracted_strengths, list):
-                all_strengths.extend(feedback.extracted_strengths)
-            if isinstance(feedback.extracted_improvements, list):
-                all_improvements.extend(feedback.extracted_improvements)
-
-        competency_averages = completed_feedback.aggregate(
-            teamwork=Avg('teamwork_rating'),
-            communication=Avg('communication_rating'),
-            initiative=Avg('initiative_rating'),
-            technical_skills=Avg('technical_skills_rating'),
-            problem_solving=Avg('problem_solving_rating')
-        )
-        competencies = [
-            {'name': _('Komandinis Darbas'), 'score': round(competency_averages.get('teamwork') or 0, 2)},
-            {'name': _('Komunikacija'), 'score': round(competency_averages.get('communication') or 0, 2)},
-            {'name': _('Iniciatyvumas'), 'score': round(competency_averages.get('initiative') or 0, 2)},
-            {'name': _('Techninės Žinios'), 'score': round(competency_averages.get('technical_skills') or 0, 2)},
-            {'name': _('Problemų Sprendimas'), 'score': round(competency_averages.get('problem_solving') or 0, 2)},
-        ]
+        competencies = competency_list(competency_averages)
 
         training_map = {
             'Komandinis Darbas': 'Mokymai apie efektyvų komandinį darbą',
@@ -125,10 +280,10 @@ class FeedbackAnalytics:
             'received_feedback_count': completed_feedback_count,
             'participation_rate': participation_rate,
             'top_percentile': top_percentile,
-            'all_keywords': list(set(all_keywords))[:7],
+            'all_keywords': top_keywords(completed_feedback, limit=7),
             'competencies': competencies,
-            'strengths': all_strengths[:5],
-            'improvements': all_improvements[:5],
+            'strengths': latest_extracted_items(completed_feedback, 'extracted_strengths'),
+            'improvements': latest_extracted_items(completed_feedback, 'extracted_improvements'),
             'recommended_trainings': recommended_trainings,
         }
 
@@ -161,93 +316,122 @@ class TeamAnalytics:
     @staticmethod
     def get_team_stats(team_members):
         """
-        Apskaičiuoja visos komandos statistiką.
+        Apskaičiuoja visos komandos statistiką iš narių suvestinių (UserRatingSummary).
         """
-        from django.db.models import Avg, Count, Q
-        
-        # Per-member stats using annotation instead of N+1 queries
-        annotated_members = team_members.annotate(
-            avg_rating=Avg('received_requests__feedback__rating', filter=Q(received_requests__status='completed')),
-            feedback_count=Count('received_requests__feedback', filter=Q(received_requests__status='completed'))
-        )
+        from .models import COMPETENCY_FIELDS
+
+        members = list(team_members)
+        summaries = {
+            summary.user_id: summary
+            for summary in UserRatingSummary.objects.filter(user__in=[m.id for m in members])
+        }
 
         member_stats = []
-        for member in annotated_members:
+        team_feedback_count = 0
+        team_rating_sum = 0
+        competency_sums = {key: 0 for key, _ in COMPETENCY_FIELDS}
+        for member in members:
+            summary = summaries.get(member.id)
+            feedback_count = summary.feedback_count if summary else 0
             member_stats.append({
                 'user': member,
-                'avg_rating': round(member.avg_rating, 2) if member.avg_rating else None,
-                'feedback_count': member.feedback_count,
+                'avg_rating': round(summary.avg_rating, 2) if feedback_count else None,
+                'feedback_count': feedback_count,
             })
+            if feedback_count:
+                team_feedback_count += feedback_count
+                team_rating_sum += summary.rating_sum
+                for key in competency_sums:
+                    competency_sums[key] += getattr(summary, f'{key}_sum')
+
+        # Komandos vidurkiai svertiniai pagal atsiliepimų skaičių (kaip Avg per visus atsiliepimus)
+        team_avg_rating = team_rating_sum / team_feedback_count if team_feedback_count else 0
+        competency_averages = {
+            key: total / team_feedback_count if team_feedback_count else None
+            for key, total in competency_sums.items()
+        }
         
-        # Team-wide aggregated stats
-        all_team_feedback = Feedback.objects.filter(
-            feedback_request__requester__in=team_members,
-            feedback_request__status='completed'
-        )
-        
-        team_avg_rating = all_team_feedback.aggregate(Avg('rating'))['rating__avg'] or 0
-        team_feedback_count = all_team_feedback.count()
-        
-        competency_averages = all_team_feedback.aggregate(
-            teamwork=Avg('teamwork_rating'),
-            communication=Avg('communication_rating'),
-            initiative=Avg('initiative_rating'),
-            technical_skills=Avg('technical_skills_rating'),
-            problem_solving=Avg('problem_solving_rating')
-        )
-        
-        competencies = [
-            {'name': _('Komandinis Darbas'), 'score': round(competency_averages.get('teamwork') or 0, 2)},
-            {'name': _('Komunikacija'), 'score': round(competency_averages.get('communication') or 0, 2)},
-            {'name': _('Iniciatyvumas'), 'score': round(competency_averages.get('initiative') or 0, 2)},
-            {'name': _('Techninės Žinios'), 'score': round(competency_averages.get('technical_skills') or 0, 2)},
-            {'name': _('Problemų Sprendimas'), 'score': round(competency_averages.get('problem_solving') or 0, 2)},
-        ]
+        competencies = competency_list(competency_averages)
         
         return {
             'member_stats': member_stats,
             'team_avg_rating': team_avg_rating,
             'team_feedback_count': team_feedback_count,
-            'team_member_count': team_members.count(),
+            'team_member_count': len(members),
             'competencies': competencies,
         }
 
     @staticmethod
-    def get_member_detailed_stats(feedbacks):
+    def get_department_breakdown(departments, exclude_user=None, months=6):
+        """
+        Palygina padalinius: vienu užkrovimu į NumPy matricą apskaičiuoja kiekvieno padalinio
+        vidurkį, medianą, standartinį nuokrypį, kvartilius ir paskutinių mėnesių tendenciją.
+        """
+        departments = list(departments)
+        feedbacks = Feedback.objects.filter(
+            feedback_request__status='completed',
+            feedback_request__requester__profile__department__in=departments,
+        )
+        if exclude_user is not None:
+            feedbacks = feedbacks.exclude(feedback_request__requester=exclude_user)
+
+        matrix = CompetencyMatrix.from_queryset(feedbacks)
+        stats = matrix.group_stats(by='department')
+        trends = matrix.trend(by='department', freq='month')
+
+        breakdown = []
+        for department in departments:
+            department_stats = stats.get(department.id)
+            trend = trends.get(department.id, [])[-months:]
+            change = None
+            if len(trend) >= 2:
+                change = round(trend[-1]['rating'] - trend[-2]['rating'], 2)
+            breakdown.append({
+                'department': department,
+                'feedback_count': department_stats['count'] if department_stats else 0,
+                'avg_rating': department_stats['mean']['rating'] if department_stats else None,
+                'median_rating': department_stats['median']['rating'] if department_stats else None,
+                'std_rating': department_stats['std']['rating'] if department_stats else None,
+                'p25_rating': department_stats['p25']['rating'] if department_stats else None,
+                'p75_rating': department_stats['p75']['rating'] if department_stats else None,
+                'competencies': competency_list(department_stats['mean']) if department_stats else [],
+                'trend': trend,
+                'trend_change': change,
+            })
+        return breakdown
+
+    @staticmethod
+    def get_member_detailed_stats(feedbacks, summary=None):
         """
         Apskaičiuoja individualaus nario detalią statistiką valdytojui pagal nario feedbakus.
+        Jei perduota nario suvestinė (UserRatingSummary), vidurkiai imami iš jos,
+        kitu atveju – iš vienąkart užkrautos įvertinimų matricos.
         """
-        from django.db.models import Avg
-        
         # Aggregate stats
-        avg_rating = feedbacks.aggregate(Avg('rating'))['rating__avg'] or 0
-        competency_averages = feedbacks.aggregate(
-            teamwork=Avg('teamwork_rating'),
-            communication=Avg('communication_rating'),
-            initiative=Avg('initiative_rating'),
-            technical_skills=Avg('technical_skills_rating'),
-            problem_solving=Avg('problem_solving_rating')
-        )
-        competencies = [
-            {'name': _('Komandinis Darbas'), 'score': round(competency_averages.get('teamwork') or 0, 2)},
-            {'name': _('Komunikacija'), 'score': round(competency_averages.get('communication') or 0, 2)},
-            {'name': _('Iniciatyvumas'), 'score': round(competency_averages.get('initiative') or 0, 2)},
-            {'name': _('Techninės Žinios'), 'score': round(competency_averages.get('technical_skills') or 0, 2)},
-            {'name': _('Problemų Sprendimas'), 'score': round(competency_averages.get('problem_solving') or 0, 2)},
-        ]
+        if summary is not None:
+            avg_rating = summary.avg_rating
+            competency_averages = summary.competency_averages()
+        else:
+            overall = CompetencyMatrix.from_queryset(feedbacks).overall()
+            avg_rating = overall['mean']['rating'] if overall else 0
+            competency_averages = overall['mean'] if overall else {}
+        competencies = competency_list(competency_averages)
         
-        # Collect all keywords
-        all_keywords = []
-        for fb in feedbacks:
-            keywords = [kw.strip() for kw in fb.keywords.split(',') if kw.strip()]
-            all_keywords.extend(keywords)
-            
+        # Dažniausi raktiniai žodžiai iš indekso
+        all_keywords = top_keywords(feedbacks, limit=15)
+
         return {
             'avg_rating': round(avg_rating, 2),
             'competencies': competencies,
-            'keywords': list(set(all_keywords)),
+            'keywords': all_keywords,
         }
 
+def feedback_ai_owner(feedback):
+    """(vartotojas, įmonė), kuriems priskiriamos atsiliepimo AI analizės išlaidos."""
+    user = feedback.feedback_request.requester
+    company = user.profile.company_link if hasattr(user, 'profile') else None
+    return user, company
+
 def extract_feedback_features_task(feedback_id):
     """
     Foninė užduotis, skirta AI išskirti stiprybes ir silpnybes iš atsiliepimo 
@@ -261,8 +445,7 @@ def extract_feedback_features_task(feedback_id):
     
     try:
         feedback = Feedback.objects.get(id=feedback_id)
-        user = feedback.feedback_request.requester
-        company = user.profile.company_link if hasattr(user, 'profile') else None
+        user, company = feedback_ai_owner(feedback)
         
         extracted_data = OpenRouterService.extract_strengths_weaknesses(
             feedback.feedback, 
@@ -283,4 +466,72 @@ def extract_feedback_features_task(feedback_id):
         return False
     except Exception as e:
         logger.error(f"Failed to extract strengths and improvements in background task for feedback {feedback_id}: {e}")
-        return False
\ No newline at end of file
+        return False
+
+def extract_feedback_features_batch(feedbacks, batch_size=None):
+    """
+    Išskiria stiprybes ir silpnybes daugeliui atsiliepimų sugrupuotais promptais
+    (OpenRouterService.extract_strengths_weaknesses_batch) ir išsaugoja jas.
+    Atsiliepimai, kurių analizė nepavyko, nekeičiami. Grąžina atnaujintų atsiliepimų id sąrašą.
+    """
+    from .models import Feedback
+    from .ai_service import OpenRouterService
+
+    feedbacks = list(feedbacks)
+    results = OpenRouterService.extract_strengths_weaknesses_batch(
+        [(feedback.id, feedback.feedback, feedback.comments, *feedback_ai_owner(feedback)) for feedback in feedbacks],
+        batch_size=batch_size,
+    )
+    updated = [feedback for feedback in feedbacks if feedback.id in results]
+    for feedback in updated:
+        feedback.extracted_strengths = results[feedback.id].get("strengths", [])
+        feedback.extracted_improvements = results[feedback.id].get("improvements", [])
+    Feedback.objects.bulk_update(updated, ['extracted_strengths', 'extracted_improvements'], batch_size=500)
+    return [feedback.id for feedback in updated]
+
+def extract_feedback_features_batch_task(feedback_ids):
+    """
+    Foninė užduotis masiniams darbams (importams): AI analizė daugeliui atsiliepimų iškart.
+    """
+    from .models import Feedback
+    import logging
+
+    feedbacks = Feedback.objects.filter(id__in=feedback_ids).select_related(
+        'feedback_request__requester__profile__company_link'
+    )
+    updated = len(extract_feedback_features_batch(feedbacks))
+    logging.getLogger(__name__).info(f"Batched AI extraction completed for {updated} feedbacks")
+    return updated
+
+def refresh_rating_cube_task(full=False):
+    """
+    Suplanuota (django-q Schedule) užduotis, inkrementiškai atnaujinanti
+    įvertinimų kubą (RatingCube). Grąžina perskaičiuotų eilučių skaičių.
+    """
+    from .cube import refresh_rating_cube
+    import logging
+
+    refreshed = refresh_rating_cube(full=full)
+    logging.getLogger(__name__).info(f"Rating cube refreshed: {refreshed} rows")
+    return refreshed
+
+def snapshot_platform_metrics_task(days=2):
+    """
+    Naktinė (django-q Schedule) užduotis: perskaičiuoja paskutinių `days` dienų
+    platformos rodiklių nuotraukas (vakar ir šiandien). Jei lentelė tuščia –
+    užpildo visą istoriją. Grąžina sukurtų eilučių skaičių.
+    """
+    from django.utils import timezone
+    from .models import PlatformDailyMetrics
+    from .platform_metrics import first_activity_date, snapshot_platform_metrics
+    import datetime
+    import logging
+
+    today = timezone.localdate()
+    if PlatformDailyMetrics.objects.exists():
+        start = today - datetime.timedelta(days=days - 1)
+    else:
+        start = first_activity_date()
+    created = snapshot_platform_metrics(start, today)
+    logging.getLogger(__name__).info(f"Platform metrics snapshot {start}..{today}: {created} rows")
+    return created
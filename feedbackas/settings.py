@@ -95,6 +95,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'feedbackas.middleware.SecurityHeadersMiddleware',
     'feedbackas.middleware.RestrictHttpMethodMiddleware',
+    'feedbackas.middleware.CoalesceEmployeeCountsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'csp.middleware.CSPMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -225,6 +226,27 @@ LOGIN_URL = '/login/'
 # API key stored in .env file
 OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY', '')
 OPENROUTER_MODEL = os.environ.get('OPENROUTER_MODEL', 'google/gemma-3-27b-it:free')
+# HTTP klientas (feedbackas.openrouter_client): laiko limitai, pakartojimai, grandinės pertraukiklis
+OPENROUTER_CONNECT_TIMEOUT = float(os.environ.get('OPENROUTER_CONNECT_TIMEOUT', '5'))
+OPENROUTER_READ_TIMEOUT = float(os.environ.get('OPENROUTER_READ_TIMEOUT', '60'))
+OPENROUTER_TOTAL_TIMEOUT = float(os.environ.get('OPENROUTER_TOTAL_TIMEOUT', '100'))  # < Q_CLUSTER timeout
+OPENROUTER_MAX_RETRIES = int(os.environ.get('OPENROUTER_MAX_RETRIES', '3'))
+OPENROUTER_CIRCUIT_FAILURES = int(os.environ.get('OPENROUTER_CIRCUIT_FAILURES', '5'))
+OPENROUTER_CIRCUIT_RESET = float(os.environ.get('OPENROUTER_CIRCUIT_RESET', '30'))
+# Bendras užklausų per minutę kibiras Redis visiems procesams (0 – neribojama); ai_backfill jo laukia
+OPENROUTER_RATE_PER_MINUTE = int(os.environ.get('OPENROUTER_RATE_PER_MINUTE', '0'))
+# extract_strengths_weaknesses rezultatų laikymo Redis trukmė (s); DB kopija lieka
+AI_EXTRACTION_CACHE_TTL = int(os.environ.get('AI_EXTRACTION_CACHE_TTL', str(60 * 60 * 24 * 30)))
+# AIUsageLog buferis (feedbackas.usage_log): įrašoma kas N įvykių arba T sekundžių
+AI_USAGE_FLUSH_SIZE = int(os.environ.get('AI_USAGE_FLUSH_SIZE', '50'))
+AI_USAGE_FLUSH_INTERVAL = float(os.environ.get('AI_USAGE_FLUSH_INTERVAL', '5'))
+# Kokia dalis OpenRouter atsakymų archyvuojama (0–1) ir iki kiek simbolių apkarpomas tekstas
+AI_RAW_RESPONSE_SAMPLE_RATE = float(os.environ.get('AI_RAW_RESPONSE_SAMPLE_RATE', '1'))
+AI_RAW_RESPONSE_MAX_CHARS = int(os.environ.get('AI_RAW_RESPONSE_MAX_CHARS', '20000'))
+# Kiek atsiliepimų siunčiama viename sugrupuotame extraction prompte (backfill, importai)
+AI_EXTRACTION_BATCH_SIZE = int(os.environ.get('AI_EXTRACTION_BATCH_SIZE', '10'))
+# Prompto žetonų įverčio koeficientas (feedbackas.prompt_builder) – tikslinti pagal AIUsageLog prompt_tokens
+AI_PROMPT_CHARS_PER_TOKEN = float(os.environ.get('AI_PROMPT_CHARS_PER_TOKEN', '3'))
 
 # Email configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -235,6 +257,22 @@ EMAIL_HOST_USER = 'info@orbigrow.lt'
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = 'info@orbigrow.lt'
 
+# AI užduočių rezultatų laikymo Redis trukmė (s), kol juos pasiima check_ai_task_status
+AI_TASK_RESULT_TTL = int(os.environ.get('AI_TASK_RESULT_TTL', '300'))
+
+# 'default' – proceso atmintyje (django-ratelimit ir kt.), 'shared' – Redis kešas, kurio įrašai ir
+# jų išvalymas turi galioti visiems procesams (balų indeksai, AI analizės kešas). Redis nepasiekus
+# 'shared' skaitymai grįžta prie DB (feedbackas.redis_client.shared_cache)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_CACHE_URL', 'redis://redis:6379/1'),
+    },
+}
+
 # Django Q configuration
 Q_CLUSTER = {
     'name': 'feedbackas_cluster',
@@ -0,0 +1,33 @@
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from .models import Feedback, TraitRating
+
+
+@receiver(pre_delete, sender=Feedback)
+def discard_feedback_from_summary(sender, instance, **kwargs):
+    """
+    Kai ištrinamas užbaigtas atsiliepimas (pvz. kartu su prašymu),
+    atimame jį iš prašytojo suvestinės, kad ji nepasentų.
+    """
+    from .rollups import discard_completed_feedback
+
+    if instance.feedback_request.status == 'completed':
+        discard_completed_feedback(instance)
+
+
+@receiver(post_save, sender=Feedback)
+def index_feedback_keywords_on_save(sender, instance, update_fields=None, **kwargs):
+    """Atnaujina raktinių žodžių indeksą, kai pasikeičia Feedback.keywords."""
+    from .keyword_index import index_feedback_keywords
+
+    if update_fields is not None and 'keywords' not in update_fields:
+        return
+    index_feedback_keywords(instance)
+
+
+@receiver(pre_delete, sender=TraitRating)
+def discard_trait_rating_from_aggregate(sender, instance, **kwargs):
+    """Atima ištrinamą savybės įvertinimą iš klausimyno dienos suvestinės."""
+    from .rollups import discard_trait_rating
+
+    discard_trait_rating(instance)
@@ -0,0 +1,81 @@
+"""
+AI užduočių (django-q) rezultatų pranešimai per Redis vietoj django_q.Task apklausos.
+
+Užduočiai pasibaigus django-q kabliukas (publish_task_hook) įrašo rezultatą į Redis
+raktą su trumpu TTL ir paskelbia jį kanale. check_ai_task_status (long-poll) pirmiausia
+skaito raktą, o jei rezultato dar nėra – prenumeruoja kanalą ir laukia iki nurodyto
+laiko. Duomenų bazė neliečiama.
+"""
+import json
+import logging
+import time
+
+from django.conf import settings
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Kiek laiko (s) rezultatas laikomas Redis
+TASK_RESULT_TTL = getattr(settings, 'AI_TASK_RESULT_TTL', 300)
+# Ilgiausias vieno long-poll laukimas (s)
+TASK_RESULT_MAX_WAIT = 25
+
+
+def _key(task_id):
+    return f'ai_task_result:{task_id}'
+
+
+def _channel(task_id):
+    return f'ai_task_done:{task_id}'
+
+
+def publish_task_result(task_id, success, result, user_id=None):
+    """Įrašo rezultatą (su TTL) ir praneša laukiantiems."""
+    payload = json.dumps({'success': success, 'result': result, 'user_id': user_id}, ensure_ascii=False)
+    client = get_redis()
+    client.set(_key(task_id), payload, ex=TASK_RESULT_TTL)
+    client.publish(_channel(task_id), payload)
+
+
+def publish_task_hook(task):
+    """django-q kabliukas (async_task(..., hook=...)): vykdomas užduočiai pasibaigus."""
+    try:
+        publish_task_result(
+            task.id,
+            bool(task.success),
+            task.result if task.success else None,
+            user_id=(task.kwargs or {}).get('user_id'),
+        )
+    except Exception as e:
+        logger.error(f"Failed to publish AI task result {task.id}: {e}")
+
+
+def get_task_result(task_id):
+    """Paskelbtas rezultatas ({'success', 'result', 'user_id'}) arba None."""
+    payload = get_redis().get(_key(task_id))
+    return json.loads(payload) if payload is not None else None
+
+
+def wait_for_task_result(task_id, timeout):
+    """Laukia rezultato iki timeout sekundžių (pub/sub); None – jei per tiek laiko nepasirodė."""
+    result = get_task_result(task_id)
+    if result is not None or timeout <= 0:
+        return result
+
+    pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+    try:
+        pubsub.subscribe(_channel(task_id))
+        # Rezultatas galėjo būti paskelbtas tarp pirmo skaitymo ir prenumeratos
+        result = get_task_result(task_id)
+        deadline = time.monotonic() + timeout
+        while result is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            message = pubsub.get_message(timeout=remaining)
+            if message is not None and message['type'] == 'message':
+                result = json.loads(message['data'])
+        return result
+    finally:
+        pubsub.close()
@@ -1,4 +1,5 @@
-from django.test import TestCase, RequestFactory
+import json
+from django.test import TestCase, TransactionTestCase, RequestFactory
 from django.contrib.auth.models import User
 from users.models import Profile, Company
 from .views import team_members_list
@@ -73,3 +74,1434 @@ class TeamMembersListTest(TestCase):
         response = self.client.get('/team/')
         self.assertEqual(response.status_code, 302) # 302 is redirect
         self.assertTrue(response.url.startswith('/login/'))
+
+
+class UserRatingSummaryTest(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='SummaryCorp')
+        self.requester = User.objects.create_user(username='requester', password='password')
+        self.reviewer = User.objects.create_user(username='reviewer', password='password')
+        for u in (self.requester, self.reviewer):
+            u.profile.company_link = self.company
+            u.profile.save()
+
+    def _post_feedback(self, rating):
+        from datetime import date
+        from unittest import mock
+        from django.urls import reverse
+        from .models import FeedbackRequest
+
+        feedback_request = FeedbackRequest.objects.create(
+            requester=self.requester, requested_to=self.reviewer,
+            project_name='Projektas', due_date=date.today(),
+        )
+        self.client.force_login(self.reviewer)
+        data = {
+            'rating': rating, 'teamwork_rating': rating, 'communication_rating': 2,
+            'initiative_rating': 2, 'technical_skills_rating': 2, 'problem_solving_rating': 2,
+            'keywords': 'a, b', 'comments': '', 'feedback': 'Tekstas',
+        }
+        with mock.patch('django_q.tasks.async_task'):
+            self.client.post(reverse('fill_feedback', args=[feedback_request.id]), data)
+        return feedback_request
+
+    def test_fill_feedback_updates_summary(self):
+        from .models import UserRatingSummary
+
+        self._post_feedback(4)
+        self._post_feedback(2)
+
+        summary = UserRatingSummary.objects.get(user=self.requester)
+        self.assertEqual(summary.feedback_count, 2)
+        self.assertEqual(summary.avg_rating, 3)
+        self.assertEqual(summary.competency_averages()['teamwork'], 3)
+
+    def test_deleting_completed_request_updates_summary(self):
+        from .models import UserRatingSummary
+
+        self._post_feedback(4)
+        self._post_feedback(2).delete()
+
+        summary = UserRatingSummary.objects.get(user=self.requester)
+        self.assertEqual(summary.feedback_count, 1)
+        self.assertEqual(summary.rating_sum, 4)
+
+    def test_period_stats_sum_monthly_buckets(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .rollups import rebuild_user_rating_buckets
+        from .services import FeedbackAnalytics
+
+        self._post_feedback(4)
+        old_request = self._post_feedback(2)
+        old_request.created_at = timezone.now() - timedelta(days=400)
+        old_request.save()
+        # Perkeliame seną atsiliepimą į atitinkamą mėnesio krepšelį
+        rebuild_user_rating_buckets()
+
+        self.assertEqual(FeedbackAnalytics.get_user_stats(self.requester, period='month')['received_feedback_count'], 1)
+        self.assertEqual(FeedbackAnalytics.get_user_stats(self.requester, period='year')['overall_avg_rating'], 4)
+        self.assertEqual(FeedbackAnalytics.get_user_stats(self.requester, period='all')['overall_avg_rating'], 3)
+
+    def test_rebuild_matches_incremental(self):
+        from .models import UserRatingMonthlyBucket, UserRatingSummary
+        from .rollups import rebuild_user_rating_buckets, rebuild_user_rating_summaries
+
+        self._post_feedback(3)
+        self._post_feedback(1)
+        before = UserRatingSummary.objects.values().get(user=self.requester)
+
+        rebuild_user_rating_summaries()
+        after = UserRatingSummary.objects.values().get(user=self.requester)
+        before.pop('updated_at'), after.pop('updated_at')
+        self.assertEqual(before, after)
+
+        buckets_before = list(UserRatingMonthlyBucket.objects.values('month', 'feedback_count', 'rating_sum'))
+        rebuild_user_rating_buckets()
+        buckets_after = list(UserRatingMonthlyBucket.objects.values('month', 'feedback_count', 'rating_sum'))
+        self.assertEqual(buckets_before, buckets_after)
+
+
+class CompanyPercentileTest(TestCase):
+    def test_tied_scores_share_rank(self):
+        from fractions import Fraction
+        from .services import company_percentile
+
+        index = sorted([Fraction(4), Fraction(10, 3), Fraction(10, 3), Fraction(2)])
+        self.assertEqual(company_percentile(index, Fraction(4)), 25)
+        self.assertEqual(company_percentile(index, Fraction(20, 6)), 50)
+        self.assertEqual(company_percentile(index, Fraction(2)), 100)
+        self.assertEqual(company_percentile([], Fraction(3)), '--')
+
+    def test_latest_extracted_items_reads_only_newest_rows(self):
+        import datetime
+        from django.utils import timezone
+        from .models import Feedback, FeedbackRequest
+        from .services import latest_extracted_items
+
+        user = User.objects.create_user(username='extracted', password='password')
+        now = timezone.now()
+        for day in range(10):
+            request = FeedbackRequest.objects.create(
+                requester=user, requested_to=user, project_name='P', due_date=datetime.date.today(), status='completed',
+            )
+            Feedback.objects.create(
+                feedback_request=request, rating=3, keywords='', feedback='',
+                created_at=now - datetime.timedelta(days=day),
+                extracted_strengths=[f'S{day}a', f'S{day}b'] if day % 2 else [],
+            )
+        feedbacks = Feedback.objects.filter(feedback_request__requester=user)
+        with self.assertNumQueries(1):
+            strengths = latest_extracted_items(feedbacks, 'extracted_strengths')
+        self.assertEqual(strengths, ['S1a', 'S1b', 'S3a', 'S3b', 'S5a'])
+        self.assertEqual(latest_extracted_items(feedbacks, 'extracted_improvements'), [])
+
+    def test_get_user_stats_ranks_with_single_grouped_query(self):
+        from datetime import date
+        from .redis_client import shared_cache
+        from .models import Feedback, FeedbackRequest
+        from .rollups import rebuild_user_rating_buckets, rebuild_user_rating_summaries
+        from .services import FeedbackAnalytics
+
+        shared_cache().clear()
+        company = Company.objects.create(name='RankCorp')
+        users = []
+        for i, rating in enumerate([4, 3, 3, 1]):
+            user = User.objects.create_user(username=f'rank{i}', password='password')
+            user.profile.company_link = company
+            user.profile.save()
+            request = FeedbackRequest.objects.create(
+                requester=user, requested_to=user, project_name='P',
+                due_date=date.today(), status='completed',
+            )
+            Feedback.objects.create(feedback_request=request, rating=rating, keywords='', feedback='')
+            users.append(user)
+        rebuild_user_rating_summaries()
+        rebuild_user_rating_buckets()
+
+        self.assertEqual(FeedbackAnalytics.get_user_stats(users[2])['top_percentile'], 50)
+        # Papildomi vartotojai neturi didinti užklausų skaičiaus
+        with self.assertNumQueries(6):
+            FeedbackAnalytics.get_user_stats(users[1], period='year')
+        self.assertEqual(FeedbackAnalytics.get_user_stats(users[3], period='year')['top_percentile'], 100)
+
+        # Redis nepasiekiamas – indeksas skaičiuojamas iš DB, invalidacija nekelia klaidos
+        from django.test import override_settings
+        from .services import company_score_index, invalidate_company_score_index
+        unreachable = {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'shared': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:1/0'},
+        }
+        with override_settings(CACHES=unreachable):
+            self.assertEqual(len(company_score_index(company.id)), 4)
+            invalidate_company_score_index(company.id)
+
+
+class CompetencyMatrixTest(TestCase):
+    def test_group_stats_match_numpy_reference(self):
+        import numpy as np
+        from .analytics_engine import CompetencyMatrix
+
+        rng = np.random.default_rng(7)
+        department_ids = rng.integers(1, 4, size=40)
+        ratings = rng.integers(1, 5, size=(40, 6))
+        dates = np.datetime64('2026-01-01') + rng.integers(0, 90, size=40)
+        matrix = CompetencyMatrix(department_ids, department_ids, dates, ratings)
+
+        stats = matrix.group_stats(by='department')
+        for department_id in np.unique(department_ids).tolist():
+            values = ratings[department_ids == department_id, 0]
+            entry = stats[department_id]
+            self.assertEqual(entry['count'], len(values))
+            self.assertAlmostEqual(entry['mean']['rating'], round(values.mean(), 2))
+            self.assertAlmostEqual(entry['std']['rating'], round(values.std(), 2))
+            self.assertAlmostEqual(entry['median']['rating'], round(np.median(values), 2))
+            self.assertAlmostEqual(entry['p75']['rating'], round(np.percentile(values, 75), 2))
+
+        trend = matrix.trend()[0]
+        self.assertEqual([point['period'] for point in trend], ['2026-01', '2026-02', '2026-03'])
+        self.assertEqual(sum(point['count'] for point in trend), 40)
+
+
+class KeywordIndexTest(TestCase):
+    def _feedback(self, user, keywords):
+        from datetime import date
+        from .models import Feedback, FeedbackRequest
+
+        request = FeedbackRequest.objects.create(
+            requester=user, requested_to=user, project_name='P',
+            due_date=date.today(), status='completed',
+        )
+        return Feedback.objects.create(feedback_request=request, rating=3, keywords=keywords, feedback='')
+
+    def test_top_keywords_ranked_by_frequency(self):
+        from .keyword_index import rebuild_keyword_index, top_keywords
+        from .models import Feedback, FeedbackKeyword
+
+        user = User.objects.create_user(username='kw', password='password')
+        self._feedback(user, 'Lyderystė, komunikacija')
+        self._feedback(user, 'lyderystė,  Komunikacija , lyderystė')
+        edited = self._feedback(user, 'Lyderystė, kūrybiškumas')
+
+        feedbacks = Feedback.objects.filter(feedback_request__requester=user)
+        self.assertEqual(top_keywords(feedbacks), ['Lyderystė', 'komunikacija', 'kūrybiškumas'])
+        self.assertEqual(top_keywords(feedbacks, limit=1), ['Lyderystė'])
+
+        edited.keywords = 'komunikacija'
+        edited.save()
+        self.assertEqual(top_keywords(feedbacks), ['komunikacija', 'Lyderystė'])
+
+        links_before = set(FeedbackKeyword.objects.values_list('feedback_id', 'keyword_id'))
+        self.assertEqual(rebuild_keyword_index(), 5)
+        self.assertEqual(set(FeedbackKeyword.objects.values_list('feedback_id', 'keyword_id')), links_before)
+
+
+class DepartmentClosureTest(TestCase):
+    def setUp(self):
+        from users.models import Department
+
+        self.company = Company.objects.create(name='TreeCorp')
+        self.root = Department.objects.create(company=self.company, name='Root')
+        self.child = Department.objects.create(company=self.company, name='Child', parent=self.root)
+        self.leaf = Department.objects.create(company=self.company, name='Leaf', parent=self.child)
+        self.other = Department.objects.create(company=self.company, name='Other')
+
+    def _links(self):
+        from users.models import DepartmentClosure
+
+        return set(DepartmentClosure.objects.values_list('ancestor__name', 'descendant__name', 'depth'))
+
+    def test_closure_follows_create_move_and_delete(self):
+        from users.hierarchy import rebuild_department_closure
+
+        self.assertIn(('Root', 'Leaf', 2), self._links())
+
+        self.child.parent = self.other
+        self.child.save()
+        links = self._links()
+        self.assertIn(('Other', 'Leaf', 2), links)
+        self.assertNotIn(('Root', 'Leaf', 2), links)
+        self.assertNotIn(('Root', 'Child', 1), links)
+
+        moved = self._links()
+        rebuild_department_closure()
+        self.assertEqual(self._links(), moved)
+
+        self.other.delete()
+        self.assertEqual(self._links(), {('Root', 'Root', 0)})
+
+    def test_form_rejects_moving_under_own_subtree(self):
+        from .forms import DepartmentForm
+
+        form = DepartmentForm(User(), {'name': 'Root', 'parent': self.leaf.id}, instance=self.root)
+        self.assertFalse(form.is_valid())
+        self.assertIn('parent', form.errors)
+
+    def test_cyclic_parent_is_rejected_before_save(self):
+        from django.core.exceptions import ValidationError
+        from users.models import Department
+
+        links_before = self._links()
+        self.root.parent = self.leaf
+        with self.assertRaises(ValidationError):
+            self.root.full_clean()
+        with self.assertRaises(ValidationError):
+            self.root.save()
+        self.assertIsNone(Department.objects.get(pk=self.root.pk).parent_id)
+        self.assertEqual(self._links(), links_before)
+
+    def test_manager_authorized_for_deep_member(self):
+        from django.urls import reverse
+
+        manager = User.objects.create_user(username='boss', password='password')
+        member = User.objects.create_user(username='deep', password='password')
+        self.root.manager = manager
+        self.root.save()
+        member.profile.department = self.leaf
+        member.profile.company_link = self.company
+        member.profile.save()
+        manager.profile.company_link = self.company
+        manager.profile.save()
+
+        self.client.force_login(manager)
+        response = self.client.get(reverse('team_member_detail', args=[member.id]))
+        self.assertEqual(response.status_code, 200)
+
+
+class TeamMembersHierarchyTest(TestCase):
+    def _build(self, sub_team_count, prefix=''):
+        from datetime import date
+        from users.models import Department
+        from .models import Feedback, FeedbackRequest
+        from .rollups import record_completed_feedback
+
+        company = Company.objects.create(name=f'{prefix}HierCorp')
+        manager = User.objects.create_user(username=f'{prefix}manager', password='password')
+        root = Department.objects.create(company=company, name='Root', manager=manager)
+        for i in range(sub_team_count):
+            team = Department.objects.create(company=company, name=f'Team {i}', parent=root)
+            for j in range(2):
+                member = User.objects.create_user(
+                    username=f'{prefix}m{i}-{j}', password='password', first_name=f'Member{i}', last_name=f'N{j}'
+                )
+                member.profile.company_link = company
+                member.profile.department = team
+                member.profile.save()
+                request = FeedbackRequest.objects.create(
+                    requester=member, requested_to=manager, project_name='P',
+                    due_date=date.today(), status='completed',
+                )
+                feedback = Feedback.objects.create(feedback_request=request, rating=2 + j, keywords='', feedback='')
+                record_completed_feedback(feedback)
+        manager.profile.company_link = company
+        manager.profile.department = root
+        manager.profile.save()
+        return manager
+
+    def _team_page(self, manager):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.force_login(manager)
+        self.client.get('/team/')  # Pirmas užklausimas sukuria GlobalSettings
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/team/')
+        return response, len(queries)
+
+    def test_page_runs_constant_number_of_queries(self):
+        # Užklausų skaičius nepriklauso nuo sub-padalinių ir narių skaičiaus
+        _, small_tree_queries = self._team_page(self._build(2, prefix='small-'))
+        response, queries = self._team_page(self._build(6))
+        self.assertEqual(queries, small_tree_queries)
+
+        self.assertEqual(response.status_code, 200)
+        blocks = response.context['department_blocks']
+        self.assertEqual([block['member_count'] for block in blocks], [2] * 6)
+        self.assertEqual(blocks[0]['avg_rating'], 2.5)
+        self.assertEqual(response.context['overall_avg_rating'], 2.5)
+        self.assertEqual(blocks[0]['members'][1].average_rating, 3.0)
+
+
+class QuestionnaireStatisticsTest(TestCase):
+    def setUp(self):
+        from .models import Questionnaire, Trait
+
+        self.company = Company.objects.create(name='QuestCorp')
+        self.owner = User.objects.create_user(username='owner', password='password')
+        self.reviewer = User.objects.create_user(username='colleague', password='password')
+        for u in (self.owner, self.reviewer):
+            u.profile.company_link = self.company
+            u.profile.save()
+        self.trait = Trait.objects.create(name='Lyderystė')
+        self.questionnaire = Questionnaire.objects.create(title='Q1', created_by=self.owner)
+        self.questionnaire.traits.add(self.trait)
+
+    def _answer(self, trait_rating):
+        from datetime import date
+        from unittest import mock
+        from django.urls import reverse
+        from .models import FeedbackRequest
+
+        feedback_request = FeedbackRequest.objects.create(
+            requester=self.owner, requested_to=self.reviewer, project_name='Pervadintas',
+            questionnaire=self.questionnaire, due_date=date.today(),
+        )
+        self.client.force_login(self.reviewer)
+        data = {
+            'rating': 3, 'teamwork_rating': 3, 'communication_rating': 3, 'initiative_rating': 3,
+            'technical_skills_rating': 3, 'problem_solving_rating': 3,
+            'keywords': 'a', 'comments': '', 'feedback': 'Tekstas',
+            f'trait_rating_{self.trait.id}': trait_rating,
+        }
+        with mock.patch('django_q.tasks.async_task'):
+            self.client.post(reverse('fill_feedback', args=[feedback_request.id]), data)
+        return feedback_request
+
+    def test_statistics_read_trait_daily_aggregates(self):
+        from django.urls import reverse
+        from .models import TraitDailyAggregate
+        from .rollups import rebuild_trait_daily_aggregates
+
+        self._answer(4)
+        self._answer(2)
+        self._answer(3).delete()
+
+        aggregate = TraitDailyAggregate.objects.get(questionnaire=self.questionnaire, trait=self.trait)
+        self.assertEqual((aggregate.rating_sum, aggregate.rating_count), (6, 2))
+        rebuild_trait_daily_aggregates()
+        aggregate = TraitDailyAggregate.objects.get(questionnaire=self.questionnaire, trait=self.trait)
+        self.assertEqual((aggregate.rating_sum, aggregate.rating_count), (6, 2))
+
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('questionnaire_statistics', args=[self.questionnaire.id]))
+        self.assertEqual(response.context['received_feedback_count'], 2)
+        self.assertEqual(response.context['competencies'], [{'name': 'Lyderystė', 'score': 3.0}])
+
+    def test_deleting_rating_never_creates_aggregate_rows(self):
+        from .models import TraitDailyAggregate
+
+        feedback_request = self._answer(4)
+        TraitDailyAggregate.objects.all().delete()
+        feedback_request.delete()
+        self.assertFalse(TraitDailyAggregate.objects.exists())
+
+
+class RatingCubeTest(TestCase):
+    def setUp(self):
+        from users.models import Department
+
+        self.company = Company.objects.create(name='CubeCorp')
+        self.sales = Department.objects.create(company=self.company, name='Sales')
+        self.dev = Department.objects.create(company=self.company, name='Dev')
+
+    def _feedback(self, department, rating):
+        from datetime import date
+        from .models import Feedback, FeedbackRequest
+
+        user = User.objects.create_user(username=f'cube{User.objects.count()}', password='password')
+        user.profile.company_link = self.company
+        user.profile.department = department
+        user.profile.save()
+        request = FeedbackRequest.objects.create(
+            requester=user, requested_to=user, project_name='P', due_date=date.today(), status='completed',
+        )
+        return Feedback.objects.create(
+            feedback_request=request, rating=rating, teamwork_rating=rating, keywords='', feedback='',
+        )
+
+    def test_refresh_and_slice(self):
+        from .cube import department_heatmap, refresh_rating_cube, slice_cube
+
+        self._feedback(self.sales, 4)
+        self._feedback(self.sales, 2)
+        self._feedback(self.dev, 3)
+        refresh_rating_cube()
+
+        by_department = {
+            row['department']: row
+            for row in slice_cube(self.company, group_by=('department',), competencies=['rating'])
+        }
+        self.assertEqual(by_department[self.sales.id]['mean'], 3.0)
+        self.assertEqual(by_department[self.sales.id]['std'], 1.0)
+        self.assertEqual(by_department[self.dev.id]['count'], 1)
+
+        # Inkrementinis atnaujinimas paima tik naujus atsiliepimus
+        self._feedback(self.dev, 1)
+        self.assertEqual(refresh_rating_cube(), 12)
+        heatmap = department_heatmap(self.company)
+        dev_row = next(row for row in heatmap['rows'] if row['department_id'] == self.dev.id)
+        self.assertEqual((dev_row['cells'][0]['mean'], dev_row['cells'][0]['std']), (2.0, 1.0))
+
+    def test_incremental_refresh_picks_up_late_commits(self):
+        import datetime
+        from .cube import refresh_rating_cube, slice_cube
+        from .models import RatingCube
+
+        self._feedback(self.sales, 4)
+        refresh_rating_cube()
+        watermark = RatingCube.objects.latest('refreshed_at').refreshed_at
+
+        # Sukurtas prieš atnaujinimą, bet patvirtintas (matomas) tik po jo
+        late = self._feedback(self.sales, 2)
+        late.created_at = watermark - datetime.timedelta(minutes=1)
+        late.save(update_fields=['created_at'])
+        refresh_rating_cube()
+        self.assertEqual(slice_cube(self.company, group_by=('department',), competencies=['rating'])[0]['count'], 2)
+
+    def test_nightly_full_rebuild_picks_up_deletions(self):
+        from django_q.models import Schedule
+        from .cube import refresh_rating_cube, slice_cube
+        from .services import refresh_rating_cube_task
+
+        import datetime
+        from django.db.models import F
+        from .models import Feedback
+
+        self._feedback(self.sales, 4)
+        stale = self._feedback(self.sales, 2)
+        Feedback.objects.update(created_at=F('created_at') - datetime.timedelta(days=1))
+        refresh_rating_cube()
+        stale.delete()
+        refresh_rating_cube()
+        self.assertEqual(slice_cube(self.company, group_by=('department',), competencies=['rating'])[0]['count'], 2)
+
+        schedule = Schedule.objects.get(func='feedbackas.services.refresh_rating_cube_task', kwargs='full=True')
+        self.assertEqual(schedule.schedule_type, Schedule.DAILY)
+        refresh_rating_cube_task(full=True)
+        self.assertEqual(slice_cube(self.company, group_by=('department',), competencies=['rating'])[0]['count'], 1)
+
+
+class SuperadminDashboardTest(TestCase):
+    def test_calendar_months_and_running_totals(self):
+        from datetime import date
+        from .services import last_month_starts, running_totals
+
+        months = last_month_starts(3, today=date(2026, 3, 31))
+        self.assertEqual(months, [date(2026, 1, 1), date(2026, 2, 1), date(2026, 3, 1)])
+        self.assertEqual(last_month_starts(2, today=date(2026, 1, 15)), [date(2025, 12, 1), date(2026, 1, 1)])
+        totals = {date(2025, 6, 1): 2, date(2026, 2, 1): 3}
+        self.assertEqual(running_totals(totals, months), [2, 5, 5])
+
+    def test_fixed_query_budget(self):
+        from datetime import date
+        from decimal import Decimal
+        from django.urls import reverse
+        from users.models import ContractSettings
+
+        admin = User.objects.create_superuser(username='root', password='password')
+        self.client.force_login(admin)
+        self.client.get(reverse('superadmin_dashboard'))
+
+        for i in range(3):
+            company = Company.objects.create(name=f'DashCorp{i}')
+            user = User.objects.create_user(username=f'dash{i}', password='password')
+            user.profile.company_link = company
+            user.profile.save()
+            ContractSettings.objects.create(
+                company=company, price_per_employee=Decimal('10.00'), contract_start=date(2020, 1, 1),
+            )
+
+        # Užklausų skaičius nepriklauso nuo įmonių/sutarčių skaičiaus
+        with self.assertNumQueries(21):
+            response = self.client.get(reverse('superadmin_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_companies'], 3)
+        self.assertEqual(response.context['users_history'][-1], 4)
+        self.assertEqual(response.context['total_monthly_revenue'], Decimal('30.00'))
+        self.assertEqual(response.context['revenue_history'][-1], 30.0)
+
+
+class PlatformDailyMetricsTest(TestCase):
+    def test_snapshot_and_bounded_statistics(self):
+        import datetime
+        import json
+        from django.urls import reverse
+        from django.utils import timezone
+        from users.models import EmployeeCountLog
+        from .models import PlatformDailyMetrics
+        from .platform_metrics import platform_metrics_series, snapshot_platform_metrics
+
+        today = timezone.localdate()
+        company = Company.objects.create(name='MetricsCorp')
+        user = User.objects.create_user(username='metrics', password='password')
+        user.profile.company_link = company
+        user.profile.save()
+        EmployeeCountLog.objects.all().delete()
+        EmployeeCountLog.objects.create(
+            company=company, active_count=7, recorded_at=timezone.now() - datetime.timedelta(days=3),
+        )
+
+        snapshot_platform_metrics(today - datetime.timedelta(days=1), today)
+        series = platform_metrics_series(today - datetime.timedelta(days=1), today, company_id=company.id)
+        # Aktyvių skaičius perkeliamas iš ankstesnio įrašo, registracija – šiandien
+        self.assertEqual([row['active_users'] for row in series], [7, 7])
+        self.assertEqual(series[-1]['registrations'], 1)
+
+        # Pakartotinis perskaičiavimas nedubliuoja eilučių
+        snapshot_platform_metrics(today - datetime.timedelta(days=1), today)
+        self.assertEqual(PlatformDailyMetrics.objects.filter(company=company).count(), 2)
+
+        admin = User.objects.create_superuser(username='root', password='password')
+        self.client.force_login(admin)
+        url = reverse('superadmin_statistics') + f'?company_id={company.id}&start_date={today}&end_date={today}'
+        self.client.get(url)
+        # Užklausų skaičius nepriklauso nuo istorijos ilgio
+        with self.assertNumQueries(11):
+            response = self.client.get(url)
+        self.assertEqual(json.loads(response.context['active_users_raw']), [{'date': str(today), 'value': 7}])
+        self.assertEqual(response.context['user_growth_base'], 0)
+
+
+class BatchBillingTest(TestCase):
+    def test_batch_matches_rules_with_fixed_queries(self):
+        import datetime
+        from decimal import Decimal
+        from django.utils import timezone
+        from users.billing_service import calculate_monthly_bill, calculate_monthly_bills
+        from users.models import ContractSettings, EmployeeCountLog
+
+        def logged(company, day, count):
+            EmployeeCountLog.objects.create(
+                company=company, active_count=count,
+                recorded_at=timezone.make_aware(datetime.datetime.combine(day, datetime.time(12))),
+            )
+
+        billed = Company.objects.create(name='BillCorp')
+        ContractSettings.objects.create(
+            company=billed, price_per_employee=Decimal('10.00'), minimum_fee=Decimal('50.00'),
+            contract_start=datetime.date(2025, 1, 1),
+        )
+        unbilled = Company.objects.create(name='NoContract')
+        EmployeeCountLog.objects.all().delete()
+        logged(billed, datetime.date(2024, 12, 20), 4)
+        logged(billed, datetime.date(2025, 2, 3), 9)
+        logged(billed, datetime.date(2025, 2, 20), 6)
+
+        months = [(2025, 1), (2025, 2), (2025, 3)]
+        with self.assertNumQueries(5):
+            bills = calculate_monthly_bills([billed.id, unbilled.id], months)
+
+        # Sausis – perkeltas 2024-12 skaičius ir taikomas minimumas
+        self.assertEqual(bills[(billed.id, 2025, 1)]['max_count'], 4)
+        self.assertEqual(bills[(billed.id, 2025, 1)]['final_amount'], Decimal('50.00'))
+        self.assertTrue(bills[(billed.id, 2025, 1)]['minimum_applied'])
+        # Vasaris – mėnesio maksimumas, kovas – paskutinis vasario įrašas
+        self.assertEqual(bills[(billed.id, 2025, 2)]['final_amount'], Decimal('90.00'))
+        self.assertEqual(bills[(billed.id, 2025, 2)]['logs_count'], 2)
+        self.assertEqual(bills[(billed.id, 2025, 3)]['max_count'], 6)
+        self.assertFalse(bills[(unbilled.id, 2025, 2)]['has_settings'])
+
+        self.assertEqual(calculate_monthly_bill(billed.id, 2025, 3)['max_count'], 6)
+        self.assertIn('error', calculate_monthly_bill(0, 2025, 3))
+
+
+class MonthlyInvoiceTest(TestCase):
+    def test_closed_month_is_frozen(self):
+        import datetime
+        from decimal import Decimal
+        from django.utils import timezone
+        from users.billing_service import close_month, get_monthly_bills
+        from users.models import ContractSettings, EmployeeCountLog, MonthlyInvoice
+
+        company = Company.objects.create(name='InvoiceCorp')
+        ContractSettings.objects.create(
+            company=company, price_per_employee=Decimal('5.00'), contract_start=datetime.date(2025, 1, 1),
+        )
+        EmployeeCountLog.objects.all().delete()
+        log = EmployeeCountLog.objects.create(
+            company=company, active_count=10,
+            recorded_at=timezone.make_aware(datetime.datetime(2025, 3, 10, 12)),
+        )
+
+        self.assertEqual(close_month(2025, 3), 1)
+        self.assertEqual(close_month(2025, 3), 0)  # jau uždarytas
+
+        # Vėlesnis logo pakeitimas uždaryto mėnesio nebekeičia
+        log.active_count = 20
+        log.save()
+        bills = get_monthly_bills([company.id], [(2025, 3), (2025, 4)])
+        self.assertTrue(bills[(company.id, 2025, 3)]['frozen'])
+        self.assertEqual(bills[(company.id, 2025, 3)]['final_amount'], Decimal('50.00'))
+        # Neuždarytas mėnuo skaičiuojamas gyvai
+        self.assertNotIn('frozen', bills[(company.id, 2025, 4)])
+        self.assertEqual(bills[(company.id, 2025, 4)]['final_amount'], Decimal('100.00'))
+
+        close_month(2025, 3, overwrite=True)
+        self.assertEqual(MonthlyInvoice.objects.get(company=company, year=2025, month=3).max_count, 20)
+
+
+class RevenueForecastTest(TestCase):
+    def test_models_and_min_fee(self):
+        import numpy as np
+        from users.revenue_forecast import apply_contract_pricing, linear_forecast, seasonal_naive_forecast
+
+        history = np.array([[10, 12, 14, 16], [5, 5, 5, 5]], dtype=float)
+        np.testing.assert_allclose(linear_forecast(history, 2), [[18, 20], [5, 5]])
+
+        yearly = np.arange(24, dtype=float).reshape(1, 24)
+        np.testing.assert_allclose(seasonal_naive_forecast(yearly, 3), [[12, 13, 14]])
+        np.testing.assert_allclose(seasonal_naive_forecast(history, 2), [[16, 16], [5, 5]])
+
+        amounts = apply_contract_pricing(
+            np.array([[2.0, 10.0]]), np.array([[5.0, 5.0]]), np.array([[20.0, 20.0]]), np.array([[True, False]]),
+        )
+        np.testing.assert_allclose(amounts, [[20.0, 0.0]])
+
+    def test_forecast_for_companies(self):
+        import datetime
+        from decimal import Decimal
+        from django.utils import timezone
+        from users.models import ContractSettings, EmployeeCountLog
+        from users.revenue_forecast import forecast_revenue
+
+        today = datetime.date(2025, 6, 15)
+        company = Company.objects.create(name='ForecastCorp')
+        ContractSettings.objects.create(
+            company=company, price_per_employee=Decimal('10.00'), contract_start=datetime.date(2025, 1, 1),
+            contract_end=datetime.date(2025, 7, 31),
+        )
+        EmployeeCountLog.objects.all().delete()
+        for month, count in [(4, 10), (5, 12), (6, 14)]:
+            EmployeeCountLog.objects.create(
+                company=company, active_count=count,
+                recorded_at=timezone.make_aware(datetime.datetime(2025, month, 10, 12)),
+            )
+
+        forecast = forecast_revenue([company.id], 2, history_length=3, today=today)
+        self.assertEqual(forecast['months'], [(2025, 7), (2025, 8)])
+        self.assertEqual(forecast['headcount'].tolist(), [[16.0, 18.0]])
+        # Rugpjūtį sutartis nebegalioja
+        self.assertEqual(forecast['amount'].tolist(), [[160.0, 0.0]])
+
+
+class EmployeeCountLoggingTest(TestCase):
+    def test_coalesced_refresh_keeps_daily_max(self):
+        from users.employee_counts import coalesce_employee_counts
+        from users.models import EmployeeCountLog
+
+        company = Company.objects.create(name='CountCorp')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with coalesce_employee_counts():
+                for i in range(5):
+                    user = User.objects.create_user(username=f'count{i}', password='password')
+                    user.profile.company_link = company
+                    user.profile.save()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(EmployeeCountLog.objects.get(company=company).active_count, 5)
+
+        # Paprastas išsaugojimas (pvz. prisijungimas) skaičiaus neperskaičiuoja
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            user.save()
+        self.assertEqual(callbacks, [])
+
+        # Deaktyvavus darbuotoją dienos įraše lieka didžiausias dienos skaičius
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_active = False
+            user.save()
+        self.assertEqual(EmployeeCountLog.objects.get(company=company).active_count, 5)
+
+    def test_active_employee_counter(self):
+        from users.employee_counts import repair_active_employee_counts
+
+        company = Company.objects.create(name='CounterCorp')
+        other = Company.objects.create(name='OtherCorp')
+        users = []
+        for i in range(3):
+            user = User.objects.create_user(username=f'counter{i}', password='password')
+            user.profile.company_link = company
+            user.profile.save()
+            users.append(user)
+
+        users[0].is_active = False
+        users[0].save()
+        users[1].profile.company_link = other
+        users[1].profile.save()
+        users[2].delete()
+        company.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((company.active_employee_count, other.active_employee_count), (0, 1))
+
+        users[0].is_active = True
+        users[0].save()
+        company.refresh_from_db()
+        self.assertEqual(company.active_employee_count, 1)
+
+        Company.objects.filter(pk=company.pk).update(active_employee_count=7)
+        self.assertEqual(repair_active_employee_counts(), {company.id: (7, 1)})
+
+    def test_deferred_fields_do_not_change_counter(self):
+        from users.models import Profile
+
+        company = Company.objects.create(name='DeferredCorp')
+        other = Company.objects.create(name='DeferredOther')
+        user = User.objects.create_user(username='deferred', password='password')
+        user.profile.company_link = company
+        user.profile.save()
+
+        def counts():
+            return tuple(Company.objects.filter(pk__in=[company.pk, other.pk]).order_by('pk')
+                         .values_list('active_employee_count', flat=True))
+
+        User.objects.only('id', 'username').get(pk=user.pk).save()
+        Profile.objects.only('id', 'user').get(user=user).save()
+        self.assertEqual(counts(), (1, 0))
+
+        # Atidėtas, bet pakeistas laukas vis tiek įskaitomas
+        deferred_user = User.objects.only('id', 'username').get(pk=user.pk)
+        deferred_user.is_active = False
+        deferred_user.save()
+        self.assertEqual(counts(), (0, 0))
+        User.objects.filter(pk=user.pk).update(is_active=True)
+        Company.objects.filter(pk=company.pk).update(active_employee_count=1)
+
+        deferred_profile = Profile.objects.only('id', 'user').get(user=user)
+        deferred_profile.company_link = other
+        deferred_profile.save()
+        self.assertEqual(counts(), (0, 1))
+
+
+class OpenRouterClientTest(TestCase):
+    class FakeResponse:
+        def __init__(self, status_code, headers=None, data=None):
+            self.status_code = status_code
+            self.headers = headers or {}
+            self._data = data or {}
+
+        def json(self):
+            return self._data
+
+        def close(self):
+            pass
+
+        def raise_for_status(self):
+            import requests
+            if self.status_code >= 400:
+                raise requests.exceptions.HTTPError(f'{self.status_code}', response=self)
+
+    class FakeSession:
+        def __init__(self, responses):
+            self.responses = list(responses)
+            self.calls = 0
+
+        def post(self, url, **kwargs):
+            self.calls += 1
+            response = self.responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+    def setUp(self):
+        from feedbackas import openrouter_client
+        self.client_module = openrouter_client
+        self._saved = (openrouter_client._session, openrouter_client._breaker)
+        openrouter_client._breaker = openrouter_client.CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    def tearDown(self):
+        self.client_module._session, self.client_module._breaker = self._saved
+
+    def test_retries_honor_retry_after(self):
+        session = self.FakeSession([
+            self.FakeResponse(429, headers={'Retry-After': '2'}),
+            self.FakeResponse(503),
+            self.FakeResponse(200, data={'ok': True}),
+        ])
+        self.client_module._session = session
+        delays = []
+        data, metrics = self.client_module.post_chat_completion({}, {}, sleep=delays.append)
+        self.assertEqual(data, {'ok': True})
+        self.assertEqual((session.calls, metrics.attempts), (3, 3))
+        self.assertEqual(delays[0], 2.0)
+        self.assertLessEqual(delays[1], 1.0)  # jitter: [0, base * 2]
+
+    def test_every_attempt_takes_a_rate_limit_token(self):
+        from unittest import mock
+
+        self.client_module._session = self.FakeSession([
+            self.FakeResponse(429, headers={'Retry-After': '0'}),
+            self.FakeResponse(200, data={'ok': True}),
+        ])
+        with mock.patch.object(self.client_module, 'throttle_openrouter_call') as throttle:
+            self.client_module.post_chat_completion({}, {}, sleep=lambda delay: None)
+        self.assertEqual(throttle.call_count, 2)
+
+    def test_circuit_opens_and_fails_fast(self):
+        import requests
+        from django.test import override_settings
+
+        self.client_module._session = self.FakeSession([self.FakeResponse(500), self.FakeResponse(500)])
+        with override_settings(OPENROUTER_MAX_RETRIES=0):
+            for _ in range(2):
+                with self.assertRaises(requests.exceptions.HTTPError):
+                    self.client_module.post_chat_completion({}, {}, sleep=lambda delay: None)
+            with self.assertRaises(self.client_module.CircuitOpenError):
+                self.client_module.post_chat_completion({}, {}, sleep=lambda delay: None)
+        self.assertEqual(self.client_module._session.calls, 2)
+        self.assertEqual(self.client_module.latency_stats()['circuit'], 'open')
+
+    def test_protocol_error_releases_half_open_probe(self):
+        import requests
+
+        clock = [0.0]
+        breaker = self.client_module.CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: clock[0])
+        self.client_module._breaker = breaker
+        breaker.record_failure()
+        clock[0] = 10.0
+        self.client_module._session = self.FakeSession([
+            requests.exceptions.ChunkedEncodingError('broken'),
+            self.FakeResponse(200, data={'ok': True}),
+        ])
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            self.client_module.post_chat_completion({}, {}, sleep=lambda delay: None)
+        self.assertEqual(breaker.state, 'open')
+
+        # Po reset_timeout vėl praleidžiama bandomoji užklausa, sėkmė uždaro grandinę
+        clock[0] = 20.0
+        data, _ = self.client_module.post_chat_completion({}, {}, sleep=lambda delay: None)
+        self.assertEqual(data, {'ok': True})
+        self.assertEqual(breaker.state, 'closed')
+
+
+class ExtractionCacheTest(TestCase):
+    def setUp(self):
+        from .redis_client import shared_cache
+        shared_cache().clear()
+
+    def test_identical_input_calls_llm_once(self):
+        from unittest import mock
+        from .redis_client import shared_cache
+        from .ai_service import OpenRouterService
+        from .models import AIExtractionCache
+
+        response = '```json\n{"strengths": ["Greitai mokosi."], "improvements": []}\n```'
+        with mock.patch.object(OpenRouterService, '_call_openrouter', return_value=response) as call, \
+                mock.patch('feedbackas.extraction_cache.EXTRACTION_HIT_SAMPLE_RATE', 1):
+            first = OpenRouterService.extract_strengths_weaknesses('Puikus  darbas.', 'Ačiū ')
+            # Skiriasi tik tarpais – tas pats raktas, atsakymas iš Redis
+            second = OpenRouterService.extract_strengths_weaknesses(' Puikus darbas.', 'Ačiū')
+            # Išvalius Redis, rezultatas imamas iš DB
+            shared_cache().clear()
+            third = OpenRouterService.extract_strengths_weaknesses('Puikus darbas.', 'Ačiū')
+            OpenRouterService.extract_strengths_weaknesses('Kitas tekstas.', 'Ačiū')
+
+        self.assertEqual(call.call_count, 2)
+        self.assertEqual(first, {'strengths': ['Greitai mokosi.'], 'improvements': []})
+        self.assertEqual(first, second)
+        self.assertEqual(first, third)
+        self.assertEqual(AIExtractionCache.objects.count(), 2)
+        self.assertEqual(AIExtractionCache.objects.order_by('created_at', 'id').first().hits, 2)
+
+    def test_redis_hits_skip_db_and_outage_falls_back_to_db(self):
+        from unittest import mock
+        import redis
+        from .extraction_cache import get_cached_extraction, store_extraction
+        from .models import AIExtractionCache
+
+        store_extraction('k' * 64, {'strengths': [], 'improvements': []}, 1, 'm')
+        with mock.patch('feedbackas.extraction_cache.random.randrange', return_value=1), \
+                self.assertNumQueries(0):
+            self.assertIsNotNone(get_cached_extraction('k' * 64))
+
+        with mock.patch('django.core.cache.backends.locmem.LocMemCache.get', side_effect=redis.ConnectionError):
+            self.assertEqual(get_cached_extraction('k' * 64), {'strengths': [], 'improvements': []})
+        self.assertEqual(AIExtractionCache.objects.get().hits, 1)
+
+    def test_failed_parse_is_not_cached(self):
+        from unittest import mock
+        from .ai_service import OpenRouterService
+
+        with mock.patch.object(OpenRouterService, '_call_openrouter', return_value='ne JSON') as call:
+            OpenRouterService.extract_strengths_weaknesses('Tekstas', '')
+            OpenRouterService.extract_strengths_weaknesses('Tekstas', '')
+        self.assertEqual(call.call_count, 2)
+
+
+class BatchExtractionTest(TestCase):
+    def setUp(self):
+        from .redis_client import shared_cache
+        shared_cache().clear()
+        self.user = User.objects.create_user(username='batch@example.com', password='pw')
+
+    def _response(self, content, cost):
+        from feedbackas.openrouter_client import CallMetrics
+        data = {
+            'choices': [{'message': {'content': content}}],
+            'usage': {'prompt_tokens': 300, 'completion_tokens': 90, 'cost': cost},
+        }
+        return data, CallMetrics(latency_ms=50, attempts=1), 'test-model'
+
+    def test_batch_parses_items_and_falls_back_for_missing(self):
+        from decimal import Decimal
+        from unittest import mock
+        from django.db.models import Sum
+        from .ai_service import OpenRouterService
+        from .models import AIUsageLog
+        from .usage_log import flush_usage_logs
+
+        # 2-ojo elemento atsakyme nėra, 3-iasis apkarpytas po pilno objekto
+        batch_content = (
+            '```json\n[{"id": "1", "strengths": ["Tikslus."], "improvements": []},'
+            '{"id": 3, "strengths": [], "improvements": ["Daugiau iniciatyvos."]}, {"id": "4", "strengths": ["Nebai'
+        )
+        single_content = '{"strengths": ["Komandinis."], "improvements": []}'
+        items = [
+            ('a', 'Tikslus darbas.', '', self.user, None),
+            ('b', 'Puikiai dirba komandoje ir padeda kitiems.', '', self.user, None),
+            ('c', 'Trūksta iniciatyvos.', '', self.user, None),
+            ('d', 'Tikslus   darbas.', '', self.user, None),  # toks pat kaip 'a'
+            ('e', '', '', self.user, None),
+        ]
+        with mock.patch.object(OpenRouterService, '_request', side_effect=[
+            self._response(batch_content, 0.003),
+            self._response(single_content, 0.001),
+        ]) as request:
+            results = OpenRouterService.extract_strengths_weaknesses_batch(items, batch_size=10)
+
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(results['a'], {'strengths': ['Tikslus.'], 'improvements': []})
+        self.assertEqual(results['d'], results['a'])
+        self.assertEqual(results['b'], {'strengths': ['Komandinis.'], 'improvements': []})
+        self.assertEqual(results['c'], {'strengths': [], 'improvements': ['Daugiau iniciatyvos.']})
+        self.assertEqual(results['e'], {'strengths': [], 'improvements': []})
+
+        # Sugrupuotos užklausos kaina padalinta 3 unikaliems tekstams + 1 pavienė užklausa
+        flush_usage_logs()
+        logs = AIUsageLog.objects.filter(user=self.user)
+        self.assertEqual(logs.count(), 4)
+        totals = logs.aggregate(cost=Sum('total_cost'), prompt=Sum('prompt_tokens'))
+        self.assertEqual(totals['cost'], Decimal('0.004'))
+        self.assertEqual(totals['prompt'], 600)
+        self.assertEqual(logs.exclude(raw_archive=None).count(), 2)
+
+        # Pakartotinai – viskas iš kešo
+        with mock.patch.object(OpenRouterService, '_request') as request:
+            again = OpenRouterService.extract_strengths_weaknesses_batch(items)
+        request.assert_not_called()
+        self.assertEqual(again, results)
+
+    def test_transport_error_is_not_retried_per_item(self):
+        import requests
+        from unittest import mock
+        from .ai_service import OpenRouterService, parse_batch_traits
+
+        items = [(str(i), f'Tekstas {i}.', '', self.user, None) for i in range(3)]
+        with mock.patch.object(OpenRouterService, '_request', side_effect=requests.exceptions.HTTPError('429')) as request:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                OpenRouterService.extract_strengths_weaknesses_batch(items, batch_size=10)
+        self.assertEqual(request.call_count, 1)
+
+        # Objektas be abiejų raktų – ne rezultatas
+        self.assertEqual(parse_batch_traits('[{"id": "1"}, {"id": "2", "strengths": []}]', ['1', '2']), {})
+
+    def test_split_by_weights_keeps_total(self):
+        from decimal import Decimal
+        from .ai_service import split_by_weights
+
+        self.assertEqual(split_by_weights(10, [1, 1, 1]), [3, 3, 4])
+        shares = split_by_weights(Decimal('0.0000000010'), [3, 3, 3])
+        self.assertEqual(sum(shares), Decimal('0.0000000010'))
+
+
+class AIBackfillTest(TransactionTestCase):
+    """Gijos naudoja atskiras DB jungtis, todėl duomenys turi būti patvirtinti."""
+
+    @staticmethod
+    def _fake_request(prompt, max_tokens=1024):
+        import re
+        from feedbackas.openrouter_client import CallMetrics
+
+        ids = re.findall(r'\[id: (\d+)\]', prompt)
+        items = [{'id': item_id, 'strengths': ['Stiprybė'], 'improvements': []} for item_id in ids]
+        data = {'choices': [{'message': {'content': json.dumps(items)}}], 'usage': {}}
+        return data, CallMetrics(latency_ms=1, attempts=1), 'test-model'
+
+    def test_backfill_processes_all_and_resumes(self):
+        from datetime import date
+        from unittest import mock
+        from .redis_client import shared_cache
+        from .ai_backfill import run_ai_backfill
+        from .ai_service import OpenRouterService
+        from .models import AIBackfillCheckpoint, Feedback, FeedbackRequest
+
+        shared_cache().clear()
+        user = User.objects.create_user(username='backfill@example.com', password='pw')
+        feedbacks = []
+        for i in range(7):
+            request = FeedbackRequest.objects.create(
+                requester=user, requested_to=user, project_name='P',
+                due_date=date.today(), status='completed',
+            )
+            feedbacks.append(Feedback.objects.create(
+                feedback_request=request, rating=3, keywords='', feedback=f'Atsiliepimas {i}',
+            ))
+        reports = []
+        with mock.patch.object(OpenRouterService, '_request', side_effect=self._fake_request) as request:
+            # Viena gija: SQLite atminties DB rakina lentelę lygiagrečiai rašant (Postgres – ne)
+            progress = run_ai_backfill(name='test', workers=1, batch_size=3, report=reports.append)
+
+        self.assertEqual(request.call_count, 3)
+        self.assertEqual((progress.processed, progress.updated, progress.failed), (7, 7, 0))
+        self.assertEqual(Feedback.objects.filter(extracted_strengths=['Stiprybė']).count(), 7)
+        checkpoint = AIBackfillCheckpoint.objects.get(name='test')
+        self.assertEqual(checkpoint.last_id, feedbacks[-1].id)
+        self.assertIsNotNone(checkpoint.finished_at)
+        self.assertTrue(reports)
+
+        # Pakartotinis paleidimas tęsia nuo kontrolinio taško – nieko nebelieka
+        with mock.patch.object(OpenRouterService, '_request', side_effect=self._fake_request) as request:
+            progress = run_ai_backfill(name='test', reextract=True, workers=1, batch_size=3)
+        request.assert_not_called()
+        self.assertEqual(progress.total, 0)
+
+    def test_failed_batches_are_retried_and_open_circuit_aborts(self):
+        from datetime import date
+        from unittest import mock
+        from .redis_client import shared_cache
+        from .ai_backfill import run_ai_backfill
+        from .ai_service import OpenRouterService
+        from .models import AIBackfillCheckpoint, Feedback, FeedbackRequest
+        from .openrouter_client import CircuitOpenError
+
+        shared_cache().clear()
+        user = User.objects.create_user(username='outage@example.com', password='pw')
+        for i in range(7):
+            request = FeedbackRequest.objects.create(
+                requester=user, requested_to=user, project_name='P', due_date=date.today(), status='completed',
+            )
+            Feedback.objects.create(feedback_request=request, rating=3, keywords='', feedback=f'Tekstas {i}')
+
+        outage = [self._fake_request, CircuitOpenError('open')]
+        def flaky(prompt, max_tokens=1024):
+            step = outage.pop(0) if outage else CircuitOpenError('open')
+            if isinstance(step, Exception):
+                raise step
+            return step(prompt, max_tokens)
+
+        with mock.patch.object(OpenRouterService, '_request', side_effect=flaky):
+            with self.assertRaises(CircuitOpenError):
+                run_ai_backfill(name='outage', workers=1, batch_size=3)
+        checkpoint = AIBackfillCheckpoint.objects.get(name='outage')
+        self.assertIsNone(checkpoint.finished_at)
+        self.assertTrue(checkpoint.failed_ids)
+        self.assertEqual(Feedback.objects.filter(extracted_strengths=['Stiprybė']).count(), 3)
+
+        # Kitas paleidimas pakartoja nepavykusius ir tęsia – visi apdoroti
+        with mock.patch.object(OpenRouterService, '_request', side_effect=self._fake_request):
+            run_ai_backfill(name='outage', workers=1, batch_size=3)
+        self.assertEqual(Feedback.objects.filter(extracted_strengths=['Stiprybė']).count(), 7)
+        self.assertEqual(AIBackfillCheckpoint.objects.get(name='outage').failed_ids, [])
+
+
+class StreamingGenerationTest(TestCase):
+    class FakeStreamResponse(OpenRouterClientTest.FakeResponse):
+        def __init__(self, lines):
+            super().__init__(200)
+            self.lines = lines
+            self.encoding = None
+
+        def iter_lines(self, chunk_size=None, decode_unicode=False):
+            return iter(self.lines)
+
+    def setUp(self):
+        from feedbackas import openrouter_client
+        self.client_module = openrouter_client
+        self._saved = (openrouter_client._session, openrouter_client._breaker)
+        openrouter_client._breaker = openrouter_client.CircuitBreaker()
+        self.company = Company.objects.create(name='StreamCorp')
+        self.user = User.objects.create_user(username='stream@example.com', password='pw')
+        self.user.profile.company_link = self.company
+        self.user.profile.save()
+
+    def tearDown(self):
+        self.client_module._session, self.client_module._breaker = self._saved
+
+    def _event(self, data):
+        return 'data: ' + json.dumps(data, ensure_ascii=False)
+
+    def test_placeholder_split_across_chunks(self):
+        from .ai_service import PlaceholderReplacer
+
+        replacer = PlaceholderReplacer('[VARDAS]', 'Jonai')
+        parts = [replacer.feed(chunk) for chunk in ['Labas, [VAR', 'DAS]! Tu [', 'ir [V']]
+        self.assertEqual(parts, ['Labas, ', 'Jonai! Tu ', '[ir '])
+        self.assertEqual(replacer.flush(), '[V')
+
+    def test_stream_endpoint_forwards_chunks_and_logs_usage(self):
+        from django.urls import reverse
+        from .models import AIUsageLog
+        from .usage_log import flush_usage_logs
+
+        lines = [
+            ': OPENROUTER PROCESSING',
+            self._event({'id': 'gen-1', 'model': 'm', 'choices': [{'delta': {'content': 'Ačiū, [VAR'}}]}),
+            '',
+            self._event({'id': 'gen-1', 'choices': [{'delta': {'content': 'DAS], už darbą.'}}]}),
+            self._event({'id': 'gen-1', 'choices': [], 'usage': {
+                'prompt_tokens': 120, 'completion_tokens': 8, 'cost': 0.0002,
+            }}),
+            'data: [DONE]',
+        ]
+        self.client_module._session = OpenRouterClientTest.FakeSession([self.FakeStreamResponse(lines)])
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('stream_ai_feedback'),
+            data=json.dumps({'ratings': {}, 'colleague_name': 'Jonas'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        body = b''.join(response.streaming_content).decode('utf-8')
+        events = [json.loads(line[6:]) for line in body.splitlines() if line.startswith('data: ')]
+        self.assertEqual(''.join(event.get('text', '') for event in events), 'Ačiū, Jonas, už darbą.')
+        self.assertIn('event: done', body)
+
+        flush_usage_logs()
+        log = AIUsageLog.objects.get(user=self.user)
+        self.assertEqual((log.request_type, log.prompt_tokens, log.completion_tokens), ('feedback_generation', 120, 8))
+        self.assertEqual(log.company, self.company)
+        self.assertEqual(log.raw_response['choices'][0]['message']['content'], 'Ačiū, [VARDAS], už darbą.')
+
+    def test_client_disconnect_still_logs_partial_usage(self):
+        from .ai_service import OpenRouterService
+        from .models import AIUsageLog
+        from .usage_log import flush_usage_logs
+
+        lines = [
+            self._event({'id': 'gen-2', 'model': 'm', 'choices': [{'delta': {'content': 'Pirmas sakinys. '}}]}),
+            self._event({'id': 'gen-2', 'choices': [{'delta': {'content': 'Antras sakinys.'}}]}),
+            'data: [DONE]',
+        ]
+        self.client_module._session = OpenRouterClientTest.FakeSession([self.FakeStreamResponse(lines)])
+        chunks = OpenRouterService.generate_stream({}, '', '', '', 'Jonas', user=self.user, company=self.company)
+        self.assertEqual(next(chunks), 'Pirmas sakinys. ')
+        chunks.close()
+
+        flush_usage_logs()
+        log = AIUsageLog.objects.get(user=self.user)
+        self.assertFalse(log.raw_response['completed'])
+        self.assertEqual(log.raw_response['choices'][0]['message']['content'], 'Pirmas sakinys. ')
+        self.assertIsNotNone(log.latency_ms)
+
+
+class AITaskStatusTest(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='TaskCorp')
+        self.owner = User.objects.create_user(username='owner@example.com', password='pw')
+        self.other = User.objects.create_user(username='other@example.com', password='pw')
+        for user in (self.owner, self.other):
+            user.profile.company_link = self.company
+            user.profile.save()
+
+    def _status(self, user, result, wait='30'):
+        from unittest import mock
+        from django.urls import reverse
+
+        self.client.force_login(user)
+        with mock.patch('feedbackas.task_results.wait_for_task_result', return_value=result) as waiter:
+            response = self.client.get(reverse('check_ai_task_status'), {'task_id': 'abc', 'wait': wait})
+        return response, waiter
+
+    def test_result_comes_from_redis_without_orm(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        result = {'success': True, 'result': 'Puikus darbas, Jonai.', 'user_id': self.owner.id}
+        with CaptureQueriesContext(connection) as queries:
+            response, waiter = self._status(self.owner, result)
+        self.assertEqual(response.json(), {'status': 'completed', 'generated_feedback': 'Puikus darbas, Jonai.'})
+        self.assertFalse([query for query in queries.captured_queries if 'django_q' in query['sql']])
+        # Laukimas apribotas iki 25 s
+        waiter.assert_called_once_with('abc', 25)
+
+    def test_pending_and_foreign_results(self):
+        response, _ = self._status(self.owner, None)
+        self.assertEqual(response.json(), {'status': 'processing'})
+
+        result = {'success': True, 'result': 'Slapta', 'user_id': self.owner.id}
+        response, _ = self._status(self.other, result)
+        self.assertEqual(response.status_code, 404)
+
+    def test_non_finite_wait_does_not_block(self):
+        for wait in ('nan', 'inf', '-inf', 'abc'):
+            _, waiter = self._status(self.owner, None, wait=wait)
+            waiter.assert_called_once_with('abc', 0)
+
+
+class UsageLogBufferTest(TestCase):
+    def test_buffer_writes_in_bulk_and_archives_responses(self):
+        from django.test import override_settings
+        from .models import AIResponseArchive, AIUsageLog
+        from .usage_log import UsageLogBuffer, record_usage, flush_usage_logs
+
+        user = User.objects.create_user(username='usage@example.com', password='pw')
+        raw = {'id': 'gen-1', 'choices': [{'message': {'content': 'x' * 50}}], 'usage': {'cost': 0.1}}
+        with override_settings(AI_RAW_RESPONSE_MAX_CHARS=10):
+            record_usage(user=user, request_type='feedback_generation', model_name='m', raw_response=raw)
+            record_usage(user=user, request_type='feedback_analysis', model_name='m')
+            self.assertEqual(AIUsageLog.objects.count(), 0)
+            # savepoint, archyvai, žurnalas; dienos suvestinė – savepoint, 2 × (paieška, savepoint + sukūrimas, F()), release; release
+            with self.assertNumQueries(16):
+                self.assertEqual(flush_usage_logs(), 2)
+
+        self.assertEqual(AIUsageLog.objects.count(), 2)
+        archive = AIResponseArchive.objects.get()
+        self.assertTrue(archive.truncated)
+        log = AIUsageLog.objects.get(request_type='feedback_generation')
+        self.assertEqual(log.raw_response['choices'][0]['message']['content'], 'x' * 10)
+        self.assertIsNone(AIUsageLog.objects.get(request_type='feedback_analysis').raw_response)
+
+        # Pasiekus flush_size įrašoma iškart
+        buffer = UsageLogBuffer(flush_size=2, flush_interval=60)
+        buffer.add(AIUsageLog(user=user, request_type='a', model_name='m'))
+        buffer.add(AIUsageLog(user=user, request_type='b', model_name='m'))
+        self.assertEqual(AIUsageLog.objects.count(), 4)
+
+
+class UsageLogDeletedRelationTest(TransactionTestCase):
+    def test_deleted_user_does_not_block_buffer(self):
+        from .models import AIUsageLog
+        from .usage_log import UsageLogBuffer
+
+        gone = User.objects.create_user(username='gone@example.com', password='pw')
+        kept = User.objects.create_user(username='kept@example.com', password='pw')
+        buffer = UsageLogBuffer(flush_size=100, flush_interval=60)
+        buffer.add(AIUsageLog(user_id=gone.id, request_type='a', model_name='m'))
+        buffer.add(AIUsageLog(user_id=kept.id, request_type='b', model_name='m'))
+        gone.delete()
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.flush(), 0)
+        self.assertIsNone(AIUsageLog.objects.get(request_type='a').user_id)
+        self.assertEqual(AIUsageLog.objects.get(request_type='b').user_id, kept.id)
+
+
+class AIUsageDailyTest(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='AI Co')
+        self.user = User.objects.create_user(username='daily@example.com', password='pw')
+        self.superuser = User.objects.create_superuser(username='root', password='pw')
+
+    def _record(self, request_type, cost, **fields):
+        from decimal import Decimal
+        from .usage_log import record_usage
+
+        record_usage(
+            user=self.user, company=self.company, request_type=request_type, model_name='m',
+            prompt_tokens=10, completion_tokens=5, total_cost=Decimal(cost), **fields,
+        )
+
+    def test_flush_updates_daily_rollup_and_readers_use_it(self):
+        import datetime
+        from decimal import Decimal
+        from django.urls import reverse
+        from django.utils import timezone
+        from .models import AIUsageDaily
+        from .rollups import rebuild_ai_usage_daily
+        from .usage_log import flush_usage_logs
+
+        yesterday = timezone.now() - datetime.timedelta(days=1)
+        self._record('feedback_generation', '0.10')
+        self._record('feedback_generation', '0.20')
+        self._record('feedback_analysis', '0.05')
+        self._record('feedback_generation', '1.00', timestamp=yesterday)
+        flush_usage_logs()
+        self._record('feedback_generation', '0.30')
+        flush_usage_logs()
+
+        today = AIUsageDaily.objects.get(date=timezone.localdate(), request_type='feedback_generation')
+        self.assertEqual((today.calls, today.prompt_tokens, today.completion_tokens), (3, 30, 15))
+        self.assertEqual(today.total_cost, Decimal('0.60'))
+        self.assertEqual(AIUsageDaily.objects.count(), 3)
+
+        # Pilnas perskaičiavimas duoda tas pačias eilutes
+        snapshot = sorted(AIUsageDaily.objects.values_list('date', 'request_type', 'calls', 'total_cost'))
+        self.assertEqual(rebuild_ai_usage_daily(), 3)
+        self.assertEqual(sorted(AIUsageDaily.objects.values_list('date', 'request_type', 'calls', 'total_cost')), snapshot)
+
+        if timezone.localdate(yesterday).month == timezone.localdate().month:
+            self.assertEqual(self.company.get_current_month_ai_queries_count(), 5)
+        self.assertEqual(list(self.company.get_top_ai_users())[0]['query_count'], 5)
+
+        self.client.force_login(self.superuser)
+        day = timezone.localdate().isoformat()
+        response = self.client.get(reverse('superadmin_ai_analytics'), {'start_date': day, 'end_date': day})
+        self.assertEqual(response.context['total_queries'], 4)
+        self.assertEqual(response.context['total_cost'], Decimal('0.65'))
+        self.assertEqual(response.context['user_stats'][0]['total_queries'], 3)
+
+        # Admin sumos: dienos ribų ir tipo filtrai atsakomi iš suvestinės
+        midnight = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        response = self.client.get(reverse('admin:feedbackas_aiusagelog_changelist'), {
+            'timestamp__gte': str(midnight), 'request_type__exact': 'feedback_generation',
+        })
+        self.assertIn('0.600000$', response.context_data['title'])
+
+    def test_concurrently_created_rollup_row_is_reused(self):
+        from unittest import mock
+        from django.utils import timezone
+        from .models import AIUsageDaily
+        from . import rollups
+        from .usage_log import flush_usage_logs
+
+        AIUsageDaily.objects.create(
+            date=timezone.localdate(), company=self.company, user=self.user,
+            request_type='feedback_generation', model_name='m', calls=1,
+        )
+        # Pirmoji paieška „nemato“ eilutės, kurią ką tik įrašė kitas procesas
+        find = rollups._find_ai_usage_daily
+        results = iter([None])
+        with mock.patch.object(rollups, '_find_ai_usage_daily', side_effect=lambda lookup: next(results, None) or find(lookup)):
+            self._record('feedback_generation', '0.10')
+            flush_usage_logs()
+
+        row = AIUsageDaily.objects.get()
+        self.assertEqual(row.calls, 2)
+
+
+class PromptBuilderTest(TestCase):
+    def test_generation_prompt_is_compact_and_budgeted(self):
+        from .ai_service import GENERATION_SECTION_BUDGETS, NAME_PLACEHOLDER, OpenRouterService
+        from .prompt_builder import TRUNCATION_MARK, estimate_tokens, fit_to_budget
+
+        # Pasikartojantys sakiniai išmetami prieš trumpinant
+        repeated = 'Puikiai dirba komandoje.  ' * 50
+        self.assertEqual(fit_to_budget(repeated, 20), 'Puikiai dirba komandoje.')
+
+        long_comments = ' '.join(f'Jonas atliko {index} užduotį laiku ir kokybiškai.' for index in range(300))
+        prompt = OpenRouterService._generation_prompt(
+            {'rating': 3, 'teamwork': 2}, 'lyderystė', long_comments, None, 'Jonas',
+        )
+        self.assertNotIn('  ', prompt)
+        self.assertNotIn('\n\n\n', prompt)
+        self.assertNotIn('Jonas', prompt)
+        self.assertIn(f'{NAME_PLACEHOLDER} atliko 0 užduotį', prompt)
+        self.assertIn(TRUNCATION_MARK, prompt)
+        comments = prompt.split('Komentarai:** ')[1].split('\n')[0]
+        self.assertLessEqual(estimate_tokens(comments), GENERATION_SECTION_BUDGETS['comments'])
+
+    def test_non_string_values_are_budgeted_as_text(self):
+        from .prompt_builder import build_prompt
+
+        prompt = build_prompt('{keywords} / {comments}', {'keywords': 50, 'comments': 50},
+                              keywords=['lyderystė', 'iniciatyva'], comments=42)
+        self.assertEqual(prompt, "['lyderystė', 'iniciatyva'] / 42")
+
+    def test_generate_records_estimated_prompt_tokens(self):
+        from unittest.mock import patch
+        from .ai_service import OpenRouterService
+        from .models import AIUsageLog
+        from .openrouter_client import CallMetrics
+        from .prompt_builder import estimate_tokens
+        from .usage_log import flush_usage_logs
+
+        user = User.objects.create_user(username='prompt@example.com', password='pw')
+        data = {
+            'choices': [{'message': {'content': 'Ačiū, [VARDAS]!'}}],
+            'usage': {'prompt_tokens': 700, 'completion_tokens': 20, 'cost': 0.001},
+        }
+        with patch('feedbackas.ai_service.post_chat_completion', return_value=(data, CallMetrics(12, 1))) as post:
+            text = OpenRouterService.generate({'rating': 3}, 'x', 'Geras darbas.', None, 'Ona', user=user)
+        self.assertEqual(text, 'Ačiū, Ona!')
+        flush_usage_logs()
+
+        log = AIUsageLog.objects.get(user=user)
+        prompt = post.call_args[0][1]['messages'][0]['content']
+        self.assertEqual((log.prompt_tokens, log.estimated_prompt_tokens), (700, estimate_tokens(prompt)))
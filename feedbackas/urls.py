@@ -62,6 +62,7 @@ urlpatterns = [
     path('team-statistics/member/<hashid:user_id>/', views.team_member_detail, name='team_member_detail'),
     path('generate_ai_feedback/', views.generate_ai_feedback, name='generate_ai_feedback'),
     path('check_ai_task_status/', views.check_ai_task_status, name='check_ai_task_status'),
+    path('stream_ai_feedback/', views.stream_ai_feedback, name='stream_ai_feedback'),
     path('all_feedback/', views.all_feedback_list, name='all_feedback_list'),
     path('get_feedback_data/', views.get_feedback_data, name='get_feedback_data'),
     path('management/', views.company_management, name='company_management'),
@@ -0,0 +1,210 @@
+"""
+Buferizuotas AIUsageLog rašymas.
+
+record_usage() tik įdeda įvykį į proceso buferį – užklausos/užduoties kelyje DB
+neliečiama. Buferis įrašomas vienu bulk_create, kai jame susikaupia
+AI_USAGE_FLUSH_SIZE įvykių, foninės gijos – kas AI_USAGE_FLUSH_INTERVAL sekundžių,
+ir proceso pabaigoje (atexit; django-q darbininkuose – multiprocessing finalizatorius).
+Įvykio laikas fiksuojamas record_usage() metu, ne įrašant.
+
+OpenRouter atsakymai (raw_response) suspaudžiami (zlib) į AIResponseArchive pagal
+politiką: išsaugoma AI_RAW_RESPONSE_SAMPLE_RATE dalis atsakymų, o ilgesnis nei
+AI_RAW_RESPONSE_MAX_CHARS sugeneruotas tekstas apkarpomas.
+
+Kartu su žurnalu atnaujinama AIUsageDaily dienos suvestinė (feedbackas.rollups),
+iš kurios skaitomos visos AI kaštų ir užklausų ataskaitos.
+"""
+import atexit
+import json
+import logging
+import multiprocessing.util
+import os
+import random
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SIZE = getattr(settings, 'AI_USAGE_FLUSH_SIZE', 50)
+FLUSH_INTERVAL = getattr(settings, 'AI_USAGE_FLUSH_INTERVAL', 5.0)
+# Kiek įvykių laikoma, kai DB laikinai nepasiekiama (senesni atmetami)
+MAX_PENDING = FLUSH_SIZE * 20
+
+
+def raw_response_policy(raw_response):
+    """
+    Grąžina (saugotinas atsakymas, ar apkarpytas) arba (None, False), jei pagal
+    atranką atsakymas nesaugomas.
+    """
+    if raw_response is None:
+        return None, False
+    if random.random() >= getattr(settings, 'AI_RAW_RESPONSE_SAMPLE_RATE', 1.0):
+        return None, False
+    max_chars = getattr(settings, 'AI_RAW_RESPONSE_MAX_CHARS', 20000)
+    truncated = False
+    choices = []
+    for choice in raw_response.get('choices') or ():
+        message = choice.get('message') or {}
+        content = message.get('content')
+        if isinstance(content, str) and len(content) > max_chars:
+            choice = {**choice, 'message': {**message, 'content': content[:max_chars]}}
+            truncated = True
+        choices.append(choice)
+    if truncated:
+        raw_response = {**raw_response, 'choices': choices}
+    return raw_response, truncated
+
+
+def build_archive(raw_response):
+    """Suspaustas AIResponseArchive (dar neišsaugotas) arba None."""
+    from .models import AIResponseArchive
+
+    raw_response, truncated = raw_response_policy(raw_response)
+    if raw_response is None:
+        return None
+    encoded = json.dumps(raw_response, ensure_ascii=False).encode('utf-8')
+    return AIResponseArchive(data=zlib.compress(encoded), original_size=len(encoded), truncated=truncated)
+
+
+def _write(batch):
+    from .models import AIResponseArchive, AIUsageLog
+    from .rollups import record_ai_usage
+
+    archived = []
+    for log, raw_response in batch:
+        # Po nepavykusio bandymo likę pk/archyvas priklauso atšauktai transakcijai
+        log.pk = None
+        log.raw_archive = None
+        archive = build_archive(raw_response)
+        if archive is not None:
+            archived.append((log, archive))
+    with transaction.atomic():
+        AIResponseArchive.objects.bulk_create([archive for _, archive in archived])
+        for log, archive in archived:
+            log.raw_archive = archive
+        AIUsageLog.objects.bulk_create([log for log, _ in batch])
+        # Dienos suvestinė – toje pačioje transakcijoje (nepavykus abu įrašomi iš naujo)
+        record_ai_usage([log for log, _ in batch])
+
+
+def _detach_missing_relations(log):
+    """Atsieja įvykį nuo vartotojo/įmonės, ištrintų po record_usage() (kaip SET_NULL)."""
+    from django.contrib.auth.models import User
+    from users.models import Company
+
+    if log.user_id and not User.objects.filter(pk=log.user_id).exists():
+        log.user_id = None
+    if log.company_id and not Company.objects.filter(pk=log.company_id).exists():
+        log.company_id = None
+
+
+class UsageLogBuffer:
+    """Gijoms saugus AIUsageLog įvykių buferis vienam procesui."""
+
+    def __init__(self, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._pid = None
+
+    def add(self, log, raw_response=None):
+        with self._lock:
+            self._ensure_started()
+            self._pending.append((log, raw_response))
+            full = len(self._pending) >= self.flush_size
+        if full:
+            self.flush()
+
+    def _ensure_started(self):
+        """Foninė gija ir išėjimo kabliukai – vieną kartą kiekviename procese (ir po fork)."""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        threading.Thread(target=self._run, name='ai-usage-log-flusher', daemon=True).start()
+        atexit.register(self.flush)
+        # multiprocessing vaikiniai procesai (django-q darbininkai) atexit nevykdo
+        multiprocessing.util.Finalize(self, self.flush, exitpriority=10)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._pending:
+                self.flush()
+                # Foninė gija DB jungties tarp įrašymų nelaiko
+                connection.close()
+
+    def flush(self):
+        """Įrašo visus buferio įvykius. Grąžina įrašytų skaičių."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                _write(batch)
+            except IntegrityError as e:
+                # Bent viena eilutė pažeidžia ryšį – kitos neturi būti jos įkaitės
+                logger.warning(f"Bulk write of {len(batch)} AI usage logs failed, writing one by one: {e}")
+                return self._write_each(batch)
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} AI usage logs: {e}")
+                self._requeue(batch)
+                return 0
+            return len(batch)
+
+    def _write_each(self, batch):
+        """
+        Įrašo įvykius po vieną. Ištrinto vartotojo ar įmonės ryšys nuimamas;
+        vis tiek neįrašomas įvykis atmetamas, o nepasiekus DB likusieji grąžinami į buferį.
+        """
+        written = 0
+        for index, item in enumerate(batch):
+            try:
+                try:
+                    _write([item])
+                except IntegrityError:
+                    _detach_missing_relations(item[0])
+                    _write([item])
+            except IntegrityError as e:
+                logger.error(f"Dropping unwritable AI usage log ({item[0].request_type}): {e}")
+                continue
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch) - index} AI usage logs: {e}")
+                self._requeue(batch[index:])
+                break
+            written += 1
+        return written
+
+    def _requeue(self, batch):
+        """Grąžina nepavykusius įvykius į buferio pradžią (ne daugiau nei MAX_PENDING)."""
+        with self._lock:
+            room = max(MAX_PENDING - len(self._pending), 0)
+            self._pending[:0] = batch[-room:] if room else []
+
+
+_buffer = UsageLogBuffer()
+
+
+def record_usage(raw_response=None, **fields):
+    """Įdeda AIUsageLog įvykį į buferį (laukai – kaip AIUsageLog modelio)."""
+    from .models import AIUsageLog
+
+    fields.setdefault('timestamp', timezone.now())
+    # Buferyje laikomi tik id: objektas iki įrašymo gali būti ištrintas
+    for relation in ('user', 'company'):
+        if relation in fields:
+            instance = fields.pop(relation)
+            fields[f'{relation}_id'] = instance.pk if instance is not None else None
+    _buffer.add(AIUsageLog(**fields), raw_response)
+
+
+def flush_usage_logs():
+    """Nedelsiant įrašo buferį (pvz. komandos pabaigoje ar testuose)."""
+    return _buffer.flush()
@@ -5,16 +5,19 @@ from django.utils.translation import gettext as _
 from django.contrib import messages
 from django.core.mail import send_mail
 from django.db.models import Q, Count, Avg, Sum
+from django.db.models.functions import Cast, NullIf
 from .forms import RegistrationForm, FeedbackForm
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
-from .models import FeedbackRequest, Feedback, AIUsageLog
-from users.models import Profile, ContractSettings, Department, Company
+from .models import FeedbackRequest, Feedback, AIUsageDaily, UserRatingSummary
+from users.models import Profile, ContractSettings, Department, DepartmentClosure, Company
+from users.hierarchy import department_tree, subtree_departments
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.db import OperationalError
 from django.views.decorators.http import require_POST
-import json, traceback
+import json, math, traceback
+from collections import defaultdict
 from django.db import models
 import logging
 from datetime import date, timedelta
@@ -379,25 +382,45 @@ def fill_feedback(request, request_id):
             if 'feedback' in request.POST:
                 feedback.feedback = request.POST.get('feedback')
             
-            feedback.save()
-            
-            # Save trait ratings if this is a questionnaire-based feedback
-            if feedback_request.questionnaire:
-                from .models import TraitRating
-                for trait in feedback_request.questionnaire.traits.all():
-                    trait_rating_value = request.POST.get(f'trait_rating_{trait.id}', 0)
-                    try:
-                        trait_rating_value = int(trait_rating_value)
-                    except (ValueError, TypeError):
-                        trait_rating_value = 0
-                    TraitRating.objects.update_or_create(
-                        feedback=feedback,
-                        trait=trait,
-                        defaults={'rating': trait_rating_value}
+            from django.db import transaction
+            from .rollups import record_completed_feedback
+
+            with transaction.atomic():
+                feedback.save()
+
+                # Save trait ratings if this is a questionnaire-based feedback
+                if feedback_request.questionnaire:
+                    from .models import TraitRating
+                    from .rollups import record_trait_rating
+                    previous_ratings = dict(
+                        TraitRating.objects.filter(feedback=feedback).values_list('trait_id', 'rating')
                     )
-            
-            feedback_request.status = 'completed'
-            feedback_request.save()
+                    for trait in feedback_request.questionnaire.traits.all():
+                        trait_rating_value = request.POST.get(f'trait_rating_{trait.id}', 0)
+                        try:
+                            trait_rating_value = int(trait_rating_value)
+                        except (ValueError, TypeError):
+                            trait_rating_value = 0
+                        TraitRating.objects.update_or_create(
+                            feedback=feedback,
+                            trait=trait,
+                            defaults={'rating': trait_rating_value}
+                        )
+                        # Klausimyno dienos suvestinė: naujas įvertinimas arba jo pokytis
+                        previous = previous_ratings.get(trait.id)
+                        record_trait_rating(
+                            feedback_request, trait.id,
+                            trait_rating_value - (previous or 0),
+                            count_delta=0 if previous is not None else 1,
+                        )
+
+                was_completed = feedback_request.status == 'completed'
+                feedback_request.status = 'completed'
+                feedback_request.save()
+
+                # Suvestinę atnaujiname tik tada, kai prašymas pirmą kartą tampa užbaigtas
+                if not was_completed:
+                    record_completed_feedback(feedback)
             
             # AI Išskyrimas (Stiprybės ir Tobulintinos sritys) - Foninė užduotis
             # Perkeliame čia, kad užtikrintume, jog feedback.feedback jau yra DB
@@ -442,63 +465,67 @@ def team_members_list(request):
         user_department = user.profile.department
         user_company_link = user.profile.company_link
         
-        # Check if user manages any department with sub-departments
+        # Check if user manages any department with sub-departments (any depth)
         managed_departments = Department.objects.filter(manager=user)
-        sub_departments = Department.objects.filter(parent__in=managed_departments)
+        sub_departments = subtree_departments(managed_departments, include_self=False).exclude(
+            id__in=managed_departments
+        )
         
         if sub_departments.exists():
             # Hierarchical mode: show department blocks
-            department_blocks = []
-            
-            # Sub-departments loop optimization
-            for dept in sub_departments.select_related('manager').prefetch_related('members__user'):
-                members_qs = User.objects.filter(profile__department=dept).select_related('profile').annotate(
-                    average_rating=Avg('made_requests__feedback__rating')
-                )
-                
-                # Fetch department avg with a single database hit using filter instead of evaluating qs
-                dept_avg = Feedback.objects.filter(
-                    feedback_request__requester__profile__department=dept,
-                    feedback_request__status='completed'
-                ).aggregate(Avg('rating'))['rating__avg']
-                
-                department_blocks.append({
+            # Visi skaičiai – po vieną sugrupuotą užklausą visiems padaliniams, blokai surenkami atmintyje
+            managed_list = list(managed_departments.select_related('manager'))
+            sub_list = list(sub_departments.select_related('manager').order_by('name'))
+            department_ids = [dept.id for dept in managed_list + sub_list]
+
+            all_members = User.objects.filter(profile__department__in=department_ids).exclude(id=user.id)
+            members = list(all_members.select_related('profile').annotate(
+                average_rating=Cast('rating_summary__rating_sum', models.FloatField())
+                / NullIf('rating_summary__feedback_count', 0)
+            ).order_by('first_name', 'last_name'))
+
+            rating_totals = {
+                row['user__profile__department']: row
+                for row in UserRatingSummary.objects.filter(
+                    user__profile__department__in=department_ids
+                ).exclude(user=user).values('user__profile__department').annotate(
+                    rating_sum=Sum('rating_sum'), feedback_count=Sum('feedback_count')
+                ).order_by()
+            }
+            pending_counts = dict(
+                FeedbackRequest.objects.filter(
+                    requester__profile__department__in=department_ids, status='pending'
+                ).exclude(requester=user).values('requester__profile__department').annotate(
+                    pending=Count('id')
+                ).values_list('requester__profile__department', 'pending').order_by()
+            )
+
+            members_by_department = defaultdict(list)
+            for member in members:
+                members_by_department[member.profile.department_id].append(member)
+
+            def department_block(dept):
+                totals = rating_totals.get(dept.id)
+                dept_members = members_by_department[dept.id]
+                return {
                     'department': dept,
-                    'members': members_qs,
-                    'member_count': members_qs.count(),
-                    'avg_rating': round(dept_avg, 2) if dept_avg else None,
-                })
-            
-            # Also include direct members of the managed department (not in sub-depts)
-            for managed_dept in managed_departments:
-                direct_members = User.objects.filter(profile__department=managed_dept).exclude(id=user.id).select_related('profile').annotate(
-                    average_rating=Avg('made_requests__feedback__rating')
-                )
-                if direct_members.exists():
-                    direct_avg = Feedback.objects.filter(
-                        feedback_request__requester__profile__department=managed_dept,
-                        feedback_request__status='completed'
-                    ).exclude(feedback_request__requester=user).aggregate(Avg('rating'))['rating__avg']
-                    
-                    department_blocks.insert(0, {
-                        'department': managed_dept,
-                        'members': direct_members,
-                        'member_count': direct_members.count(),
-                        'avg_rating': round(direct_avg, 2) if direct_avg else None,
-                    })
-            
+                    'members': dept_members,
+                    'member_count': len(dept_members),
+                    'avg_rating': round(totals['rating_sum'] / totals['feedback_count'], 2)
+                    if totals and totals['feedback_count'] else None,
+                    'pending_count': pending_counts.get(dept.id, 0),
+                }
+
+            # Tiesioginiai valdomų padalinių nariai (ne sub-padaliniuose) rodomi pirmi
+            department_blocks = [
+                department_block(dept) for dept in managed_list if members_by_department[dept.id]
+            ] + [department_block(dept) for dept in sub_list]
+
             # Overall stats
-            all_members = User.objects.filter(
-                Q(profile__department__in=sub_departments) | 
-                Q(profile__department__in=managed_departments)
-            ).exclude(id=user.id)
-            overall_avg_rating = Feedback.objects.filter(
-                feedback_request__requester__in=all_members, 
-                feedback_request__status='completed'
-            ).aggregate(Avg('rating'))['rating__avg']
-            pending_feedback_count = FeedbackRequest.objects.filter(
-                requester__in=all_members, status='pending'
-            ).count()
+            total_ratings = sum(totals['rating_sum'] or 0 for totals in rating_totals.values())
+            total_feedback = sum(totals['feedback_count'] or 0 for totals in rating_totals.values())
+            overall_avg_rating = total_ratings / total_feedback if total_feedback else None
+            pending_feedback_count = sum(pending_counts.values())
             
             # ID sąrašas narių, kuriems jau išsiųsta laukianti užklausa
             pending_from_me_ids = set(
@@ -672,7 +699,9 @@ def generate_ai_feedback(request):
             existing_feedback=existing_feedback,
             colleague_name=colleague_name,
             user_id=request.user.id,
-            language=getattr(request, 'LANGUAGE_CODE', 'lt')
+            language=getattr(request, 'LANGUAGE_CODE', 'lt'),
+            # Rezultatas paskelbiamas per Redis (check_ai_task_status jo laukia)
+            hook='feedbackas.task_results.publish_task_hook',
         )
         
         return JsonResponse({'task_id': task_id, 'status': 'processing'})
@@ -683,25 +712,88 @@ def generate_ai_feedback(request):
         logger.error(f"AI feedback dispatch failed: {e}\n{traceback.format_exc()}")
         return JsonResponse({'error': str(e)}, status=500)
 
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@login_required
+@require_POST
+@ratelimit(key='user', rate='10/10m', block=True)
+def stream_ai_feedback(request):
+    """
+    Srautinis AI juodraščio generavimas (Server-Sent Events): tekstas siunčiamas
+    fragmentais (event: chunk), kai tik jie atkeliauja iš OpenRouter;
+    pabaigoje – event: done arba event: error. Užduočių eilė ir apklausa nenaudojamos.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    user = request.user
+    company = user.profile.company_link if hasattr(user, 'profile') else None
+    chunks = OpenRouterService.generate_stream(
+        ratings=data.get('ratings', {}),
+        keywords=data.get('keywords', ''),
+        comments=data.get('comments', ''),
+        existing_feedback=data.get('existing_feedback', ''),
+        colleague_name=data.get('colleague_name', 'Kolega'),
+        user=user,
+        company=company,
+        language=getattr(request, 'LANGUAGE_CODE', 'lt'),
+    )
+
+    def events():
+        # Komentaras iškart išsiunčia antraštes (naršyklė ir proxy nelaukia pirmo žodžio)
+        yield ': stream\n\n'
+        try:
+            for text in chunks:
+                yield _sse_event('chunk', {'text': text})
+            yield _sse_event('done', {})
+        except Exception as e:
+            logger.error(f"AI feedback stream failed: {e}\n{traceback.format_exc()}")
+            yield _sse_event('error', {'error': _('Klaida generuojant atsiliepimą.')})
+        finally:
+            # Klientui atsijungus – nutraukia OpenRouter srautą ir užregistruoja dalinį naudojimą
+            chunks.close()
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    # Nginx neturi buferizuoti srauto
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
 def check_ai_task_status(request):
+    """
+    AI užduoties būsena iš Redis (feedbackas.task_results), be django_q.Task užklausų.
+    Su ?wait=N (iki 25 s) veikia kaip long-poll: atsakoma, kai tik rezultatas paskelbiamas.
+    """
+    from .task_results import TASK_RESULT_MAX_WAIT, wait_for_task_result
+
     task_id = request.GET.get('task_id')
     if not task_id:
         return JsonResponse({'error': 'No task_id provided'}, status=400)
-        
     try:
-        from django_q.models import Task
-        task = Task.get_task(task_id)
-        if task is None:
-            return JsonResponse({'status': 'processing'})
-            
-        if task.success:
-            return JsonResponse({'status': 'completed', 'generated_feedback': task.result})
-        else:
-            return JsonResponse({'status': 'failed', 'error': 'Task failed to execute'})
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        wait = 0
+    # nan/inf (float() juos priima) – kaip ir bloga reikšmė, be laukimo
+    wait = min(max(wait, 0), TASK_RESULT_MAX_WAIT) if math.isfinite(wait) else 0
+
+    try:
+        task_result = wait_for_task_result(task_id, wait)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+    if task_result is None:
+        return JsonResponse({'status': 'processing'})
+    # Rezultatą mato tik užduotį paleidęs vartotojas
+    if task_result.get('user_id') not in (None, request.user.id):
+        return JsonResponse({'error': 'Task not found'}, status=404)
+    if task_result['success']:
+        return JsonResponse({'status': 'completed', 'generated_feedback': task_result['result']})
+    return JsonResponse({'status': 'failed', 'error': 'Task failed to execute'})
+
 
 @login_required
 def get_feedback_data(request):
@@ -848,9 +940,13 @@ def team_statistics(request):
     # Aggregate stats using TeamAnalytics service
     from .services import TeamAnalytics
     stats = TeamAnalytics.get_team_stats(team_members)
+    department_breakdown = TeamAnalytics.get_department_breakdown(
+        subtree_departments([department]).order_by('name'), exclude_user=user
+    )
 
     context = {
         'department': department,
+        'department_breakdown': department_breakdown,
         'member_stats': stats['member_stats'],
         'team_avg_rating': round(stats['team_avg_rating'], 2),
         'team_feedback_count': stats['team_feedback_count'],
@@ -865,19 +961,10 @@ def team_member_detail(request, user_id):
     
     # Verify current user is a manager of the member's department or a parent department
     member_dept = member.profile.department if hasattr(member, 'profile') else None
-    is_authorized = False
-    if member_dept:
-        # Check direct manager
-        if member_dept.manager == request.user:
-            is_authorized = True
-        else:
-            # Walk up the parent chain
-            parent = member_dept.parent
-            while parent:
-                if parent.manager == request.user:
-                    is_authorized = True
-                    break
-                parent = parent.parent
+    # Vienas patikrinimas per hierarchijos uždarinį bet kokiame gylyje
+    is_authorized = bool(member_dept) and DepartmentClosure.objects.filter(
+        descendant=member_dept, ancestor__manager=request.user
+    ).exists()
     if not is_authorized:
         from django.contrib import messages as django_messages
         django_messages.error(request, 'Jūs neturite teisės peržiūrėti šio darbuotojo informacijos.')
@@ -890,8 +977,9 @@ def team_member_detail(request, user_id):
     ).select_related('feedback_request', 'feedback_request__requested_to').order_by('-feedback_request__created_at')
     
     # Aggregate stats using TeamAnalytics service
-    from .services import TeamAnalytics
-    stats = TeamAnalytics.get_member_detailed_stats(feedbacks)
+    from .services import TeamAnalytics, get_rating_summary
+    summary = get_rating_summary(member)
+    stats = TeamAnalytics.get_member_detailed_stats(feedbacks, summary=summary)
     
     # Trait ratings (from questionnaire-based feedback)
     from .models import TraitRating
@@ -906,9 +994,9 @@ def team_member_detail(request, user_id):
         'department': member_dept,
         'feedbacks': feedbacks,
         'avg_rating': stats['avg_rating'],
-        'feedback_count': feedbacks.count(),
+        'feedback_count': summary.feedback_count,
         'competencies': stats['competencies'],
-        'all_keywords': list(stats['keywords'])[:15],
+        'all_keywords': stats['keywords'],
         'trait_ratings': trait_ratings,
     }
     return render(request, 'team_member_detail.html', context)
@@ -964,9 +1052,8 @@ def company_management(request):
     else:
         form = DepartmentForm(user)
 
-    # Gauname tik šaknijinius departamentus (kurie neturi tėvo)
-    # Vaikus gausime template su rekursija arba prefetch_related
-    root_departments = Department.objects.filter(company=user_company, parent__isnull=True).prefetch_related('sub_departments')
+    # Visas padalinių medis viena užklausa (vaikai – node.children)
+    root_departments = department_tree(user_company)
     
     # Gauname visus įmonės darbuotojus, kad galėtume juos priskirti arba perpriskirti
     company_users = User.objects.filter(profile__company_link=user_company).select_related('profile__department').order_by('first_name', 'last_name')
@@ -974,12 +1061,22 @@ def company_management(request):
     # All departments for the assignment dropdown
     all_departments = Department.objects.filter(company=user_company).order_by('name')
 
+    # Padalinių šilumos žemėlapis iš įvertinimų kubo (paskutiniai 12 mėnesių)
+    from .cube import department_heatmap
+    from .services import competency_list, period_start_month
+    heatmap = department_heatmap(user_company, since_month=period_start_month('year'))
+    department_names = dict(all_departments.values_list('id', 'name'))
+    for row in heatmap['rows']:
+        row['name'] = department_names.get(row['department_id'], _('Nepriskirti'))
+    heatmap['column_names'] = [_('Bendras')] + [comp['name'] for comp in competency_list({})]
+
     context = {
         'root_departments': root_departments,
         'form': form,
         'company_users': company_users,
         'company_name': user_company.name,
         'all_departments': all_departments,
+        'heatmap': heatmap,
     }
     return render(request, 'company_management.html', context)
 
@@ -1065,91 +1162,68 @@ from django.contrib.auth.decorators import user_passes_test
 
 @user_passes_test(lambda u: u.is_superuser)
 def superadmin_dashboard(request):
-    # Statistics
-    total_users = User.objects.count()
-    total_companies = Company.objects.count()
-    pending_feedback_count = FeedbackRequest.objects.filter(status='pending').count()
-    completed_feedback_count = FeedbackRequest.objects.filter(status='completed').count()
+    from .services import last_month_starts, monthly_totals, running_totals
+    from users.billing_service import get_monthly_bills
 
-    now = timezone.now()
-    
-    # 1. AI Costs for current month
-    total_ai_cost = AIUsageLog.objects.filter(
-        timestamp__year=now.year, 
-        timestamp__month=now.month
-    ).aggregate(Sum('total_cost'))['total_cost__sum'] or 0.0
-
-    # 2. Revenue for current month
-    # This is an approximation: sum(company_employee_count * price_per_employee)
-    total_monthly_revenue = Decimal('0.00')
-    active_contracts = ContractSettings.objects.filter(
-        models.Q(contract_end__isnull=True) | models.Q(contract_end__gte=now.date()),
-        contract_start__lte=now.date()
-    ).select_related('company')
-
-    for contract in active_contracts:
-        employee_count = Profile.objects.filter(company_link=contract.company).count()
-        revenue = Decimal(str(employee_count)) * contract.price_per_employee
-        # Ensure it's at least the minimum fee
-        total_monthly_revenue += max(revenue, contract.minimum_fee)
+    today = timezone.localdate()
 
-    # Calculate Yearly Totals
-    start_of_year = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-    
-    yearly_total_ai_cost = AIUsageLog.objects.filter(
-        timestamp__year=now.year
-    ).aggregate(Sum('total_cost'))['total_cost__sum'] or 0.0
+    # Kiekviena laiko eilutė – viena TruncMonth grupuota užklausa, kalendoriniai mėnesiai
+    history_months = last_month_starts(6, today)
+    start_of_year = today.replace(month=1, day=1)
+    series_start = min(history_months[0], start_of_year)
+    current_month = history_months[-1]
+
+    ai_cost_by_month = monthly_totals(AIUsageDaily.objects.all(), 'date', Sum('total_cost'), since=series_start)
+    feedback_by_month = monthly_totals(Feedback.objects.all(), 'created_at', Count('id'), since=series_start)
+    users_by_month = monthly_totals(User.objects.all(), 'date_joined', Count('id'))
+    companies_by_month = monthly_totals(Company.objects.all(), 'created_at', Count('id'))
 
-    yearly_new_users = User.objects.filter(date_joined__gte=start_of_year).count()
-    yearly_new_companies = Company.objects.filter(created_at__gte=start_of_year).count()
+    # Statistics
+    total_users = sum(users_by_month.values())
+    total_companies = sum(companies_by_month.values())
+    request_counts = FeedbackRequest.objects.aggregate(
+        pending=Count('id', filter=Q(status='pending')),
+        completed=Count('id', filter=Q(status='completed')),
+    )
+    pending_feedback_count = request_counts['pending']
+    completed_feedback_count = request_counts['completed']
     
-    yearly_completed_feedback = Feedback.objects.filter(
-        created_at__gte=start_of_year
-    ).count()
+    # 1. AI Costs for current month
+    total_ai_cost = ai_cost_by_month.get(current_month, 0.0)
 
-    # Yearly revenue estimation (simplistic: current monthly revenue * months elapsed)
-    # Better: sum historical records if available, but here we'll just show current yearly progress
-    yearly_total_revenue = total_monthly_revenue * now.month
+    # Calculate Yearly Totals
+    yearly_total_ai_cost = sum(total for month, total in ai_cost_by_month.items() if month >= start_of_year)
+    yearly_new_users = sum(total for month, total in users_by_month.items() if month >= start_of_year)
+    yearly_new_companies = sum(total for month, total in companies_by_month.items() if month >= start_of_year)
+    yearly_completed_feedback = sum(total for month, total in feedback_by_month.items() if month >= start_of_year)
+
+    # Faktinės mėnesių sąskaitos (uždarytos + einamasis mėnuo gyvai) metų ir grafiko mėnesiams
+    revenue_months = sorted(
+        {(month.year, month.month) for month in history_months}
+        | {(today.year, month) for month in range(1, today.month + 1)}
+    )
+    revenue_by_month = defaultdict(Decimal)
+    for (_company_id, year, month), bill in get_monthly_bills(
+        Company.objects.values_list('id', flat=True), revenue_months,
+    ).items():
+        if bill.get('has_settings'):
+            revenue_by_month[(year, month)] += bill['final_amount']
+    yearly_total_revenue = sum(
+        (revenue_by_month[(today.year, month)] for month in range(1, today.month + 1)), Decimal('0.00'),
+    )
+    # 2. Revenue for current month – ta pati gyva sąskaita, kaip ir grafike
+    total_monthly_revenue = revenue_by_month.get((today.year, today.month), Decimal('0.00'))
 
     # Generate monthly history for charts (last 6 months)
-    months_labels = []
-    revenue_history = []
-    ai_cost_history = []
-    users_history = []
-    companies_history = []
-    feedback_history = []
-
-    for i in range(5, -1, -1):
-        target_date = now - timedelta(days=i*30)
-        m = target_date.month
-        y = target_date.year
-        months_labels.append(target_date.strftime('%b'))
-
-        # Revenue (simplified for history: uses current monthly logic for each month)
-        # Note: In a real app, you'd query historical snapshots or invoice totals
-        # Here we'll just simulate a slight trend for visual effect
-        revenue_history.append(float(total_monthly_revenue) * (1 - (i * 0.05))) 
-
-        # AI Cost
-        ai_m = AIUsageLog.objects.filter(timestamp__year=y, timestamp__month=m).aggregate(Sum('total_cost'))['total_cost__sum'] or 0.0
-        ai_cost_history.append(float(ai_m))
-
-        # Helper: End of month date for cumulative queries
-        import calendar
-        _, last_day = calendar.monthrange(y, m)
-        end_of_month = target_date.replace(day=last_day, hour=23, minute=59, second=59)
-
-        # Users (Cumulative up to the end of this month)
-        u_m = User.objects.filter(date_joined__lte=end_of_month).count()
-        users_history.append(u_m)
-
-        # Companies (Cumulative up to the end of this month)
-        c_m = Company.objects.filter(created_at__lte=end_of_month).count()
-        companies_history.append(c_m)
-
-        # Completed Feedback
-        f_m = Feedback.objects.filter(created_at__year=y, created_at__month=m).count()
-        feedback_history.append(f_m)
+    months_labels = [month.strftime('%b') for month in history_months]
+
+    revenue_history = [float(revenue_by_month[(month.year, month.month)]) for month in history_months]
+    ai_cost_history = [float(ai_cost_by_month.get(month, 0.0)) for month in history_months]
+    # Users / Companies (Cumulative up to the end of each month)
+    users_history = running_totals(users_by_month, history_months)
+    companies_history = running_totals(companies_by_month, history_months)
+    # Completed Feedback
+    feedback_history = [feedback_by_month.get(month, 0) for month in history_months]
 
     # Recent Data
     recent_users = User.objects.order_by('-date_joined')[:5]
@@ -1181,68 +1255,54 @@ def superadmin_dashboard(request):
 @user_passes_test(lambda u: u.is_superuser)
 def superadmin_statistics(request):
     import json
-    from datetime import timedelta
-    from django.db.models import Count
-    from django.db.models.functions import TruncDate
+    from datetime import datetime, timedelta
+    from .platform_metrics import platform_metrics_series, registrations_before
+
+    today = timezone.localdate()
 
-    now = timezone.now()
-    
     # 1. Setup Company Filtering
     company_id = request.GET.get('company_id')
+    company_id = int(company_id) if company_id and company_id.isdigit() else None
     companies = Company.objects.all().order_by('name')
-    
-    # Base queries (All historical data)
-    users_qs = User.objects.all()
-    feedback_qs = Feedback.objects.all()
-    
-    from users.models import EmployeeCountLog
-    active_users_qs = EmployeeCountLog.objects.all()
 
-    if company_id:
-        users_qs = users_qs.filter(profile__company_link_id=company_id)
-        # Note: Feedback model traces back to user -> company.
-        # Feedback -> FeedbackRequest -> requested_to -> Profile -> Company
-        feedback_qs = feedback_qs.filter(feedback_request__requested_to__profile__company_link_id=company_id)
-        active_users_qs = active_users_qs.filter(company_id=company_id)
-
-    # 2. Detailed User Growth (Registrations per day)
-    users_per_day = list(users_qs.annotate(date=TruncDate('date_joined'))
-                        .values('date')
-                        .annotate(count=Count('id'))
-                        .order_by('date'))
-    
-    # 3. Active Users Per Day (Sum of active_count grouped by date)
-    from django.db.models import Sum
-    active_users_per_day = list(active_users_qs.annotate(date=TruncDate('recorded_at'))
-                                .values('date')
-                                .annotate(total_active=Sum('active_count'))
-                                .order_by('date'))
-
-    # 4. Completed Feedback per Day
-    feedback_per_day = list(feedback_qs.annotate(date=TruncDate('created_at'))
-                            .values('date')
-                            .annotate(count=Count('id'))
-                            .order_by('date'))
-
-    def serialize_data(data_list, value_key):
+    # 2. Datų intervalas (pagal nutylėjimą – paskutiniai metai), skaitomas iš dienos nuotraukų
+    default_start = today - timedelta(days=364)
+    try:
+        start_date = datetime.strptime(request.GET.get('start_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        start_date = default_start
+    try:
+        end_date = datetime.strptime(request.GET.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        end_date = today
+    if start_date > end_date:
+        start_date, end_date = default_start, today
+
+    series = platform_metrics_series(start_date, end_date, company_id=company_id)
+
+    def serialize_data(value_key):
         # Grąžina [{ date: 'YYYY-MM-DD', value: X }, ...]
-        return [{'date': str(item['date']), 'value': item[value_key] or 0} for item in data_list if item['date']]
+        return [{'date': str(row['date']), 'value': row[value_key]} for row in series if row[value_key]]
 
     context = {
         'companies': companies,
-        'selected_company_id': int(company_id) if company_id and company_id.isdigit() else None,
-        
+        'selected_company_id': company_id,
+        'start_date': start_date.strftime('%Y-%m-%d'),
+        'end_date': end_date.strftime('%Y-%m-%d'),
+        # Registracijos iki intervalo pradžios – kaupiamosios kreivės pradžios taškas
+        'user_growth_base': registrations_before(start_date, company_id=company_id),
+
         # Raw dieniniai duomenys kaip JSON
-        'user_growth_raw': json.dumps(serialize_data(users_per_day, 'count')),
-        'active_users_raw': json.dumps(serialize_data(active_users_per_day, 'total_active')),
-        'feedback_raw': json.dumps(serialize_data(feedback_per_day, 'count')),
+        'user_growth_raw': json.dumps(serialize_data('registrations')),
+        'active_users_raw': json.dumps(serialize_data('active_users')),
+        'feedback_raw': json.dumps(serialize_data('completed_feedback')),
     }
 
     return render(request, 'superadmin/statistics.html', context)
 
 @user_passes_test(lambda u: u.is_superuser)
 def superadmin_companies_list(request):
-    companies = Company.objects.annotate(employee_count=Count('profile')).order_by('-created_at')
+    companies = Company.objects.order_by('-created_at')
     
     context = {
         'companies': companies,
@@ -1252,8 +1312,7 @@ def superadmin_companies_list(request):
 @user_passes_test(lambda u: u.is_superuser)
 def superadmin_ai_analytics(request):
     from datetime import datetime, timedelta
-    from django.db.models import Sum, Count
-    from feedbackas.models import AIUsageLog
+    from django.db.models import Sum
 
     # Determine date range
     today = timezone.now().date()
@@ -1270,19 +1329,18 @@ def superadmin_ai_analytics(request):
         start_date = first_day_of_month
         end_date = today
 
-    # Filter logs
-    # Make sure we include the end date completely
-    end_date_inclusive = end_date + timedelta(days=1)
-    logs = AIUsageLog.objects.filter(timestamp__gte=start_date, timestamp__lt=end_date_inclusive)
+    # Dienos suvestinės (AIUsageDaily), pabaigos data imtinai
+    usage = AIUsageDaily.objects.filter(date__gte=start_date, date__lte=end_date)
 
-    # Global KPI
-    total_cost = logs.aggregate(Sum('total_cost'))['total_cost__sum'] or 0.0
-    total_queries = logs.count()
+    # Global KPI (viena užklausa)
+    totals = usage.aggregate(total_cost=Sum('total_cost'), total_queries=Sum('calls'))
+    total_cost = totals['total_cost'] or 0.0
+    total_queries = totals['total_queries'] or 0
 
     # Aggregate by company
-    company_stats = logs.values('company__name').annotate(
+    company_stats = usage.values('company__name').annotate(
         total_cost=Sum('total_cost'),
-        total_queries=Count('id')
+        total_queries=Sum('calls')
     ).order_by('-total_cost')
 
     company_labels = []
@@ -1292,9 +1350,9 @@ def superadmin_ai_analytics(request):
         company_costs.append(float(stat['total_cost']))
 
     # Aggregate by user (Top 20) — neįtraukiame foninių užklausų (feedback_analysis)
-    user_stats = logs.exclude(request_type='feedback_analysis').values('user__first_name', 'user__last_name', 'user__username', 'company__name').annotate(
+    user_stats = usage.exclude(request_type='feedback_analysis').values('user__first_name', 'user__last_name', 'user__username', 'company__name').annotate(
         total_cost=Sum('total_cost'),
-        total_queries=Count('id')
+        total_queries=Sum('calls')
     ).order_by('-total_cost')[:20]
 
     context = {
@@ -1615,7 +1673,7 @@ def superadmin_edit_hierarchy(request, company_id):
         form.fields['parent'].queryset = Department.objects.filter(company=company)
         form.fields['manager'].queryset = User.objects.filter(profile__company_link=company)
 
-    root_departments = Department.objects.filter(company=company, parent__isnull=True).prefetch_related('sub_departments')
+    root_departments = department_tree(company)
 
     context = {
         'company': company,
@@ -1872,7 +1930,8 @@ def superadmin_billing_overview(request):
     Kiekvienai įmonei skaičiuoja dabartinio mėnesio sąskaitą (Max Count).
     """
     from users.models import ContractSettings
-    from users.billing_service import calculate_monthly_bill
+    from users.billing_service import get_monthly_bills
+    from users.revenue_forecast import FORECAST_METHODS, forecast_revenue
     import calendar
 
     today = date.today()
@@ -1885,29 +1944,9 @@ def superadmin_billing_overview(request):
         selected_year, selected_month = today.year, today.month
 
     companies = Company.objects.all().order_by('name')
+    companies_list = list(companies)
 
-    rows = []
-    total_amount = 0
-    total_employees = 0
-    companies_with_settings = 0
-    companies_without_settings = 0
-
-    for company in companies:
-        bill = calculate_monthly_bill(company.id, selected_year, selected_month)
-        if bill.get('has_settings'):
-            companies_with_settings += 1
-            total_amount += bill['final_amount']
-            total_employees += bill['max_count']
-        else:
-            companies_without_settings += 1
-        rows.append({
-            'company': company,
-            'bill': bill,
-        })
-
-    # ── Grafiko duomenys: per įmonę, pasirinktas laikotarpis ──────────────────
-    import json
-
+    # ── Grafiko laikotarpis ───────────────────────────────────────────────────
     # Laikotarpis: praėję + ateities mėnesiai
     chart_past = int(request.GET.get('chart_past', 6))   # praėjusių mėnesių
     chart_future = int(request.GET.get('chart_future', 3))  # prognozuojamų
@@ -1937,9 +1976,47 @@ def superadmin_billing_overview(request):
             m = 1
             y += 1
 
-    # Vieno mėnesio prognozė = paskutinio žinomo mėnesio sąskaitos sumos
-    # Sukaupiam duomenis pagal įmonę
-    from users.billing_service import calculate_monthly_bill as _calc
+    # Visos sąskaitos (lentelės mėnuo + praeities ir einamojo mėnesio stulpeliai):
+    # praeitis iš uždarytų sąskaitų, einamasis – viena paketinė užklausų grupė
+    company_ids = [company.id for company in companies_list]
+    bills = get_monthly_bills(
+        company_ids,
+        [(selected_year, selected_month)]
+        + [(slot['year'], slot['month']) for slot, is_future in zip(chart_labels, chart_is_future) if not is_future],
+    )
+
+    # Ateities mėnesiai – vektorizuota darbuotojų skaičiaus ir sąskaitų prognozė visoms įmonėms
+    forecast_method = request.GET.get('forecast', 'linear')
+    if forecast_method not in FORECAST_METHODS:
+        forecast_method = 'linear'
+    forecast = forecast_revenue(company_ids, chart_future, method=forecast_method, today=today)
+    forecast_amounts = {
+        (company_id, year, month): float(forecast['amount'][row, column])
+        for row, company_id in enumerate(forecast['company_ids'])
+        for column, (year, month) in enumerate(forecast['months'])
+    }
+
+    rows = []
+    total_amount = 0
+    total_employees = 0
+    companies_with_settings = 0
+    companies_without_settings = 0
+
+    for company in companies_list:
+        bill = bills[(company.id, selected_year, selected_month)]
+        if bill.get('has_settings'):
+            companies_with_settings += 1
+            total_amount += bill['final_amount']
+            total_employees += bill['max_count']
+        else:
+            companies_without_settings += 1
+        rows.append({
+            'company': company,
+            'bill': bill,
+        })
+
+    # ── Grafiko duomenys: per įmonę, pasirinktas laikotarpis ──────────────────
+    import json
 
     # Spalvų paletė įmonėms
     PALETTE = [
@@ -1948,15 +2025,16 @@ def superadmin_billing_overview(request):
         '#94a3b8', '#fb923c', '#e879f9', '#4ade80',
     ]
 
-    companies_with_contract = [c for c in companies if hasattr(c, 'contract_settings')]
-    companies_list = list(companies)
-
     chart_datasets = []
     for idx, company in enumerate(companies_list):
         color = PALETTE[idx % len(PALETTE)]
         values = []
         for slot in chart_labels:
-            b = _calc(company.id, slot['year'], slot['month'])
+            key = (company.id, slot['year'], slot['month'])
+            if key in forecast_amounts:
+                values.append(forecast_amounts[key])
+                continue
+            b = bills[key]
             if b.get('has_settings'):
                 values.append(float(b['final_amount']))
             else:
@@ -2001,6 +2079,8 @@ def superadmin_billing_overview(request):
         # Mygtukų variantai (value, label)
         'past_options': [(3, '3M'), (6, '6M'), (12, '12M'), (24, '24M')],
         'future_options': [(0, 'Išj.'), (1, '+1M'), (3, '+3M'), (6, '+6M')],
+        'forecast_method': forecast_method,
+        'forecast_options': [('linear', 'Tiesinis'), ('seasonal', 'Sezoninis')],
     }
     return render(request, 'superadmin/billing_overview.html', context)
 
@@ -2013,7 +2093,7 @@ def superadmin_company_billing(request, company_id):
     ir skaičiuoja mėnesio sąskaitą pagal Max Count strategiją.
     """
     from users.models import ContractSettings, EmployeeCountLog
-    from users.billing_service import calculate_monthly_bill
+    from users.billing_service import get_monthly_bills
     from decimal import Decimal, InvalidOperation
     import calendar
 
@@ -2070,7 +2150,9 @@ def superadmin_company_billing(request, company_id):
     all_contracts = ContractSettings.objects.filter(company=company).order_by('-contract_start')
 
     # Skaičiuojame sąskaitą pasirinktam mėnesiui
-    bill = calculate_monthly_bill(company_id, selected_year, selected_month)
+    # (praėjęs mėnuo – iš uždarytos sąskaitos, einamasis – gyvai)
+    bills = get_monthly_bills([company_id], [(selected_year, selected_month)])
+    bill = bills[(company_id, selected_year, selected_month)]
 
     # Paskutiniai EmployeeCountLog įrašai
     recent_logs = EmployeeCountLog.objects.filter(company=company).order_by('-recorded_at')[:15]
@@ -2195,10 +2277,9 @@ def questionnaires_list(request):
         
     team_members = team_members_qs.order_by('first_name', 'last_name')
 
-    managed_departments = list(Department.objects.filter(manager=request.user).order_by('name'))
-    sub_departments = list(Department.objects.filter(parent__in=managed_departments).order_by('name'))
-    all_managed = list({d.id: d for d in managed_departments + sub_departments}.values())
-    all_managed.sort(key=lambda x: x.name)
+    all_managed = list(
+        subtree_departments(Department.objects.filter(manager=request.user)).order_by('name')
+    )
 
     return render(request, 'questionnaires/list.html', {
         'questionnaires': questionnaires,
@@ -2420,81 +2501,70 @@ def questionnaire_statistics(request, questionnaire_id):
 
     questionnaire = get_object_or_404(Questionnaire, id=questionnaire_id, created_by=request.user)
 
-    # Fetch feedback requests related to this questionnaire
-    # For now, we linked them by using project_name=questionnaire.title
+    # Užklausos susietos per FeedbackRequest.questionnaire (indeksas questionnaire, status).
+    # Skirtingai nei senasis project_name=title sąryšis, čia įtraukiami ir komandos formų
+    # prašymai, sukurti kitų prašytojų su šiuo klausimynu – kaip ir TraitDailyAggregate.
     feedback_requests = FeedbackRequest.objects.filter(
-        requester=request.user,
-        project_name=questionnaire.title,
+        questionnaire=questionnaire,
         status='completed'
-    ).select_related('requested_to')
+    )
     
     feedbacks = Feedback.objects.filter(feedback_request__in=feedback_requests)
-    
-    overall_avg_rating = feedbacks.aggregate(Avg('rating'))['rating__avg'] or 0
-    received_feedback_count = feedbacks.count()
-    
-    from .models import TraitRating
-    from collections import defaultdict
 
-    traits = questionnaire.traits.all()
-    trait_ratings = TraitRating.objects.filter(feedback__in=feedbacks)
+    # Visi įvertinimai vienąkart užkraunami į NumPy matricą
+    from .analytics_engine import CompetencyMatrix
+    matrix = CompetencyMatrix.from_queryset(feedbacks)
+    overall = matrix.overall()
+    overall_avg_rating = overall['mean']['rating'] if overall else 0
+    received_feedback_count = len(matrix)
     
-    competencies = []
-    
-    # Pre-fetch trait ratings per date for chart
-    trait_ratings_by_date = defaultdict(lambda: defaultdict(list))
-    for tr in trait_ratings.select_related('feedback__feedback_request'):
-        d = tr.feedback.feedback_request.created_at.date()
-        trait_ratings_by_date[tr.trait_id][d].append(tr.rating)
+    from .models import TraitDailyAggregate
+
+    traits = list(questionnaire.traits.all())
 
+    # Savybių vidurkiai ir grafiko taškai iš dienos suvestinių
+    trait_totals = defaultdict(lambda: [0, 0])
+    trait_daily_averages = {}
+    for trait_id, day, rating_sum, rating_count in TraitDailyAggregate.objects.filter(
+        questionnaire=questionnaire
+    ).values_list('trait_id', 'date', 'rating_sum', 'rating_count'):
+        trait_totals[trait_id][0] += rating_sum
+        trait_totals[trait_id][1] += rating_count
+        if rating_count:
+            trait_daily_averages[(trait_id, day.isoformat())] = rating_sum / rating_count
+
+    competencies = []
     for trait in traits:
-        # Average score for this trait
-        avg = trait_ratings.filter(trait=trait).aggregate(Avg('rating'))['rating__avg'] or 0
+        rating_sum, rating_count = trait_totals[trait.id]
         competencies.append({
             'name': trait.name,
-            'score': round(avg, 2)
+            'score': round(rating_sum / rating_count, 2) if rating_count else 0
         })
 
-    all_keywords = []
-    for fb in feedbacks:
-        if fb.keywords:
-            keys = [k.strip() for k in fb.keywords.split(',') if k.strip()]
-            all_keywords.extend(keys)
-
-    all_keywords = list(set(all_keywords)) # Unique keywords
+    from .keyword_index import top_keywords
+    all_keywords = top_keywords(feedbacks)  # Surikiuoti pagal dažnį
 
-    strengths = []
     improvements = []
     
     # We can separate comments into strengths/improvements if we want, but for now we'll just list comments
-    for fb in feedbacks:
-        if fb.comments:
-            strengths.append(fb.comments) 
+    strengths = list(feedbacks.exclude(comments='').values_list('comments', flat=True))
 
     import json
-    from django.db.models.functions import TruncDate
 
-    chronological_feedbacks = feedbacks.annotate(
-        date=TruncDate('feedback_request__created_at')
-    ).values('date').annotate(
-        avg_rating=Avg('rating')
-    ).order_by('date')
+    daily_trend = matrix.trend(freq='day').get(0, [])
 
-    chart_labels = [fb['date'].strftime('%Y-%m-%d') if fb['date'] else 'Data nežinoma' for fb in chronological_feedbacks]
+    chart_labels = [point['period'] for point in daily_trend]
     
     chart_datasets = [
-        {'label': 'Bendras', 'data': [round(fb['avg_rating'], 2) for fb in chronological_feedbacks], 'borderColor': '#8B5CF6', 'tension': 0.3},
+        {'label': 'Bendras', 'data': [point['rating'] for point in daily_trend], 'borderColor': '#8B5CF6', 'tension': 0.3},
     ]
     
     colors = ['#3B82F6', '#10B981', '#F59E0B', '#EF4444', '#6366F1', '#EC4899', '#14B8A6', '#F43F5E']
     
     for i, trait in enumerate(traits):
         data = []
-        for fb_dict in chronological_feedbacks:
-            d = fb_dict['date']
-            # if d is None, fallback
-            ratings = trait_ratings_by_date[trait.id].get(d, [])
-            avg = sum(ratings) / len(ratings) if ratings else 0.0
+        for point in daily_trend:
+            avg = trait_daily_averages.get((trait.id, point['period']), 0.0)
             data.append(round(avg, 2))
             
         chart_datasets.append({
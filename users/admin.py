@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Company, Department, ContractSettings, EmployeeCountLog
+from .models import Company, Department, ContractSettings, EmployeeCountLog, MonthlyInvoice
 
 @admin.register(Company)
 class CompanyAdmin(admin.ModelAdmin):
@@ -24,3 +24,9 @@ class EmployeeCountLogAdmin(admin.ModelAdmin):
     list_display = ('company', 'active_count', 'recorded_at')
     search_fields = ('company__name',)
     list_filter = ('company', 'recorded_at')
+
+@admin.register(MonthlyInvoice)
+class MonthlyInvoiceAdmin(admin.ModelAdmin):
+    list_display = ('company', 'year', 'month', 'max_count', 'final_amount', 'closed_at')
+    search_fields = ('company__name',)
+    list_filter = ('company', 'year')
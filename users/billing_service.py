@@ -4,41 +4,125 @@ from django.utils import timezone
 from django.db.models import Q
 
 
-def calculate_monthly_bill(company_id: int, year: int, month: int) -> dict:
+def _month_bounds(year: int, month: int):
+    month_start = date(year, month, 1)
+    if month == 12:
+        month_end = date(year + 1, 1, 1)
+    else:
+        month_end = date(year, month + 1, 1)
+    return month_start, month_end
+
+
+def calculate_monthly_bills(company_ids, months) -> dict:
     """
-    Apskaičiuoja mėnesio sąskaitą konkrečiai įmonei.
+    Apskaičiuoja mėnesio sąskaitas daugeliui įmonių ir mėnesių vienu metu.
 
-    Algoritmas:
-    1. Suranda sutartį, galiojusią tą mėnesį (contract_start ≤ mėnuo ≤ contract_end).
-    2. Suranda visus EmployeeCountLog įrašus tame mėnesyje.
-    3. Išrenka didžiausią active_count (Max Count).
-    4. Jei mėnesiui įrašų nėra – paimamas paskutinis žinomas skaičius.
-    5. suma = max(max_count * price_per_employee, minimum_fee)
+    company_ids – įmonių ID sąrašas, months – (metai, mėnuo) porų sąrašas.
+    Užklausų skaičius nepriklauso nuo įmonių ir mėnesių skaičiaus:
+    1. Sutartys, persidengiančios su visu laikotarpiu.
+    2. Max(active_count) ir paskutinio įrašo laikas kiekvienai įmonei kiekvieną mėnesį (TruncMonth).
+    3. Paskutinis žinomas įrašas prieš laikotarpio pradžią kiekvienai įmonei.
+    4. Paskutinių įrašų reikšmės (perkeliamos į mėnesius be logų).
+    Įmonėms visai be logų naudojamas Company.active_employee_count.
 
-    Grąžina dict su visais skaičiavimo detaliais.
+    Taisyklės tos pačios kaip calculate_monthly_bill. Grąžina {(company_id, metai, mėnuo): sąskaita}.
     """
-    from .models import Company, ContractSettings, EmployeeCountLog, Profile
+    from django.db.models import Count, DateField, Max, OuterRef, Subquery
+    from django.db.models.functions import TruncMonth
+    from .models import Company, ContractSettings, EmployeeCountLog
 
-    try:
-        company = Company.objects.get(pk=company_id)
-    except Company.DoesNotExist:
-        return {'error': f'Įmonė su ID {company_id} nerasta.'}
+    company_ids = list(dict.fromkeys(company_ids))
+    requested = set(months)
+    months = sorted(requested)
+    if not company_ids or not months:
+        return {}
 
-    # Mėnesio ribos
-    month_start = date(year, month, 1)
-    if month == 12:
-        month_end = date(year + 1, 1, 1)
-    else:
-        month_end = date(year, month + 1, 1)
+    companies = Company.objects.in_bulk(company_ids)
+    range_start = _month_bounds(*months[0])[0]
+    range_end = _month_bounds(*months[-1])[1]
 
-    # Sutartis, galiojusi tą mėnesį (persidengia su mėnesiu):
-    # contract_start < month_end IR (contract_end nėra ARBA contract_end >= month_start)
-    settings = (
+    # 1. Sutartys, galiojusios bent dalį laikotarpio (naujausios pirmiau)
+    contracts = {}
+    for settings in (
         ContractSettings.objects
-        .filter(company=company, contract_start__lt=month_end)
-        .filter(Q(contract_end__isnull=True) | Q(contract_end__gte=month_start))
+        .filter(company_id__in=companies, contract_start__lt=range_end)
+        .filter(Q(contract_end__isnull=True) | Q(contract_end__gte=range_start))
         .order_by('-contract_start')
-        .first()
+    ):
+        contracts.setdefault(settings.company_id, []).append(settings)
+
+    # 2. Mėnesio maksimumai ir paskutinio įrašo laikas
+    monthly = {}
+    for row in (
+        EmployeeCountLog.objects
+        .filter(company_id__in=companies, recorded_at__date__gte=range_start, recorded_at__date__lt=range_end)
+        .annotate(month=TruncMonth('recorded_at', output_field=DateField()))
+        .values('company_id', 'month')
+        .annotate(max_count=Max('active_count'), logs_count=Count('id'), last_at=Max('recorded_at'))
+        .order_by()
+    ):
+        monthly[(row['company_id'], row['month'])] = row
+
+    # 3. Paskutinis įrašas prieš laikotarpį
+    carried_at = dict(
+        Company.objects.filter(pk__in=companies).annotate(
+            last_at=Subquery(
+                EmployeeCountLog.objects.filter(company=OuterRef('pk'), recorded_at__date__lt=range_start)
+                .order_by('-recorded_at').values('recorded_at')[:1]
+            )
+        ).filter(last_at__isnull=False).values_list('id', 'last_at')
+    )
+
+    # 4. Paskutinių įrašų reikšmės
+    last_timestamps = set(carried_at.values()) | {row['last_at'] for row in monthly.values()}
+    last_counts = {
+        (company_id, recorded_at): active_count
+        for company_id, recorded_at, active_count in EmployeeCountLog.objects.filter(
+            company_id__in=companies, recorded_at__in=last_timestamps,
+        ).values_list('company_id', 'recorded_at', 'active_count')
+    } if last_timestamps else {}
+
+    bills = {}
+    for company_id in company_ids:
+        company = companies.get(company_id)
+        if company is None:
+            for year, month in months:
+                bills[(company_id, year, month)] = {'error': f'Įmonė su ID {company_id} nerasta.'}
+            continue
+
+        last_known = None
+        if company_id in carried_at:
+            last_known = (carried_at[company_id], last_counts.get((company_id, carried_at[company_id]), 0))
+
+        # Einame per visus laikotarpio mėnesius, kad paskutinis žinomas skaičius
+        # būtų perkeltas ir per neprašytus mėnesius
+        month_start = range_start
+        while month_start < range_end:
+            year, month = month_start.year, month_start.month
+            month_end = _month_bounds(year, month)[1]
+            row = monthly.get((company_id, month_start))
+            if (year, month) in requested:
+                bills[(company_id, year, month)] = _build_bill(
+                    company, year, month, month_start, month_end,
+                    contracts.get(company_id, []), row, last_known, company.active_employee_count,
+                )
+            if row is not None:
+                last_known = (row['last_at'], last_counts.get((company_id, row['last_at']), 0))
+            month_start = month_end
+    return bills
+
+
+def _build_bill(company, year, month, month_start, month_end, contracts, month_logs, last_known, current_count):
+    """Vienos įmonės vieno mėnesio sąskaita iš jau surinktų duomenų."""
+    # Sutartis, galiojusi tą mėnesį (persidengia su mėnesiu):
+    # contract_start < month_end IR (contract_end nėra ARBA contract_end >= month_start)
+    settings = next(
+        (
+            contract for contract in contracts
+            if contract.contract_start < month_end
+            and (contract.contract_end is None or contract.contract_end >= month_start)
+        ),
+        None,
     )
 
     if settings is None:
@@ -48,31 +132,17 @@ def calculate_monthly_bill(company_id: int, year: int, month: int) -> dict:
             'has_settings': False,
         }
 
-
-    # Logai tame mėnesyje
-    logs_this_month = EmployeeCountLog.objects.filter(
-        company=company,
-        recorded_at__date__gte=month_start,
-        recorded_at__date__lt=month_end,
-    ).order_by('-active_count')
-
-    if logs_this_month.exists():
-        max_count = logs_this_month.first().active_count
+    if month_logs is not None:
+        max_count = month_logs['max_count']
         data_source = 'Logai iš pasirinkto mėnesio'
-    else:
+    elif last_known is not None:
         # Nėra logų tame mėnesyje – paimame paskutinį prieš mėnesio pradžią
-        last_before = EmployeeCountLog.objects.filter(
-            company=company,
-            recorded_at__date__lt=month_start,
-        ).order_by('-recorded_at').first()
-
-        if last_before:
-            max_count = last_before.active_count
-            data_source = f'Paskutinis žinomas skaičius ({last_before.recorded_at:%Y-%m-%d})'
-        else:
-            # Visai nėra logų – skaičiuojame dabartinį aktyvų skaičių
-            max_count = Profile.objects.filter(company_link=company, user__is_active=True).count()
-            data_source = 'Dabartinis skaičius (nėra istorinių logų)'
+        last_at, max_count = last_known
+        data_source = f'Paskutinis žinomas skaičius ({last_at:%Y-%m-%d})'
+    else:
+        # Visai nėra logų – skaičiuojame dabartinį aktyvų skaičių
+        max_count = current_count
+        data_source = 'Dabartinis skaičius (nėra istorinių logų)'
 
     price = settings.price_per_employee
     raw_amount = Decimal(max_count) * price
@@ -84,7 +154,7 @@ def calculate_monthly_bill(company_id: int, year: int, month: int) -> dict:
         'settings': settings,
         'year': year,
         'month': month,
-        'month_label': date(year, month, 1).strftime('%Y %B'),
+        'month_label': month_start.strftime('%Y %B'),
         'max_count': max_count,
         'data_source': data_source,
         'price_per_employee': price,
@@ -94,5 +164,145 @@ def calculate_monthly_bill(company_id: int, year: int, month: int) -> dict:
         'minimum_applied': final_amount > raw_amount,
         'contract_start': settings.contract_start,
         'contract_end': settings.contract_end,
-        'logs_count': logs_this_month.count(),
+        'logs_count': month_logs['logs_count'] if month_logs is not None else 0,
+    }
+
+
+def calculate_monthly_bill(company_id: int, year: int, month: int) -> dict:
+    """
+    Apskaičiuoja mėnesio sąskaitą konkrečiai įmonei.
+
+    Algoritmas:
+    1. Suranda sutartį, galiojusią tą mėnesį (contract_start ≤ mėnuo ≤ contract_end).
+    2. Suranda visus EmployeeCountLog įrašus tame mėnesyje.
+    3. Išrenka didžiausią active_count (Max Count).
+    4. Jei mėnesiui įrašų nėra – paimamas paskutinis žinomas skaičius.
+    5. suma = max(max_count * price_per_employee, minimum_fee)
+
+    Grąžina dict su visais skaičiavimo detaliais (žr. calculate_monthly_bills).
+    """
+    return calculate_monthly_bills([company_id], [(year, month)])[(company_id, year, month)]
+
+
+def _invoice_bill(invoice) -> dict:
+    """Uždaryto mėnesio sąskaita tokiu pačiu formatu kaip calculate_monthly_bill."""
+    return {
+        'company': invoice.company,
+        'has_settings': True,
+        'settings': invoice.contract,
+        'year': invoice.year,
+        'month': invoice.month,
+        'month_label': date(invoice.year, invoice.month, 1).strftime('%Y %B'),
+        'max_count': invoice.max_count,
+        'data_source': invoice.data_source,
+        'price_per_employee': invoice.price_per_employee,
+        'raw_amount': invoice.raw_amount,
+        'minimum_fee': invoice.minimum_fee,
+        'final_amount': invoice.final_amount,
+        'minimum_applied': invoice.final_amount > invoice.raw_amount,
+        'contract_start': invoice.contract_start,
+        'contract_end': invoice.contract_end,
+        'logs_count': invoice.logs_count,
+        'frozen': True,
+        'closed_at': invoice.closed_at,
+    }
+
+
+def get_monthly_bills(company_ids, months) -> dict:
+    """
+    Sąskaitos rodymui: praeities mėnesiai skaitomi iš MonthlyInvoice (viena užklausa),
+    o einamasis, būsimi ir dar neuždaryti mėnesiai skaičiuojami gyvai (calculate_monthly_bills).
+    Grąžina {(company_id, metai, mėnuo): sąskaita}.
+    """
+    from .models import MonthlyInvoice
+
+    company_ids = list(dict.fromkeys(company_ids))
+    months = sorted(set(months))
+    today = timezone.localdate()
+    current = (today.year, today.month)
+    past = [(year, month) for year, month in months if (year, month) < current]
+
+    bills = {}
+    if past and company_ids:
+        invoices = MonthlyInvoice.objects.filter(
+            company_id__in=company_ids,
+            year__gte=past[0][0], year__lte=past[-1][0],
+        ).select_related('company', 'contract')
+        for invoice in invoices:
+            key = (invoice.company_id, invoice.year, invoice.month)
+            if (invoice.year, invoice.month) in past:
+                bills[key] = _invoice_bill(invoice)
+
+    live_companies = {
+        company_id for company_id in company_ids
+        for year, month in months if (company_id, year, month) not in bills
+    }
+    live_months = {
+        (year, month) for year, month in months
+        for company_id in company_ids if (company_id, year, month) not in bills
     }
+    if live_companies:
+        live = calculate_monthly_bills(live_companies, live_months)
+        for key, bill in live.items():
+            bills.setdefault(key, bill)
+    return bills
+
+
+def close_month(year: int, month: int, company_ids=None, overwrite: bool = False) -> int:
+    """
+    Uždaro mėnesį: įrašo MonthlyInvoice kiekvienai įmonei, kuri tą mėnesį turėjo sutartį.
+    Jau uždarytos sąskaitos neperrašomos, nebent overwrite=True. Grąžina įrašytų sąskaitų skaičių.
+    """
+    from django.db import transaction
+    from .models import Company, MonthlyInvoice
+
+    if company_ids is None:
+        company_ids = list(Company.objects.values_list('id', flat=True))
+    if not overwrite:
+        closed = set(
+            MonthlyInvoice.objects.filter(company_id__in=company_ids, year=year, month=month)
+            .values_list('company_id', flat=True)
+        )
+        company_ids = [company_id for company_id in company_ids if company_id not in closed]
+    if not company_ids:
+        return 0
+
+    bills = calculate_monthly_bills(company_ids, [(year, month)])
+    invoices = [
+        MonthlyInvoice(
+            company=bill['company'],
+            contract=bill['settings'],
+            year=year,
+            month=month,
+            max_count=bill['max_count'],
+            data_source=bill['data_source'],
+            logs_count=bill['logs_count'],
+            price_per_employee=bill['price_per_employee'],
+            minimum_fee=bill['minimum_fee'],
+            raw_amount=bill['raw_amount'],
+            final_amount=bill['final_amount'],
+            contract_start=bill['contract_start'],
+            contract_end=bill['contract_end'],
+        )
+        for bill in bills.values() if bill.get('has_settings')
+    ]
+    with transaction.atomic():
+        MonthlyInvoice.objects.filter(
+            company_id__in=[invoice.company_id for invoice in invoices], year=year, month=month,
+        ).delete()
+        MonthlyInvoice.objects.bulk_create(invoices)
+    return len(invoices)
+
+
+def close_month_task():
+    """
+    Suplanuota (django-q Schedule) mėnesio uždarymo užduotis: kiekvieno mėnesio pradžioje
+    užfiksuoja praėjusio mėnesio sąskaitas. Grąžina įrašytų sąskaitų skaičių.
+    """
+    import logging
+
+    today = timezone.localdate()
+    year, month = (today.year - 1, 12) if today.month == 1 else (today.year, today.month - 1)
+    closed = close_month(year, month)
+    logging.getLogger(__name__).info(f"Billing month {year}-{month:02d} closed: {closed} invoices")
+    return closed
@@ -0,0 +1,139 @@
+"""
+Aktyvių darbuotojų skaičiaus (EmployeeCountLog) fiksavimas su sujungimu.
+
+Signalai tik pažymi įmonę kaip pakeistą, kai iš tikrųjų pasikeičia darbuotojų
+sudėtis (profilio įmonė, vartotojo aktyvumas, profilio ištrynimas) – paprastas
+profilio išsaugojimas (pvz. prisijungimas) nieko nedaro. Pažymėtos įmonės
+perskaičiuojamos vieną kartą:
+  * užklausos pabaigoje (feedbackas.middleware.CoalesceEmployeeCountsMiddleware),
+  * coalesce_employee_counts() bloko pabaigoje (importai, komandos),
+  * kitu atveju – po transakcijos patvirtinimo (transaction.on_commit).
+
+Vienas įrašas per dieną kiekvienai įmonei; jame saugomas didžiausias tos dienos
+skaičius, kurio mėnesio maksimumą naudoja calculate_monthly_bill.
+
+Pats skaičius saugomas Company.active_employee_count ir keičiamas atomiškai (F())
+tais pačiais signalais; sutikrinti su profiliais: manage.py repair_employee_counts
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+_state = threading.local()
+
+
+def _pending():
+    if not hasattr(_state, 'pending'):
+        _state.pending = set()
+        _state.depth = 0
+    return _state.pending
+
+
+def adjust_active_employee_count(company_id, delta):
+    """Atomiškai pakeičia įmonės aktyvių darbuotojų skaitiklį (ne mažiau nei 0)."""
+    from .models import Company
+
+    if company_id is None or not delta:
+        return
+    Company.objects.filter(pk=company_id).update(
+        active_employee_count=Greatest(F('active_employee_count') + delta, 0)
+    )
+
+
+def repair_active_employee_counts(company_ids=None):
+    """
+    Perskaičiuoja skaitiklius iš profilių ir pataiso nesutampančius.
+    Grąžina {įmonės id: (buvęs, teisingas)} pataisytoms įmonėms.
+    """
+    from .models import Company, Profile
+
+    companies = Company.objects.all()
+    if company_ids is not None:
+        companies = companies.filter(id__in=company_ids)
+    stored = dict(companies.values_list('id', 'active_employee_count'))
+    actual = dict(
+        Profile.objects.filter(company_link_id__in=list(stored), user__is_active=True)
+        .values('company_link_id').annotate(count=Count('id'))
+        .values_list('company_link_id', 'count').order_by()
+    )
+    repaired = {}
+    for company_id, count in stored.items():
+        if actual.get(company_id, 0) != count:
+            repaired[company_id] = (count, actual.get(company_id, 0))
+            Company.objects.filter(pk=company_id).update(active_employee_count=actual.get(company_id, 0))
+    return repaired
+
+
+def mark_company_dirty(company_id):
+    """Pažymi, kad įmonės aktyvių darbuotojų skaičių reikia perskaičiuoti."""
+    if company_id is None:
+        return
+    _pending().add(company_id)
+    if not _state.depth:
+        transaction.on_commit(flush_employee_counts)
+
+
+def flush_employee_counts():
+    """Perskaičiuoja visas pažymėtas įmones (jei jų yra) ir išvalo sąrašą."""
+    pending = _pending()
+    if not pending:
+        return 0
+    company_ids = list(pending)
+    pending.clear()
+    return refresh_employee_counts(company_ids)
+
+
+@contextmanager
+def coalesce_employee_counts():
+    """Bloko viduje pažymėtos įmonės perskaičiuojamos vieną kartą bloko pabaigoje."""
+    _pending()
+    _state.depth += 1
+    try:
+        yield
+    finally:
+        _state.depth -= 1
+        if not _state.depth:
+            transaction.on_commit(flush_employee_counts)
+
+
+def refresh_employee_counts(company_ids):
+    """
+    Nuskaito nurodytų įmonių aktyvių darbuotojų skaitiklius viena užklausa ir
+    atnaujina šiandienos EmployeeCountLog įrašus (paliekamas didesnis dienos skaičius).
+    Grąžina atnaujintų įmonių skaičių.
+    """
+    from .models import Company, EmployeeCountLog
+
+    # Ištrintos įmonės (galėjo būti ištrintos, kol laukė perskaičiavimo) nepatenka
+    counts = dict(
+        Company.objects.filter(id__in=list(company_ids)).values_list('id', 'active_employee_count')
+    )
+    company_ids = list(counts)
+    if not company_ids:
+        return 0
+    now = timezone.now()
+    today = timezone.localdate(now)
+
+    with transaction.atomic():
+        existing = {
+            log.company_id: log
+            for log in EmployeeCountLog.objects.select_for_update().filter(
+                company_id__in=company_ids, recorded_at__date=today,
+            )
+        }
+        new_logs = []
+        for company_id in company_ids:
+            active_count = counts.get(company_id, 0)
+            log = existing.get(company_id)
+            if log is None:
+                new_logs.append(EmployeeCountLog(company_id=company_id, active_count=active_count, recorded_at=now))
+            elif active_count > log.active_count:
+                log.active_count = active_count
+                log.recorded_at = now
+                log.save(update_fields=['active_count', 'recorded_at'])
+        EmployeeCountLog.objects.bulk_create(new_logs)
+    return len(company_ids)
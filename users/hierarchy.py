@@ -0,0 +1,127 @@
+"""
+Padalinių hierarchijos (DepartmentClosure) palaikymas ir užklausos.
+
+Uždarinys atnaujinamas sukuriant ar perkeliant padalinį (žr. users.signals),
+o ištrinant padalinį jo eilutės pašalinamos per CASCADE. Ciklas (padalinys po savo
+sub-padaliniu) atmetamas prieš įrašymą: Department.clean() ir pre_save signalas.
+"""
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Department, DepartmentClosure
+
+CYCLE_ERROR = "Padalinio negalima perkelti po jo paties sub-padaliniu."
+
+
+def creates_cycle(department):
+    """Ar department.parent_id yra pats padalinys arba vienas iš jo sub-padalinių."""
+    if not department.pk or not department.parent_id:
+        return False
+    return department.parent_id == department.pk or DepartmentClosure.objects.filter(
+        ancestor_id=department.pk, descendant_id=department.parent_id
+    ).exists()
+
+
+def insert_department(department):
+    """Įrašo naujo padalinio eilutes: jis pats (depth=0) ir visi tėvo protėviai."""
+    links = [DepartmentClosure(ancestor_id=department.id, descendant_id=department.id, depth=0)]
+    if department.parent_id:
+        links += [
+            DepartmentClosure(ancestor_id=ancestor_id, descendant_id=department.id, depth=depth + 1)
+            for ancestor_id, depth in DepartmentClosure.objects.filter(
+                descendant_id=department.parent_id
+            ).values_list('ancestor_id', 'depth')
+        ]
+    DepartmentClosure.objects.bulk_create(links, ignore_conflicts=True)
+
+
+def move_department(department):
+    """
+    Perkelia padalinį su visu jo pomedžiu po naujo tėvo (department.parent_id).
+    Pašalinami ryšiai su senais protėviais ir sukuriami ryšiai su naujais.
+    """
+    subtree = list(
+        DepartmentClosure.objects.filter(ancestor_id=department.id).values_list('descendant_id', 'depth')
+    )
+    subtree_ids = [descendant_id for descendant_id, _ in subtree]
+    if department.parent_id in subtree_ids:
+        raise ValueError(CYCLE_ERROR)
+
+    with transaction.atomic():
+        DepartmentClosure.objects.filter(descendant_id__in=subtree_ids).exclude(
+            ancestor_id__in=subtree_ids
+        ).delete()
+        if department.parent_id:
+            new_ancestors = DepartmentClosure.objects.filter(
+                descendant_id=department.parent_id
+            ).values_list('ancestor_id', 'depth')
+            DepartmentClosure.objects.bulk_create([
+                DepartmentClosure(
+                    ancestor_id=ancestor_id,
+                    descendant_id=descendant_id,
+                    depth=ancestor_depth + descendant_depth + 1,
+                )
+                for ancestor_id, ancestor_depth in new_ancestors
+                for descendant_id, descendant_depth in subtree
+            ])
+
+
+def rebuild_department_closure(company=None):
+    """
+    Perskaičiuoja uždarinį iš Department.parent ryšių (visoms arba vienos įmonės).
+    Grąžina sukurtų eilučių skaičių.
+    """
+    departments = Department.objects.all()
+    if company is not None:
+        departments = departments.filter(company=company)
+    parents = dict(departments.values_list('id', 'parent_id'))
+
+    links = []
+    for department_id in parents:
+        ancestor_id, depth, seen = department_id, 0, set()
+        while ancestor_id is not None and ancestor_id not in seen:
+            links.append(DepartmentClosure(ancestor_id=ancestor_id, descendant_id=department_id, depth=depth))
+            seen.add(ancestor_id)
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+
+    with transaction.atomic():
+        DepartmentClosure.objects.filter(descendant_id__in=parents).delete()
+        DepartmentClosure.objects.bulk_create(links, batch_size=1000)
+    return len(links)
+
+
+def is_under(department, ancestor_ids):
+    """Ar padalinys yra vienas iš ancestor_ids arba bet kuriame jų pomedyje."""
+    return DepartmentClosure.objects.filter(descendant=department, ancestor_id__in=ancestor_ids).exists()
+
+
+def subtree_departments(departments, include_self=True):
+    """Visi nurodytų padalinių pomedžių padaliniai (bet kokiame gylyje)."""
+    subtree = Department.objects.filter(ancestor_links__ancestor__in=departments)
+    if not include_self:
+        subtree = subtree.filter(ancestor_links__depth__gt=0)
+    return subtree.distinct()
+
+
+def department_tree(company):
+    """
+    Visas įmonės padalinių medis viena užklausa: grąžina šakninius padalinius,
+    kurių .children (ir toliau rekursiškai) užpildyti atmintyje, o .member_count – anotuotas.
+    """
+    departments = list(
+        Department.objects.filter(company=company)
+        .select_related('company', 'manager')
+        .annotate(member_count=Count('members'))
+        .order_by('name')
+    )
+    by_id = {department.id: department for department in departments}
+    roots = []
+    for department in departments:
+        department.children = []
+    for department in departments:
+        parent = by_id.get(department.parent_id)
+        if parent is None:
+            roots.append(department)
+        else:
+            parent.children.append(department)
+    return roots
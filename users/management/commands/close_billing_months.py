@@ -0,0 +1,43 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from users.billing_service import close_month
+from users.models import ContractSettings
+
+
+class Command(BaseCommand):
+    help = (
+        'Uždaro praėjusius mėnesius: įrašo fiksuotas MonthlyInvoice sąskaitas '
+        '(pagal nutylėjimą nuo anksčiausios sutarties pradžios iki praėjusio mėnesio).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Pirmas uždaromas mėnuo YYYY-MM.')
+        parser.add_argument('--company', type=int, help='Uždaryti tik nurodytos įmonės ID.')
+        parser.add_argument('--overwrite', action='store_true', help='Perrašyti jau uždarytas sąskaitas.')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        current = datetime.date(today.year, today.month, 1)
+
+        if options['since']:
+            try:
+                first = datetime.datetime.strptime(options['since'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('Neteisingas mėnuo, naudokite formatą YYYY-MM.')
+        else:
+            earliest = ContractSettings.objects.order_by('contract_start').values_list('contract_start', flat=True).first()
+            if earliest is None:
+                self.stdout.write('Sutarčių nėra – nėra ką uždaryti.')
+                return
+            first = earliest.replace(day=1)
+
+        company_ids = [options['company']] if options['company'] else None
+        closed = 0
+        month = first
+        while month < current:
+            closed += close_month(month.year, month.month, company_ids=company_ids, overwrite=options['overwrite'])
+            month = datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        self.stdout.write(self.style.SUCCESS(f'Įrašyta sąskaitų: {closed}'))
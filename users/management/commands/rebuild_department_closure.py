@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from users.hierarchy import rebuild_department_closure
+from users.models import Company
+
+
+class Command(BaseCommand):
+    help = 'Perskaičiuoja padalinių hierarchijos uždarinį (DepartmentClosure) iš Department.parent ryšių.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Perskaičiuoti tik nurodytos įmonės ID.')
+
+    def handle(self, *args, **options):
+        company = None
+        if options['company']:
+            company = Company.objects.get(pk=options['company'])
+        links = rebuild_department_closure(company=company)
+        self.stdout.write(self.style.SUCCESS(f'Sukurta uždarinio eilučių: {links}'))
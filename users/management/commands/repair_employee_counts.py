@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from users.employee_counts import repair_active_employee_counts
+
+
+class Command(BaseCommand):
+    help = 'Sutikrina Company.active_employee_count su profiliais ir pataiso nesutampančius skaitiklius.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Tikrinti tik nurodytos įmonės ID.')
+
+    def handle(self, *args, **options):
+        company_ids = [options['company']] if options['company'] else None
+        repaired = repair_active_employee_counts(company_ids)
+        for company_id, (stored, actual) in sorted(repaired.items()):
+            self.stdout.write(f'Įmonė {company_id}: {stored} → {actual}')
+        self.stdout.write(self.style.SUCCESS(f'Pataisyta skaitiklių: {len(repaired)}'))
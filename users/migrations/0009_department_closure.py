@@ -0,0 +1,44 @@
+# Generated by Django 4.2.2 on 2026-10-18 12:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_closure(apps, schema_editor):
+    """Užpildo uždarinį iš jau esamų padalinių tėvų ryšių."""
+    Department = apps.get_model('users', 'Department')
+    DepartmentClosure = apps.get_model('users', 'DepartmentClosure')
+
+    parents = dict(Department.objects.values_list('id', 'parent_id'))
+    links = []
+    for department_id in parents:
+        ancestor_id, depth, seen = department_id, 0, set()
+        while ancestor_id is not None and ancestor_id not in seen:
+            links.append(DepartmentClosure(ancestor_id=ancestor_id, descendant_id=department_id, depth=depth))
+            seen.add(ancestor_id)
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+    DepartmentClosure.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_company_email_domain'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepartmentClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='users.department')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='users.department')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='users_depar_descend_eb73d1_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:07
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def create_close_schedule(apps, schema_editor):
+    """Kiekvieno mėnesio 1 d. 02:00 uždaro praėjusį mėnesį."""
+    import datetime
+    from django.utils import timezone
+
+    Schedule = apps.get_model('django_q', 'Schedule')
+    today = timezone.localdate()
+    first_of_next = datetime.date(today.year + today.month // 12, today.month % 12 + 1, 1)
+    Schedule.objects.update_or_create(
+        func='users.billing_service.close_month_task',
+        defaults={
+            'name': 'Mėnesio sąskaitų uždarymas',
+            'schedule_type': 'M',
+            'repeats': -1,
+            'next_run': timezone.make_aware(datetime.datetime.combine(first_of_next, datetime.time(2, 0))),
+        },
+    )
+
+
+def delete_close_schedule(apps, schema_editor):
+    Schedule = apps.get_model('django_q', 'Schedule')
+    Schedule.objects.filter(func='users.billing_service.close_month_task').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_department_closure'),
+        ('django_q', '0014_schedule_cluster'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyInvoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('max_count', models.PositiveIntegerField()),
+                ('data_source', models.CharField(blank=True, default='', max_length=255)),
+                ('logs_count', models.PositiveIntegerField(default=0)),
+                ('price_per_employee', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('minimum_fee', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=8)),
+                ('raw_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('final_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('contract_start', models.DateField()),
+                ('contract_end', models.DateField(blank=True, null=True)),
+                ('closed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_invoices', to='users.company')),
+                ('contract', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='monthly_invoices', to='users.contractsettings')),
+            ],
+            options={
+                'verbose_name': 'Mėnesio sąskaita',
+                'verbose_name_plural': 'Mėnesio sąskaitos',
+                'ordering': ['-year', '-month'],
+                'unique_together': {('company', 'year', 'month')},
+            },
+        ),
+        migrations.RunPython(create_close_schedule, delete_close_schedule),
+    ]
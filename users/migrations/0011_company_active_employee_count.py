@@ -0,0 +1,33 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:12
+
+from django.db import migrations, models
+
+
+def count_active_employees(apps, schema_editor):
+    """Užpildo skaitiklį iš esamų profilių."""
+    from django.db.models import Count
+
+    Company = apps.get_model('users', 'Company')
+    Profile = apps.get_model('users', 'Profile')
+    counts = (
+        Profile.objects.filter(company_link__isnull=False, user__is_active=True)
+        .values('company_link_id').annotate(count=Count('id')).values_list('company_link_id', 'count').order_by()
+    )
+    for company_id, count in counts:
+        Company.objects.filter(pk=company_id).update(active_employee_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_monthly_invoice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='active_employee_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Aktyvių darbuotojų skaičius. Palaikomas signalais (users.employee_counts), sutikrinti: manage.py repair_employee_counts'),
+        ),
+        migrations.RunPython(count_active_employees, migrations.RunPython.noop),
+    ]
@@ -11,25 +11,31 @@ class Company(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+    active_employee_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text="Aktyvių darbuotojų skaičius. Palaikomas signalais (users.employee_counts), "
+                  "sutikrinti: manage.py repair_employee_counts"
+    )
 
     def __str__(self):
         return self.name
 
-    def get_current_month_ai_queries_count(self):
+    def _current_month_ai_usage(self):
         from django.utils import timezone
-        now = timezone.now()
-        return self.ai_usage_logs.filter(timestamp__year=now.year, timestamp__month=now.month).count()
+        return self.ai_usage_daily.filter(date__gte=timezone.localdate().replace(day=1))
+
+    def get_current_month_ai_queries_count(self):
+        from django.db.models import Sum
+        return self._current_month_ai_usage().aggregate(Sum('calls'))['calls__sum'] or 0
 
     def get_current_month_ai_cost(self):
-        from django.utils import timezone
         from django.db.models import Sum
-        now = timezone.now()
-        total = self.ai_usage_logs.filter(timestamp__year=now.year, timestamp__month=now.month).aggregate(Sum('total_cost'))['total_cost__sum']
+        total = self._current_month_ai_usage().aggregate(Sum('total_cost'))['total_cost__sum']
         return total or 0.0
 
     def get_top_ai_users(self, limit=3):
-        from django.db.models import Count
-        return self.ai_usage_logs.values('user__first_name', 'user__last_name', 'user__username').annotate(query_count=Count('id')).order_by('-query_count')[:limit]
+        from django.db.models import Sum
+        return self.ai_usage_daily.values('user__first_name', 'user__last_name', 'user__username').annotate(query_count=Sum('calls')).order_by('-query_count')[:limit]
 
 class Department(models.Model):
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='departments')
@@ -37,9 +43,33 @@ class Department(models.Model):
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='sub_departments')
     manager = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='managed_departments')
 
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        from .hierarchy import CYCLE_ERROR, creates_cycle
+        if creates_cycle(self):
+            raise ValidationError({'parent': CYCLE_ERROR})
+
     def __str__(self):
         return f"{self.name} ({self.company.name})"
 
+class DepartmentClosure(models.Model):
+    """
+    Padalinių medžio uždarinys: kiekviena (protėvis, palikuonis) pora su atstumu tarp jų.
+    Kiekvienas padalinys yra ir pats sau protėvis (depth=0), todėl „ar X yra po Y“
+    ir „visas Y pomedis“ yra viena indeksuota užklausa bet kokiame gylyje.
+    Palaikoma signalais (users.hierarchy), perskaičiuoti: manage.py rebuild_department_closure
+    """
+    ancestor = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('ancestor', 'descendant')
+        indexes = [models.Index(fields=['descendant', 'depth'])]
+
+    def __str__(self):
+        return f"{self.ancestor_id} → {self.descendant_id} ({self.depth})"
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     image = models.ImageField(default='default.jpg', upload_to='profile_pics')
@@ -120,4 +150,37 @@ class EmployeeCountLog(models.Model):
     class Meta:
         ordering = ['-recorded_at']
         verbose_name = "Darbuotojų skaičiaus įrašas"
-        verbose_name_plural = "Darbuotojų skaičiaus įrašai"
\ No newline at end of file
+        verbose_name_plural = "Darbuotojų skaičiaus įrašai"
+
+class MonthlyInvoice(models.Model):
+    """
+    Uždaryto mėnesio sąskaita – fiksuota calculate_monthly_bill rezultato kopija.
+    Sukuriama mėnesio uždarymo užduotimi (users.billing_service.close_month_task),
+    todėl vėlesni logų ar sutarčių pakeitimai praeities sumų nebekeičia.
+    Užpildyti istoriją: manage.py close_billing_months
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='monthly_invoices')
+    contract = models.ForeignKey(
+        ContractSettings, on_delete=models.SET_NULL, null=True, blank=True, related_name='monthly_invoices'
+    )
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    max_count = models.PositiveIntegerField()
+    data_source = models.CharField(max_length=255, blank=True, default='')
+    logs_count = models.PositiveIntegerField(default=0)
+    price_per_employee = models.DecimalField(max_digits=8, decimal_places=2)
+    minimum_fee = models.DecimalField(max_digits=8, decimal_places=2, default=Decimal('0.00'))
+    raw_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    final_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    contract_start = models.DateField()
+    contract_end = models.DateField(null=True, blank=True)
+    closed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.company.name} {self.year}-{self.month:02d}: {self.final_amount} €"
+
+    class Meta:
+        unique_together = ('company', 'year', 'month')
+        ordering = ['-year', '-month']
+        verbose_name = "Mėnesio sąskaita"
+        verbose_name_plural = "Mėnesio sąskaitos"
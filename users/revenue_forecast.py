@@ -0,0 +1,190 @@
+"""
+Vektorizuota pajamų prognozė billing grafikui.
+
+Visų įmonių mėnesinė darbuotojų skaičiaus istorija (Max active_count per mėnesį iš
+EmployeeCountLog) užkraunama keliomis grupuotomis užklausomis į NumPy matricą
+[įmonės × mėnesiai]. Ateities darbuotojų skaičius prognozuojamas iškart visoms
+įmonėms (tiesinė regresija arba sezoninis naivusis modelis), o sąskaitų sumos
+skaičiuojamos elementais: max(darbuotojai × kaina, minimalus mokestis), kai tą
+mėnesį galioja sutartis.
+"""
+from datetime import date
+
+import numpy as np
+from django.db.models import DateField, Max, OuterRef, Q, Subquery
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Company, ContractSettings, EmployeeCountLog
+
+FORECAST_METHODS = ('linear', 'seasonal')
+SEASON_LENGTH = 12
+
+
+def shift_month(year, month, offset):
+    """(metai, mėnuo), pasislinkus `offset` mėnesių (gali būti neigiamas)."""
+    index = year * 12 + month - 1 + offset
+    return index // 12, index % 12 + 1
+
+
+def _forward_fill(matrix):
+    """Užpildo NaN paskutine žinoma reikšme kiekvienoje eilutėje (pradžios tarpai lieka NaN)."""
+    columns = np.arange(matrix.shape[1])
+    last_known = np.where(np.isnan(matrix), 0, columns)
+    np.maximum.accumulate(last_known, axis=1, out=last_known)
+    filled = matrix[np.arange(matrix.shape[0])[:, None], last_known]
+    return filled
+
+
+def load_headcount_history(company_ids, months):
+    """
+    Mėnesinė darbuotojų skaičiaus matrica [įmonės × months] (float).
+    Mėnuo be logų perima paskutinę žinomą reikšmę (taip pat ir iš laikotarpio pradžios),
+    įmonės visai be logų – dabartinį aktyvių darbuotojų skaičių.
+    """
+    company_ids = list(company_ids)
+    history = np.full((len(company_ids), len(months)), np.nan)
+    if not company_ids or not months:
+        return history
+
+    rows = {company_id: index for index, company_id in enumerate(company_ids)}
+    columns = {date(year, month, 1): index for index, (year, month) in enumerate(months)}
+    range_start = date(*months[0], 1)
+    range_end = date(*shift_month(*months[-1], 1), 1)
+
+    for company_id, month, max_count in (
+        EmployeeCountLog.objects
+        .filter(company_id__in=company_ids, recorded_at__date__gte=range_start, recorded_at__date__lt=range_end)
+        .annotate(month=TruncMonth('recorded_at', output_field=DateField()))
+        .values('company_id', 'month')
+        .annotate(max_count=Max('active_count'))
+        .values_list('company_id', 'month', 'max_count')
+        .order_by()
+    ):
+        history[rows[company_id], columns[month]] = max_count
+
+    # Paskutinis žinomas skaičius prieš laikotarpį – pradžios taškas; kartu ir dabartinis skaitiklis
+    current = {}
+    first_column = history[:, 0]
+    for company_id, last_count, active_employee_count in Company.objects.filter(pk__in=company_ids).annotate(
+        last_count=Subquery(
+            EmployeeCountLog.objects.filter(company=OuterRef('pk'), recorded_at__date__lt=range_start)
+            .order_by('-recorded_at').values('active_count')[:1]
+        )
+    ).values_list('id', 'last_count', 'active_employee_count'):
+        current[company_id] = active_employee_count
+        if last_count is not None and np.isnan(first_column[rows[company_id]]):
+            first_column[rows[company_id]] = last_count
+    history = _forward_fill(history)
+
+    # Įmonės be jokių logų – dabartinis aktyvių skaičius visam laikotarpiui
+    for company_id in company_ids:
+        if np.isnan(history[rows[company_id]]).all():
+            history[rows[company_id]] = current.get(company_id, 0)
+
+    # Likę pradžios tarpai (įmonė pradėjo logintis vėliau) – pirma žinoma reikšmė
+    first_known = np.argmax(~np.isnan(history), axis=1)
+    leading = np.isnan(history)
+    history[leading] = history[np.arange(history.shape[0]), first_known][np.nonzero(leading)[0]]
+    return history
+
+
+def linear_forecast(history, horizon):
+    """
+    Tiesinė regresija (mažiausių kvadratų) kiekvienai eilutei atskirai, vektoriškai.
+    history – [eilutės × T], grąžina [eilutės × horizon], neneigiamas reikšmes.
+    """
+    rows, length = history.shape
+    if length == 0:
+        return np.zeros((rows, horizon))
+    t = np.arange(length, dtype=np.float64)
+    t_mean = t.mean()
+    y_mean = history.mean(axis=1, keepdims=True)
+    t_var = ((t - t_mean) ** 2).sum()
+    slope = ((t - t_mean) * (history - y_mean)).sum(axis=1, keepdims=True) / t_var if t_var else np.zeros((rows, 1))
+    future_t = np.arange(length, length + horizon, dtype=np.float64)
+    return np.clip(y_mean + slope * (future_t - t_mean), 0, None)
+
+
+def seasonal_naive_forecast(history, horizon, season=SEASON_LENGTH):
+    """
+    Sezoninis naivusis modelis: prognozė = reikšmė prieš vieną sezoną (12 mėn.).
+    Jei istorija trumpesnė nei sezonas – kartojama paskutinė reikšmė.
+    """
+    rows, length = history.shape
+    if length == 0:
+        return np.zeros((rows, horizon))
+    if length < season:
+        return np.repeat(history[:, -1:], horizon, axis=1)
+    steps = np.arange(horizon)
+    return history[:, length - season + steps % season]
+
+
+def contract_pricing(company_ids, months):
+    """
+    Kainos, minimalaus mokesčio ir sutarties galiojimo matricos [įmonės × months].
+    Kai mėnesį galioja kelios sutartys, naudojama vėliausiai prasidėjusi (kaip calculate_monthly_bill).
+    """
+    company_ids = list(company_ids)
+    shape = (len(company_ids), len(months))
+    price = np.zeros(shape)
+    minimum_fee = np.zeros(shape)
+    has_contract = np.zeros(shape, dtype=bool)
+    if not company_ids or not months:
+        return price, minimum_fee, has_contract
+
+    rows = {company_id: index for index, company_id in enumerate(company_ids)}
+    month_starts = np.array([date(year, month, 1) for year, month in months], dtype='datetime64[D]')
+    month_ends = np.array([date(*shift_month(year, month, 1), 1) for year, month in months], dtype='datetime64[D]')
+    range_start, range_end = month_starts[0].item(), month_ends[-1].item()
+
+    for contract in (
+        ContractSettings.objects
+        .filter(company_id__in=company_ids, contract_start__lt=range_end)
+        .filter(Q(contract_end__isnull=True) | Q(contract_end__gte=range_start))
+        .order_by('contract_start')
+    ):
+        active = month_ends > np.datetime64(contract.contract_start)
+        if contract.contract_end is not None:
+            active &= month_starts <= np.datetime64(contract.contract_end)
+        row = rows[contract.company_id]
+        price[row, active] = float(contract.price_per_employee)
+        minimum_fee[row, active] = float(contract.minimum_fee)
+        has_contract[row, active] = True
+    return price, minimum_fee, has_contract
+
+
+def apply_contract_pricing(headcount, price, minimum_fee, has_contract):
+    """Sąskaitų sumos elementais: max(darbuotojai × kaina, min. mokestis), 0 – be sutarties."""
+    return np.where(has_contract, np.maximum(headcount * price, minimum_fee), 0.0)
+
+
+def forecast_revenue(company_ids, horizon, history_length=24, method='linear', today=None):
+    """
+    Prognozuoja `horizon` mėnesių po einamojo mėnesio visoms įmonėms iškart.
+
+    Grąžina {'months': [(metai, mėnuo)...], 'company_ids': [...],
+             'headcount': ndarray[įmonės × horizon], 'amount': ndarray[įmonės × horizon]}.
+    """
+    if method not in FORECAST_METHODS:
+        raise ValueError(f"Nežinomas prognozės metodas: {method}")
+    company_ids = list(company_ids)
+    today = today or timezone.localdate()
+    future_months = [shift_month(today.year, today.month, offset) for offset in range(1, horizon + 1)]
+    if not company_ids or horizon <= 0:
+        empty = np.zeros((len(company_ids), max(horizon, 0)))
+        return {'months': future_months, 'company_ids': company_ids, 'headcount': empty, 'amount': empty}
+
+    # Istorija baigiasi einamuoju mėnesiu (imtinai)
+    history_months = [
+        shift_month(today.year, today.month, offset) for offset in range(-history_length + 1, 1)
+    ]
+    history = load_headcount_history(company_ids, history_months)
+    if method == 'seasonal':
+        headcount = seasonal_naive_forecast(history, horizon)
+    else:
+        headcount = linear_forecast(history, horizon)
+    headcount = np.rint(headcount)
+
+    amount = apply_contract_pricing(headcount, *contract_pricing(company_ids, future_months))
+    return {'months': future_months, 'company_ids': company_ids, 'headcount': headcount, 'amount': amount}
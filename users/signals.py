@@ -1,7 +1,8 @@
-from django.db.models.signals import post_save
+from django.db.models import DEFERRED
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Profile
+from .models import Department, Profile
 
 
 @receiver(post_save, sender=User)
@@ -18,34 +19,124 @@ def save_profile(sender, instance, **kwargs):
         Profile.objects.create(user=instance)
 
 
+@receiver(post_init, sender=Profile)
+def remember_profile_company(sender, instance, **kwargs):
+    """
+    Įsimena pradinę įmonę (be papildomos užklausos), kad žinotume, ar ji pasikeitė.
+    Atidėtas laukas (only()/defer()) pažymimas DEFERRED – None reiškia „be įmonės“.
+    """
+    instance._initial_company_id = instance.__dict__.get('company_link_id', DEFERRED)
+
+
+@receiver(post_init, sender=User)
+def remember_user_active(sender, instance, **kwargs):
+    instance._initial_is_active = instance.__dict__.get('is_active', DEFERRED)
+
+
+def _load_deferred_initial(instance, field, attr):
+    """
+    Jei laukas buvo atidėtas, bet dabar nustatytas ir bus įrašytas, ankstesnė reikšmė
+    paimama iš DB (viena užklausa); neįkeltas laukas neįrašomas, tad nesikeičia.
+    """
+    if instance._state.adding or getattr(instance, attr, DEFERRED) is not DEFERRED:
+        return
+    if field in instance.__dict__:
+        setattr(instance, attr, type(instance).objects.filter(pk=instance.pk).values_list(field, flat=True).first())
+
+
+@receiver(pre_save, sender=Profile)
+def load_deferred_profile_company(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _load_deferred_initial(instance, 'company_link_id', '_initial_company_id')
+
+
+@receiver(pre_save, sender=User)
+def load_deferred_user_active(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _load_deferred_initial(instance, 'is_active', '_initial_is_active')
+
+
+def _user_is_active(profile):
+    """Profilio vartotojo aktyvumas: iš jau užkrauto vartotojo arba viena užklausa."""
+    if 'user' in profile._state.fields_cache:
+        return profile.user.is_active
+    return User.objects.filter(pk=profile.user_id, is_active=True).exists()
+
+
 @receiver(post_save, sender=Profile)
-def log_employee_count_on_profile_save(sender, instance, **kwargs):
-    """
-    Fiksuoja aktyvių darbuotojų skaičių kartą per dieną kiekvienai įmonei.
-    Jei šiandien jau yra įrašas – atnaujina jo skaičių.
-    Jei dar nėra – sukuria naują.
-    """
-    from django.utils import timezone
-    from .models import EmployeeCountLog
-
-    company = instance.company_link
-    if company is None:
-        return  # Profilis be įmonės – ignoruojame
-
-    today = timezone.now().date()
-
-    # Skaičiuojame visus aktyvius šios įmonės darbuotojus
-    active_count = Profile.objects.filter(
-        company_link=company,
-        user__is_active=True,
-    ).count()
-
-    # Vienas įrašas per dieną – atnaujina arba sukuria
-    EmployeeCountLog.objects.update_or_create(
-        company=company,
-        recorded_at__date=today,
-        defaults={
-            'active_count': active_count,
-            'recorded_at': timezone.now(),
-        },
-    )
+def log_employee_count_on_profile_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Kai darbuotojų sudėtis pasikeičia (naujas profilis arba pakeista įmonė), atnaujina
+    įmonių skaitiklius ir pažymi jas dienos įrašui (žr. users.employee_counts).
+    """
+    from .employee_counts import adjust_active_employee_count, mark_company_dirty
+
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_initial_company_id', DEFERRED)
+    if previous is DEFERRED:
+        return  # Įmonė nebuvo nei įkelta, nei pakeista
+    current = instance.company_link_id
+    if previous != current:
+        if _user_is_active(instance):
+            adjust_active_employee_count(previous, -1)
+            adjust_active_employee_count(current, 1)
+        mark_company_dirty(previous)
+        mark_company_dirty(current)
+    instance._initial_company_id = current
+
+
+@receiver(post_save, sender=User)
+def log_employee_count_on_user_activity(sender, instance, created, raw=False, **kwargs):
+    """Vartotojo aktyvumo pakeitimas keičia įmonės aktyvių darbuotojų skaičių."""
+    from .employee_counts import adjust_active_employee_count, mark_company_dirty
+
+    previous = getattr(instance, '_initial_is_active', DEFERRED)
+    if raw or created or previous is DEFERRED:
+        return  # Aktyvumas nebuvo nei įkeltas, nei pakeistas
+    instance._initial_is_active = instance.is_active
+    if previous == instance.is_active:
+        return
+    company_id = Profile.objects.filter(user=instance).values_list('company_link_id', flat=True).first()
+    adjust_active_employee_count(company_id, 1 if instance.is_active else -1)
+    mark_company_dirty(company_id)
+
+
+@receiver(post_delete, sender=Profile)
+def log_employee_count_on_profile_delete(sender, instance, **kwargs):
+    from .employee_counts import adjust_active_employee_count, mark_company_dirty
+
+    if instance.company_link_id and _user_is_active(instance):
+        adjust_active_employee_count(instance.company_link_id, -1)
+    mark_company_dirty(instance.company_link_id)
+
+
+@receiver(pre_save, sender=Department)
+def remember_department_parent(sender, instance, raw=False, **kwargs):
+    """
+    Įsimena ankstesnį tėvą, kad po išsaugojimo žinotume, ar padalinys perkeltas.
+    Perkėlimas po savo sub-padaliniu atmetamas dar prieš įrašymą (bet kokiu keliu: admin, shell).
+    """
+    from django.core.exceptions import ValidationError
+    from .hierarchy import CYCLE_ERROR, creates_cycle
+
+    instance._previous_parent_id = None
+    if instance.pk and not raw:
+        instance._previous_parent_id = (
+            Department.objects.filter(pk=instance.pk).values_list('parent_id', flat=True).first()
+        )
+        if instance.parent_id != instance._previous_parent_id and creates_cycle(instance):
+            raise ValidationError(CYCLE_ERROR)
+
+
+@receiver(post_save, sender=Department)
+def sync_department_closure(sender, instance, created, raw=False, **kwargs):
+    """Palaiko DepartmentClosure: naujas padalinys įterpiamas, perkeltas – perkeliamas su pomedžiu."""
+    from .hierarchy import insert_department, move_department
+
+    if raw:
+        return  # Fikstūrų įkėlimas – uždarinys perskaičiuojamas komanda
+    if created:
+        insert_department(instance)
+    elif instance.parent_id != getattr(instance, '_previous_parent_id', instance.parent_id):
+        move_department(instance)